@@ -0,0 +1,187 @@
+"""Automatic binning from the data, in the same pass as the filling (``--auto_binning``).
+
+A variable without an entry in variableSettingDictionary (or every variable, with "all") is
+filled into a fine histogram whose axis extends itself (TH1::kAllAxes): it starts as FINE_BINS
+bins on [0, 1) and doubles its range, merging neighbouring bins, whenever a value falls outside,
+so it always covers the whole distribution at 1/FINE_BINS of its range, whatever the units.
+These fine histograms are the quantile sketch. Once every file is filled, finalize() pools them
+per variable, cuts the range at the ``tail`` quantiles, splits it into equal-width bins (or
+equal-content ones with ``variable_width``) and rebins every fine histogram onto those edges, so
+no input is read twice. Integer-valued variables get one bin per value.
+"""
+import math
+
+import numpy as np
+import ROOT
+
+FINE_BINS = 4096
+
+## Variables filled into fine histograms in this process, and their edges once chosen
+_fine = set()
+_edges = {}
+
+
+def reset():
+    ## One process serves several norm.py runs (plot_daemon.py): forget the previous run's variables
+    _fine.clear()
+    _edges.clear()
+
+
+def enable(variables):
+    _fine.update(variables)
+
+
+def is_fine(variable):
+    return variable in _fine and variable not in _edges
+
+
+def edges(variable):
+    return _edges.get(variable)
+
+
+def set_edges(variable, bin_edges):
+    _edges[variable] = list(bin_edges)
+
+
+def _axis(h):
+    return h.GetNbinsX(), h.GetXaxis().GetXmin(), h.GetXaxis().GetXmax()
+
+
+def has_edges(h, bin_edges):
+    ## Enough to tell a fine histogram from a rebinned one
+    return _axis(h) == (len(bin_edges) - 1, bin_edges[0], bin_edges[-1])
+
+
+def axis_edges(h):
+    axis = h.GetXaxis()
+    return [axis.GetBinLowEdge(b) for b in range(1, h.GetNbinsX() + 2)]
+
+
+def fine_hist(name, title):
+    h = ROOT.TH1D(name, title, FINE_BINS, 0.0, 1.0)
+    h.SetCanExtend(ROOT.TH1.kAllAxes)
+    h.Sumw2()
+    h.SetDirectory(0)
+    return h
+
+
+def _array(view, size):
+    ## GetArray() is a view of unknown length on the C++ array
+    view.reshape((size,))
+    return np.array(view, dtype=np.float64, copy=True)
+
+
+def _bins(h):
+    """(low edges, up edges, contents, sumw2) of every bin of ``h``, under- and overflow excluded."""
+    n = h.GetNbinsX()
+    low, high = h.GetXaxis().GetXmin(), h.GetXaxis().GetXmax()
+    lows = low + (high - low) * np.arange(n) / n
+    contents = _array(h.GetArray(), n + 2)
+    sumw2 = _array(h.GetSumw2().GetArray(), n + 2) if h.GetSumw2N() else contents.copy()
+    return lows, lows + (high - low) / n, contents[1:-1], sumw2[1:-1]
+
+
+def merge(h, other):
+    """Add ``other`` to ``h``, fine histograms with different ranges go through a new one."""
+    if _axis(h) == _axis(other):
+        h.Add(other)
+        return h
+    merged = fine_hist(h.GetName(), h.GetTitle())
+    for source in (h, other):
+        for low, up, content, w2 in zip(*_bins(source)):
+            if content == 0 and w2 == 0:
+                continue
+            b = merged.FindBin(0.5 * (low + up))
+            merged.SetBinContent(b, merged.GetBinContent(b) + content)
+            merged.SetBinError(b, math.hypot(merged.GetBinError(b), math.sqrt(w2)))
+    merged.SetEntries(h.GetEntries() + other.GetEntries())
+    return merged
+
+
+def _nice(step):
+    ## 1, 2, 2.5 or 5 times a power of ten, at least ``step``
+    power = 10 ** math.floor(math.log10(step))
+    for factor in (1, 2, 2.5, 5, 10):
+        if factor * power >= step * (1 - 1e-9):
+            return factor * power
+
+
+def choose_edges(hists, nbins=20, variable_width=False, tail=0.005):
+    """Bin edges for the pooled distribution of the fine ``hists``, None if they are all empty."""
+    parts = [_bins(h) for h in hists]
+    if not parts:
+        return None
+    lows, ups, contents = (np.concatenate([part[i] for part in parts]) for i in range(3))
+    keep = contents > 0
+    lows, ups, contents = lows[keep], ups[keep], contents[keep]
+    if not len(contents):
+        return None
+    order = np.argsort(lows)
+    lows, ups, contents = lows[order], ups[order], contents[order]
+    cumulative = np.cumsum(contents)
+
+    def quantile(q):
+        target = q * cumulative[-1]
+        i = min(int(np.searchsorted(cumulative, target)), len(contents) - 1)
+        before = cumulative[i] - contents[i]
+        return lows[i] + (ups[i] - lows[i]) * (target - before) / contents[i]
+
+    lo, hi = quantile(tail), quantile(1 - tail)
+    ## Every filled fine bin holds an integer and there are few of them: one bin per value
+    holds_integer = np.ceil(lows) < ups
+    if np.all(holds_integer) and np.all(ups - lows <= 1) and math.ceil(hi) - math.floor(lo) <= 100:
+        return [float(v) for v in range(math.floor(lo), math.floor(hi) + 2)]
+    if hi <= lo:
+        hi = lo + (ups[0] - lows[0])
+    if variable_width:
+        step = _nice((hi - lo) / (10 * nbins))
+        points = [round(quantile(tail + (1 - 2 * tail) * k / nbins) / step) * step for k in range(nbins + 1)]
+        return sorted(set(points)) if len(set(points)) > 1 else [lo, hi]
+    width = _nice((hi - lo) / nbins)
+    start = math.floor(lo / width) * width
+    count = max(math.ceil((hi - start) / width - 1e-9), 1)
+    return [start + width * k for k in range(count + 1)]
+
+
+def rebin(h, bin_edges):
+    """TH1F with ``bin_edges`` and the contents of the fine ``h``, by bin centre; outside goes to under/overflow."""
+    lows, ups, contents, sumw2 = _bins(h)
+    target = np.searchsorted(np.asarray(bin_edges), 0.5 * (lows + ups), side="right")
+    n = len(bin_edges) - 1
+    new_contents = np.bincount(target, weights=contents, minlength=n + 2)
+    new_sumw2 = np.bincount(target, weights=sumw2, minlength=n + 2)
+    out = ROOT.TH1F(h.GetName(), h.GetTitle(), n, np.asarray(bin_edges, dtype=np.float64))
+    out.Sumw2()
+    out.SetDirectory(0)
+    for b in range(n + 2):
+        out.SetBinContent(b, new_contents[b])
+        out.SetBinError(b, math.sqrt(new_sumw2[b]))
+    out.SetEntries(h.GetEntries())
+    return out
+
+
+def finalize(results, nbins=20, variable_width=False, tail=0.005):
+    """Choose the edges of the fine variables and rebin them in place.
+
+    ``results`` are fill_samples results ({sample: {key: [hists]}}); the edges are chosen from
+    the nominal histograms of all of them together. Returns {variable: edges}.
+    """
+    pooled = {}
+    for sample_hists in results:
+        for hists_by_key in sample_hists.values():
+            for key, hlist in hists_by_key.items():
+                if len(key) == 2 and is_fine(key[1]):
+                    pooled.setdefault(key[1], []).extend(hlist)
+    for variable in list(_fine):
+        if variable in _edges:
+            continue
+        chosen = choose_edges(pooled.get(variable, []), nbins, variable_width, tail)
+        ## Nothing selected anywhere: a single bin on the initial axis
+        set_edges(variable, chosen or [0.0, 1.0])
+        print(f"Automatic binning of {variable}: {len(_edges[variable]) - 1} bins, edges {_edges[variable]}")
+    for sample_hists in results:
+        for hists_by_key in sample_hists.values():
+            for key, hlist in hists_by_key.items():
+                if key[1] in _fine:
+                    hists_by_key[key] = [h if has_edges(h, _edges[key[1]]) else rebin(h, _edges[key[1]]) for h in hlist]
+    return {variable: _edges[variable] for variable in _fine}
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""Reproducible throughput benchmark of the plotting pipeline on synthetic NanoAOD-like inputs.
+
+Every file listed in samples.py and observed.py is generated under --work_dir with the branches
+the benchmarked variables, cuts and weight read: jagged collections with their counter branch
+(nFatJet, FatJet_pt, ...), jagged index branches (index_gFatJets, ...) and flat event branches.
+Each mode then runs norm.main in a fresh process, with the norm.py defaults for the jobs and
+entry ranges, and the report gives the wall time per stage of its --timing_report, events/s of
+the fill stages and the peak RSS of the run:
+
+    python3 benchmark.py --work_dir /tmp/fm_bench --events 5000 --engines draw rdf uproot
+    python3 benchmark.py --work_dir /tmp/fm_bench --cache_dir /tmp/fm_bench/cache --repeat 2
+
+Generating the inputs only needs uproot and NumPy; the runs need ROOT, as norm.py does.
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+MODES = ["dataMC", "signals_only", "SignalandBackground"]
+
+DEFAULT_VARIABLES = [
+    "FatJet_pt[index_gFatJets[0]]",
+    "PuppiMET_pt",
+    "Tau_pt[index_gTaus]",
+    "Electron_pt[index_gElectrons[0]]",
+    "HTTvis_deltaR",
+    "Hbb_met_phi",
+]
+DEFAULT_CUTS = "((Flag_JetVetoed==0) && (Flag_FatJetVetoed==0))"
+DEFAULT_CHANNELS = ["tt", "et", "mt"]
+
+
+def input_files(work_dir):
+    """{path: kind} of every synthetic input, laid out like samples.py and observed.py."""
+    from samples import Backgrounds, Signals
+    from observed import observed
+    files = {}
+    for sample_type in Backgrounds.values():
+        for proc_info in sample_type.values():
+            for path in proc_info["files"]:
+                files[os.path.join(work_dir, "mc", path)] = "background"
+    for info in Signals.values():
+        for path in info["files"]:
+            files[os.path.join(work_dir, "mc", path)] = "signal"
+    for info in observed.values():
+        for path in info["files"]:
+            files[os.path.join(work_dir, "data", os.path.basename(path))] = "data"
+    return files
+
+
+def branch_schema(exprs):
+    """Split the names referenced by ``exprs`` into jagged collections, index branches and flat branches.
+
+    Returns ({collection: {field: binning expression}}, {index branches}, {flat branch: binning expression}).
+    """
+    from expressions import parse
+
+    collections, indices, flat = {}, set(), {}
+
+    def walk(node, expr):
+        kind = node[0]
+        if kind == "index":
+            base, idx = node[1], node[2]
+            if base[0] == "name" and base[1].startswith("index_"):
+                indices.add(base[1])
+            elif base[0] == "name":
+                prefix, _, field = base[1].partition("_")
+                collections.setdefault(prefix, {})[field] = expr
+            else:
+                walk(base, expr)
+            if idx[0] == "name":
+                indices.add(idx[1])
+            else:
+                walk(idx, expr)
+        elif kind == "name":
+            flat.setdefault(node[1], expr)
+        elif kind == "call":
+            for arg in node[2]:
+                walk(arg, expr)
+        elif kind == "unop":
+            walk(node[2], expr)
+        elif kind == "binop":
+            walk(node[2], expr)
+            walk(node[3], expr)
+
+    for expr in exprs:
+        walk(parse(expr), expr)
+    for name in indices:
+        flat.pop(name, None)
+    return collections, indices, flat
+
+
+def _values(rng, name, expr, size, kind):
+    """Plausible values for one branch: integers for channel, flags and counts, else spread over the plot range."""
+    import numpy as np
+    from variable_dictionaries import variableSettingDictionary
+
+    if name == "channel":
+        return rng.integers(0, 3, size).astype(np.int32)
+    if name.startswith("Flag_"):
+        return (rng.random(size) < 0.05).astype(np.int32)
+    if name.startswith(("n", "PV_npvs")):
+        return rng.poisson(3 if name.startswith("n") else 30, size).astype(np.int32)
+    if name in ("xsWeight", "FinalWeighting") or "eight" in name:
+        ## Data events are unweighted, MC gets a per-sample scale with some spread
+        if kind == "data":
+            return np.ones(size, dtype=np.float32)
+        return (rng.uniform(0.1, 2.0) * rng.lognormal(0.0, 0.3, size)).astype(np.float32)
+    nbins, low, high = map(float, variableSettingDictionary.get(expr, "21,0,1000").split(","))
+    span = high - low
+    if low >= 0:
+        values = low + rng.exponential(span / 3, size)
+    else:
+        values = rng.uniform(low - 0.05 * span, high + 0.05 * span, size)
+    return values.astype(np.float32)
+
+
+def generate_file(path, schema, nevents, kind):
+    """Write one synthetic Events tree with ``nevents`` entries."""
+    import awkward as ak
+    import numpy as np
+    import uproot
+
+    collections, indices, flat = schema
+    seed = int(hashlib.sha1(os.path.basename(path).encode()).hexdigest()[:8], 16)
+    rng = np.random.default_rng(seed)
+
+    branches = {}
+    for name, expr in sorted(flat.items()):
+        branches[name] = _values(rng, name, expr, nevents, kind)
+    for prefix, fields in sorted(collections.items()):
+        counts = np.minimum(rng.poisson(2.5, nevents), 8)
+        total = int(counts.sum())
+        record = {field: ak.unflatten(_values(rng, f"{prefix}_{field}", expr, total, kind), counts)
+                  for field, expr in sorted(fields.items())}
+        branches[prefix] = ak.zip(record)
+    for name in sorted(indices):
+        counts = np.minimum(rng.poisson(1.2, nevents), 4)
+        branches[name] = ak.unflatten(rng.integers(0, 3, int(counts.sum())).astype(np.int32), counts)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with uproot.recreate(path + ".tmp") as f:
+        types = {name: ak.Array(array).type for name, array in branches.items()}
+        tree = f.mktree("Events", types,
+                        counter_name=lambda counted: "n" + counted,
+                        field_name=lambda outer, inner: f"{outer}_{inner}")
+        tree.extend(branches)
+    os.replace(path + ".tmp", path)
+
+
+def generate(work_dir, variables, cuts, weights, nevents):
+    """Create the missing inputs and return {path: entries}. Files already made with the same schema are kept."""
+    schema = branch_schema(list(variables) + [cuts or "1", weights, "channel"])
+    manifest_path = os.path.join(work_dir, "inputs.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    signature = repr((schema, nevents))
+
+    files = input_files(work_dir)
+    start = time.time()
+    made = 0
+    for path, kind in files.items():
+        entry = manifest.get(path)
+        if entry and entry["signature"] == signature and os.path.exists(path):
+            continue
+        generate_file(path, schema, nevents, kind)
+        manifest[path] = {"signature": signature, "entries": nevents, "kind": kind}
+        made += 1
+    os.makedirs(work_dir, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    print(f"Generated {made} of {len(files)} input files in {time.time() - start:.1f} s")
+    return {path: manifest[path]["entries"] for path in files}
+
+
+## The kinds of input each mode fills
+MODE_KINDS = {
+    "dataMC": ("background", "signal", "data"),
+    "signals_only": ("signal",),
+    "SignalandBackground": ("background", "signal"),
+}
+
+
+def norm_arguments(options):
+    """The norm.py command line of one benchmark run."""
+    argv = ["--year", "2024", "--variables", *options["variables"], "--Channel", *options["channels"],
+            "--cuts", options["cuts"], "--weights", options["weights"], "--engine", options["engine"],
+            "--threads", str(options["threads"]), "--mc_dir", os.path.join(options["work_dir"], "mc"),
+            "--data_dir", os.path.join(options["work_dir"], "data"), "--timing_report", options["timing_report"]]
+    if options["mode"] == "dataMC":
+        argv.append("--dataMC")
+    elif options["mode"] == "signals_only":
+        argv.append("--signals_only")
+    for option in ("cache_dir", "index_dir"):
+        if options[option]:
+            argv += [f"--{option}", options[option]]
+    return argv
+
+
+def run_mode(options):
+    """Run norm.main for one mode in this process and return its measurements, from its timing report."""
+    import norm
+
+    norm.main(norm_arguments(options))
+    with open(options["timing_report"]) as f:
+        timing_report = json.load(f)
+    stages = {name: values["seconds"] for name, values in timing_report["stages"].items()}
+    kinds = input_files(options["work_dir"])
+    events = sum(entries for path, entries in options["entries"].items() if kinds.get(path) in MODE_KINDS[options["mode"]])
+    fill_time = sum(t for stage, t in stages.items() if stage.startswith("fill_"))
+    return {
+        "mode": options["mode"],
+        "engine": options["engine"],
+        "stages": stages,
+        "events": events,
+        "events_per_second": events / fill_time if fill_time else None,
+        "cache": timing_report.get("cache"),
+    }
+
+
+def run_isolated(options, log_file):
+    """Run one mode in a child process, so that its peak RSS is its own."""
+    result_file = log_file.replace(".txt", ".json")
+    options = dict(options, timing_report=log_file.replace(".txt", "_timing.json"))
+    with open(result_file, "w") as f:
+        json.dump(options, f)
+    start = time.time()
+    with open(log_file, "w") as log:
+        returncode = subprocess.call([sys.executable, os.path.abspath(__file__), "--child", result_file],
+                                     stdout=log, stderr=subprocess.STDOUT, cwd=options["work_dir"])
+    wall = time.time() - start
+    with open(result_file) as f:
+        result = json.load(f)
+    if returncode != 0 or "stages" not in result:
+        return {"mode": options["mode"], "engine": options["engine"], "failed": True, "wall": wall}
+    result["wall"] = wall
+    return result
+
+
+def report(results):
+    print(f"\n{'engine':8} {'mode':20} {'wall [s]':>9} {'fill [s]':>9} {'events/s':>11} {'peak RSS [MB]':>14}")
+    for r in results:
+        if r.get("failed"):
+            print(f"{r['engine']:8} {r['mode']:20} {r['wall']:9.2f}  failed")
+            continue
+        fill = sum(t for stage, t in r["stages"].items() if stage.startswith("fill_"))
+        rate = f"{r['events_per_second']:.0f}" if r["events_per_second"] else "-"
+        print(f"{r['engine']:8} {r['mode']:20} {r['wall']:9.2f} {fill:9.2f} {rate:>11} {r['peak_rss_mb']:14.1f}")
+        for stage, t in r["stages"].items():
+            print(f"{'':30} {stage:18} {t:8.2f} s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        ## The options come in the result file and are replaced by the measurements
+        with open(sys.argv[2]) as f:
+            options = json.load(f)
+        result = run_mode(options)
+        result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        with open(sys.argv[2], "w") as f:
+            json.dump(result, f, indent=1)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark norm.py on synthetic NanoAOD-like inputs.")
+    parser.add_argument("--work_dir", default="benchmark_inputs", help="Where the inputs, plots and logs are written.")
+    parser.add_argument("--events", type=int, default=2000, help="Events per synthetic file.")
+    parser.add_argument("--variables", nargs="+", default=DEFAULT_VARIABLES)
+    parser.add_argument("--cuts", default=DEFAULT_CUTS)
+    parser.add_argument("--weights", default="xsWeight")
+    parser.add_argument("--Channel", nargs="+", choices=["tt", "et", "mt", "all", "lt"], default=DEFAULT_CHANNELS)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--engines", nargs="+", choices=["draw", "rdf", "uproot"], default=["draw"])
+    parser.add_argument("--threads", type=int, default=0, help="Threads for the rdf and uproot engines (0 = all cores).")
+    parser.add_argument("--cache_dir", default=None, help="Use a histogram cache, run with --repeat 2 to time cold and warm.")
+    parser.add_argument("--index_dir", default=None, help="Use the entry lists of the channel cuts (draw engine), as norm.py --index_dir.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of every engine and mode.")
+    parser.add_argument("--output", default=None, help="JSON file for the results (default: <work_dir>/benchmark.json).")
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    entries = generate(work_dir, args.variables, args.cuts, args.weights, args.events)
+
+    results = []
+    os.makedirs(os.path.join(work_dir, "logs"), exist_ok=True)
+    for repeat in range(args.repeat):
+        for engine in args.engines:
+            for mode in args.modes:
+                options = {
+                    "work_dir": work_dir,
+                    "entries": entries,
+                    "variables": args.variables,
+                    "cuts": args.cuts,
+                    "weights": args.weights,
+                    "channels": list(dict.fromkeys(args.Channel)),
+                    "engine": engine,
+                    "mode": mode,
+                    "threads": args.threads,
+                    "cache_dir": os.path.abspath(args.cache_dir) if args.cache_dir else None,
+                    "index_dir": os.path.abspath(args.index_dir) if args.index_dir else None,
+                }
+                print(f"Running {engine} {mode} (run {repeat + 1}/{args.repeat})")
+                log_file = os.path.join(work_dir, "logs", f"{engine}_{mode}_{repeat}.txt")
+                result = run_isolated(options, log_file)
+                result["run"] = repeat
+                results.append(result)
+
+    report(results)
+    output = args.output or os.path.join(work_dir, "benchmark.json")
+    with open(output, "w") as f:
+        json.dump({"events_per_file": args.events, "variables": args.variables, "results": results}, f, indent=1)
+    print(f"\nResults written to {output}")
@@ -0,0 +1,158 @@
+"""Persistent per-file entry lists of the channel cuts (``--index_dir``).
+
+The channel selections (channel==N plus the shared veto flags) are the same for almost every job
+of a campaign, but each job used to evaluate them on every event of every file. Here the entries
+of a file passing one cut expression are stored once as a TEntryList, keyed by a hash of the
+file's path, size and mtime and of the unweighted cut string. A job takes the union of the lists
+of its channels and FillMultiple only visits those entries, so a new variable in the tt channel
+reads a small fraction of the events. A changed file or cut is a new key.
+"""
+import hashlib
+import os
+import threading
+from collections import defaultdict
+
+import ROOT
+
+from hist_cache import file_state
+
+if not hasattr(ROOT, "SelectEntries"):
+    ROOT.gInterpreter.Declare(r"""
+#include "TTree.h"
+#include "TTreeFormula.h"
+#include "TEntryList.h"
+#include <string>
+#include <vector>
+
+// Entries with at least one instance of ``cut`` different from zero, nullptr if the cut does not compile.
+TEntryList *SelectEntries(TTree *tree, const std::string &cut)
+{
+   TTreeFormula formula("fm_cut", cut.c_str(), tree);
+   if (formula.GetNdim() == 0)
+      return nullptr;
+   auto *list = new TEntryList();
+   const Long64_t nentries = tree->GetEntries();
+   for (Long64_t entry = 0; entry < nentries; ++entry) {
+      if (tree->LoadTree(entry) < 0)
+         break;
+      const Int_t ndata = formula.GetNdata();
+      for (Int_t k = 0; k < ndata; ++k) {
+         if (formula.EvalInstance(k) != 0) {
+            list->Enter(entry);
+            break;
+         }
+      }
+   }
+   return list;
+}
+
+TEntryList *UnionEntryLists(const std::vector<TEntryList *> &lists)
+{
+   auto *out = new TEntryList();
+   for (auto *list : lists)
+      for (Long64_t i = 0; i < list->GetN(); ++i)
+         out->Enter(list->GetEntry(i));
+   return out;
+}
+""")
+    ## The scans are pure C++, let the other fill threads run meanwhile
+    ROOT.SelectEntries.__release_gil__ = True
+    ROOT.UnionEntryLists.__release_gil__ = True
+
+
+class EntryIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.built = 0
+        self.loaded = 0
+        self._guard = threading.Lock()
+        self._locks = defaultdict(threading.Lock)
+        self._shared = {}
+        os.makedirs(index_dir, exist_ok=True)
+
+    def path(self, source, cut):
+        """Index file of ``cut`` on ``source``, None for remote or missing files."""
+        state = file_state(source)
+        if state is None:
+            return None
+        digest = hashlib.sha1(repr((state, cut)).encode()).hexdigest()
+        return os.path.join(self.index_dir, f"{digest}.root")
+
+    def _load(self, path):
+        if path is None or not os.path.exists(path):
+            return None
+        f = ROOT.TFile.Open(path, "READ")
+        if not f or f.IsZombie():
+            return None
+        entries = f.Get("entries")
+        if entries:
+            entries.SetDirectory(0)
+            ROOT.SetOwnership(entries, True)
+        f.Close()
+        return entries or None
+
+    def _save(self, path, entries):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        f = ROOT.TFile(tmp, "RECREATE")
+        f.WriteTObject(entries, "entries")
+        f.Close()
+        os.replace(tmp, path)
+
+    def get(self, tree, source, cut):
+        """TEntryList of the entries of ``tree`` (read from ``source``) passing ``cut``, None if it cannot be built."""
+        path = self.path(source, cut)
+        with self._guard:
+            lock = self._locks[(source, cut)]
+        ## Threads filling entry ranges of the same file wait for the first one to build the list
+        with lock:
+            entries = self._load(path)
+            if entries is not None:
+                self.loaded += 1
+                return entries
+            entries = ROOT.SelectEntries(tree, cut)
+            if not entries:
+                print(f"Could not build the entry list of {cut} for {source}")
+                return None
+            ROOT.SetOwnership(entries, True)
+            self.built += 1
+            if path is not None:
+                self._save(path, entries)
+            return entries
+
+    def entry_list(self, tree, source, cuts):
+        """Union of the entry lists of ``cuts``, None if any of them cannot be built."""
+        lists = [self.get(tree, source, cut) for cut in dict.fromkeys(cuts)]
+        if not lists or any(entries is None for entries in lists):
+            return None
+        if len(lists) == 1:
+            return lists[0]
+        vec = ROOT.std.vector('TEntryList*')()
+        for entries in lists:
+            vec.push_back(entries)
+        union = ROOT.UnionEntryLists(vec)
+        ROOT.SetOwnership(union, True)
+        return union
+
+    def part_list(self, tree, source, cuts, parts):
+        """entry_list() for one of the ``parts`` entry ranges of ``source`` filled in threads.
+
+        The list is built, or loaded, once per file and every part gets its own copy, as TEntryList
+        lookups are not thread-safe. It is dropped once all the parts took theirs.
+        """
+        if parts == 1:
+            return self.entry_list(tree, source, cuts)
+        key = (source, tuple(dict.fromkeys(cuts)))
+        with self._guard:
+            lock = self._locks[key]
+        with lock:
+            if key not in self._shared:
+                self._shared[key] = [self.entry_list(tree, source, cuts), parts]
+            shared = self._shared[key]
+            shared[1] -= 1
+            if not shared[1]:
+                del self._shared[key]
+            if shared[0] is None:
+                return None
+            entries = ROOT.TEntryList(shared[0])
+        ROOT.SetOwnership(entries, True)
+        return entries
@@ -0,0 +1,221 @@
+"""Helpers to inspect the TTree::Draw expressions used for variables, cuts and weights.
+
+parse() turns the TTreeFormula subset used in this repository (arithmetic, comparisons, && || !,
+function calls such as abs() or TMath::Abs(), and array indexing like FatJet_pt[index_gFatJets[0]])
+into a small tuple tree that the non-ROOT engines can evaluate:
+
+    ("num", value)  ("name", branch)  ("call", function, [args])
+    ("index", array, index)  ("unop", op, operand)  ("binop", op, left, right)
+"""
+import re
+
+## An identifier that is not part of a number, a member access, a namespace or a TTreeFormula
+## special like Entry$; a trailing "(" marks a function call rather than a branch. A single ":"
+## separates the axes of a multi-dimensional variable, "y:x" as in TTree::Draw.
+_IDENTIFIER = re.compile(r"(?<![\w.$])(?<!::)([A-Za-z_]\w*)(?![\w$])(?!\s*::)(\s*\()?")
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | (?P<name>[A-Za-z_]\w*(?:::[A-Za-z_]\w*)*\$?)
+      | (?P<op>&&|\|\||==|!=|<=|>=|[-+*/%<>!()\[\],])
+    )""", re.VERBOSE)
+
+## Binary operators by increasing precedence, as in C
+_BINARY_LEVELS = [("||",), ("&&",), ("==", "!=", "<", "<=", ">", ">="), ("+", "-"), ("*", "/", "%")]
+
+
+def _tokenize(expr):
+    tokens = []
+    pos = 0
+    expr = expr.rstrip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if not m or m.end() == pos:
+            raise SyntaxError(f"Cannot parse {expr!r} at position {pos}")
+        kind = m.lastgroup
+        tokens.append((kind, m.group(kind)))
+        pos = m.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expr):
+        self.expr = expr
+        self.tokens = _tokenize(expr)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][1] if self.pos < len(self.tokens) else None
+
+    def take(self, expected=None):
+        if self.pos >= len(self.tokens):
+            raise SyntaxError(f"Unexpected end of {self.expr!r}")
+        kind, value = self.tokens[self.pos]
+        if expected is not None and value != expected:
+            raise SyntaxError(f"Expected {expected!r} but found {value!r} in {self.expr!r}")
+        self.pos += 1
+        return kind, value
+
+    def parse(self):
+        node = self.binary(0)
+        if self.pos != len(self.tokens):
+            raise SyntaxError(f"Unexpected {self.peek()!r} in {self.expr!r}")
+        return node
+
+    def binary(self, level):
+        if level == len(_BINARY_LEVELS):
+            return self.unary()
+        node = self.binary(level + 1)
+        while self.peek() in _BINARY_LEVELS[level]:
+            op = self.take()[1]
+            node = ("binop", op, node, self.binary(level + 1))
+        return node
+
+    def unary(self):
+        if self.peek() in ("-", "+", "!"):
+            op = self.take()[1]
+            return ("unop", op, self.unary())
+        return self.postfix()
+
+    def postfix(self):
+        node = self.primary()
+        while self.peek() == "[":
+            self.take("[")
+            index = self.binary(0)
+            self.take("]")
+            node = ("index", node, index)
+        return node
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == "num":
+            return ("num", float(value))
+        if kind == "name":
+            if self.peek() == "(":
+                self.take("(")
+                args = []
+                while self.peek() != ")":
+                    args.append(self.binary(0))
+                    if self.peek() == ",":
+                        self.take(",")
+                self.take(")")
+                return ("call", value, args)
+            return ("name", value)
+        if value == "(":
+            node = self.binary(0)
+            self.take(")")
+            return node
+        raise SyntaxError(f"Unexpected {value!r} in {self.expr!r}")
+
+
+def parse(expr):
+    """Parse a TTree::Draw expression into the tuple tree described in the module docstring."""
+    return _Parser(expr).parse()
+
+
+def names_in(node):
+    """Branch names used by a parsed expression (function names are not included)."""
+    kind = node[0]
+    if kind == "name":
+        return {node[1]}
+    if kind == "num":
+        return set()
+    if kind == "call":
+        children = node[2]
+    elif kind == "index":
+        children = node[1:]
+    else:
+        children = node[2:]
+    return set().union(*(names_in(child) for child in children))
+
+
+def conjunction_terms(cut):
+    """The terms joined by the top-level && of ``cut``, as parse() trees (spacing and parentheses do not matter).
+
+    A cut that cannot be parsed is a single term, its text without whitespace.
+    """
+    if not cut or not cut.strip():
+        return set()
+    try:
+        node = parse(cut)
+    except SyntaxError:
+        return {("text", "".join(cut.split()))}
+    terms, todo = set(), [node]
+    while todo:
+        node = todo.pop()
+        if node[:2] == ("binop", "&&"):
+            todo.extend(node[2:])
+        else:
+            terms.add(node)
+    return terms
+
+
+def implies(cut, other):
+    """Whether every event passing ``cut`` passes ``other``: each && term of ``other`` is one of ``cut``."""
+    return conjunction_terms(other) <= conjunction_terms(cut)
+
+
+def referenced_branches(*exprs):
+    """Names that can be branches in the given expressions.
+
+    This is a superset: anything that looks like a bare identifier is returned, so callers
+    intersect it with the branch list of the tree they read.
+    """
+    names = set()
+    for expr in exprs:
+        if not expr:
+            continue
+        for m in _IDENTIFIER.finditer(expr):
+            if not m.group(2):
+                names.add(m.group(1))
+    return names
+
+
+def axis_expressions(variable):
+    """Axes of a "y:x" (or "z:y:x") variable, x first; [variable] for a one-dimensional one."""
+    return re.split(r"(?<!:):(?!:)", variable)[::-1]
+
+
+def substitute(expr, replacements):
+    """``expr`` with the branches named in ``replacements`` ({branch: new name}) renamed, functions are kept."""
+    if not expr or not replacements:
+        return expr
+
+    def rename(m):
+        if m.group(2):
+            return m.group(0)
+        return replacements.get(m.group(1), m.group(1))
+    return _IDENTIFIER.sub(rename, expr)
+
+
+def needed_branches(tree, *exprs):
+    """Branches of ``tree`` (a ROOT TTree) that have to be read to evaluate ``exprs``.
+
+    The counter branches of variable-size arrays (e.g. nFatJet for FatJet_pt) are included.
+    Returns None if a name resolves to a tree alias or to a leaf that is not a top-level branch,
+    since the branches behind those are not known here and everything has to stay enabled.
+    """
+    available = {b.GetName() for b in tree.GetListOfBranches()}
+    names = referenced_branches(*exprs)
+    for name in names - available:
+        if tree.GetAlias(name) or tree.GetLeaf(name):
+            return None
+    keep = names & available
+    for name in list(keep):
+        leaf = tree.GetLeaf(name)
+        counter = leaf.GetLeafCount() if leaf else None
+        if counter:
+            keep.add(counter.GetBranch().GetName())
+    return keep
+
+
+def activate_branches(tree, *exprs):
+    """Disable every branch of ``tree`` that ``exprs`` do not need. Returns the active branches."""
+    keep = needed_branches(tree, *exprs)
+    if keep is None:
+        return None
+    tree.SetBranchStatus("*", 0)
+    for name in keep:
+        tree.SetBranchStatus(name, 1)
+    return keep
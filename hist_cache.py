@@ -0,0 +1,143 @@
+"""On-disk cache of filled histograms for norm.py (``--cache_dir``).
+
+Histograms are grouped in one ROOT container per input source, where a source is a file (draw
+engine) or the file list of a sample (rdf engine). The container name hashes the path, size and
+mtime of every file, so a file that changes on disk is simply a cache miss. Inside a container
+each histogram is keyed by a hash of (variable expression, full selection string including the
+weight, binning). Changing a cut or the weight only misses the histograms that use it.
+
+Containers are touched on every hit and the least recently used ones are removed once the cache
+grows beyond its size limit. Writers take an exclusive flock on the container, so the jobs
+started by parallel.py can share one cache directory.
+"""
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+import ROOT
+
+
+def file_state(path):
+    """(absolute path, size, mtime_ns) of a local file, None for missing files.
+
+    A remote file is known by its record in the active sample catalog (see sample_catalog.py),
+    None if there is no catalog or the file is not in it.
+    """
+    if "://" in path:
+        from sample_catalog import remote_state
+        return remote_state(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def detach(h):
+    ## THn (multi-dimensional variables) are never attached to a directory
+    if isinstance(h, ROOT.TH1):
+        h.SetDirectory(0)
+    return h
+
+
+def hist_key(variable, selection, binning):
+    text = "\n".join([variable, selection, ",".join(repr(b) for b in binning)])
+    return "h_" + hashlib.sha1(text.encode()).hexdigest()
+
+
+@contextmanager
+def _locked(path, exclusive):
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class HistogramCache:
+    def __init__(self, cache_dir, max_bytes=10 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def container(self, paths):
+        """Container file for a source made of ``paths``, None if any of them cannot be cached."""
+        states = [file_state(p) for p in paths]
+        if not states or any(s is None for s in states):
+            return None
+        digest = hashlib.sha1(repr(sorted(states)).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.root")
+
+    def get(self, paths, specs):
+        """Look up histograms for a source.
+
+        ``specs`` maps any caller key to (variable, selection, binning). Returns {caller key: TH1}
+        for the entries found; the others have to be filled and passed to put().
+        """
+        container = self.container(paths)
+        found = {}
+        if container is None or not os.path.exists(container):
+            self.misses += len(specs)
+            return found
+
+        with _locked(container, exclusive=False):
+            f = ROOT.TFile.Open(container, "READ")
+            if f and not f.IsZombie():
+                for key, (variable, selection, binning) in specs.items():
+                    h = f.Get(hist_key(variable, selection, binning))
+                    if h:
+                        found[key] = detach(h)
+                f.Close()
+
+        self.hits += len(found)
+        self.misses += len(specs) - len(found)
+        if found:
+            try:
+                os.utime(container)
+            except OSError:
+                pass
+        return found
+
+    def put(self, paths, entries):
+        """Store {caller key: (TH1, variable, selection, binning)} for a source."""
+        container = self.container(paths)
+        if container is None or not entries:
+            return
+        with _locked(container, exclusive=True):
+            f = ROOT.TFile.Open(container, "UPDATE")
+            if not f or f.IsZombie():
+                print(f"Could not write histogram cache {container}")
+                return
+            for h, variable, selection, binning in entries.values():
+                f.WriteTObject(h, hist_key(variable, selection, binning), "Overwrite")
+            f.Close()
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used containers until the cache is below its size limit."""
+        containers = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".root"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            containers.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        for mtime, size, path in sorted(containers):
+            if total <= 0.9 * self.max_bytes:
+                break
+            for stale in (path, path + ".lock"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,198 @@
+"""Histogram store: every histogram of a campaign in one ROOT file (``--store``, ``--render_from``).
+
+One directory per (channel, variable) plot holds the background samples, the background groups,
+the signal mass points and the observed data (per era and summed):
+
+    <channel>_<variable>/variable, channel       TNamed with the plot key
+    <channel>_<variable>/groups/<group>          DiBoson, STop, ... as stacked
+    <channel>_<variable>/samples/<sample>        one histogram per background sample
+    <channel>_<variable>/samples/<sample>__<var> the sample in a systematic variation (norm.py --systematics)
+    <channel>_<variable>/systematics/<var>       total stacked background of each variation
+    <channel>_<variable>/signals/<sample>        one histogram per signal mass point
+    <channel>_<variable>/data/<era>              one histogram per observed era
+    <channel>_<variable>/data_total              sum of the eras, as drawn
+    <channel>_<variable>/inputs                  TNamed, JSON of the files each sample was filled from
+
+The top-level "meta" directory keeps the weight and cut strings the store was filled with.
+Rendering from a store (norm.py --render_from) opens no input file. The recorded inputs let an
+update (norm.py --update) fill only the files added to the catalog since the store was written.
+"""
+import hashlib
+import json
+import os
+
+import ROOT
+
+from hist_cache import detach, file_state
+
+
+def plot_dir(channel, variable):
+    ## Readable but unambiguous: brackets and slashes are not allowed in directory names
+    safe = variable.replace("[", "").replace("]", "").replace("(", "").replace(")", "").replace("/", "_")
+    digest = hashlib.sha1(variable.encode()).hexdigest()[:8]
+    return f"{channel}_{safe}_{digest}"
+
+
+def input_states(paths):
+    ## Remote files are only known by their path
+    return [list(file_state(path) or (path,)) for path in paths]
+
+
+def same_selection(meta, weights, cuts, additional_cuts, systematics=()):
+    """True if a store with ``meta`` was filled with these weights, cuts and systematic variations."""
+    return (meta.get("weights"), meta.get("cuts"), meta.get("additional_cuts"), meta.get("systematics", "")) == (
+        weights, cuts, " && ".join(additional_cuts), " ".join(systematics))
+
+
+def _sum(name, hlist):
+    total = None
+    for h in hlist:
+        if total is None:
+            total = detach(h.Clone(name))
+        else:
+            total.Add(h)
+    return total
+
+
+def write_store(path, plot_keys, group_hists, signals, signal_names, data=None, hists_by_proc=None,
+                data_hists=None, meta=None, update=False, inputs=None, variations=None):
+    """Write one campaign's histograms.
+
+    ``group_hists``, ``signals`` and ``data`` are keyed by plot key as made by norm.group_backgrounds,
+    norm.collect_signals and norm.sum_data; ``signal_names`` are the sample names of the signal list.
+    ``hists_by_proc`` and ``data_hists`` are the per-sample fill results ({sample: {plot key: [hists]}}).
+    With ``update`` the plots are replaced in an existing store whose other plots are kept.
+    ``inputs`` ({kind: {sample: [paths]}}, kind being background, signal or data) are the files
+    the histograms were filled from. ``variations`` are the systematic background totals as made by
+    norm.background_variations.
+    """
+    recorded = json.dumps({kind: {sample: input_states(paths) for sample, paths in samples.items()}
+                           for kind, samples in (inputs or {}).items()})
+    tmp = None
+    if update and os.path.exists(path):
+        f = ROOT.TFile.Open(path, "UPDATE")
+    else:
+        tmp = path + ".tmp"
+        f = ROOT.TFile(tmp, "RECREATE")
+    top = f.GetDirectory("meta") or f.mkdir("meta")
+    for key, value in (meta or {}).items():
+        top.WriteTObject(ROOT.TNamed(key, str(value)), key, "Overwrite")
+
+    for plot_key in plot_keys:
+        channel, variable = plot_key
+        name = plot_dir(channel, variable)
+        if f.GetDirectory(name):
+            f.Delete(name + ";*")
+        d = f.mkdir(name)
+        d.WriteTObject(ROOT.TNamed("variable", variable), "variable")
+        d.WriteTObject(ROOT.TNamed("channel", channel), "channel")
+        d.WriteTObject(ROOT.TNamed("inputs", recorded), "inputs")
+        groups = d.mkdir("groups")
+        for group, h in group_hists.get(plot_key, {}).items():
+            groups.WriteTObject(h, group)
+        signal_dir = d.mkdir("signals")
+        for sample, h in zip(signal_names, signals.get(plot_key, [])):
+            signal_dir.WriteTObject(h, sample)
+        samples = d.mkdir("samples")
+        for sample, sample_hists in (hists_by_proc or {}).items():
+            for key, hlist in sample_hists.items():
+                if key[:2] != plot_key:
+                    continue
+                name = "__".join((sample,) + key[2:])
+                total = _sum(name, hlist)
+                if total is not None:
+                    samples.WriteTObject(total, name)
+        shifted = d.mkdir("systematics")
+        for name, h in (variations or {}).get(plot_key, {}).items():
+            shifted.WriteTObject(h, name)
+        eras = d.mkdir("data")
+        for era, era_hists in (data_hists or {}).items():
+            total = _sum(era, era_hists.get(plot_key, []))
+            if total is not None:
+                eras.WriteTObject(total, era)
+        if data and data.get(plot_key) is not None:
+            d.WriteTObject(data[plot_key], "data_total")
+    f.Close()
+    if tmp is not None:
+        os.replace(tmp, path)
+
+
+def _read_dir(directory):
+    found = {}
+    if not directory:
+        return found
+    for key in directory.GetListOfKeys():
+        found[key.GetName()] = detach(key.ReadObj())
+    return found
+
+
+def _meta(f):
+    meta_dir = f.Get("meta")
+    return {key.GetName(): key.ReadObj().GetTitle() for key in meta_dir.GetListOfKeys()} if meta_dir else {}
+
+
+def _plots(f):
+    for key in f.GetListOfKeys():
+        if key.GetName() == "meta" or not key.IsFolder():
+            continue
+        d = f.Get(key.GetName())
+        yield (d.Get("channel").GetTitle(), d.Get("variable").GetTitle()), d
+
+
+def read_samples(path):
+    """Per-sample histograms of a store and the files they were filled from, for norm.py --update.
+
+    Returns ({key: {kind: {sample: hist}}}, {key: {kind: {sample: [file state]}}}, meta) with kind
+    one of "background", "signal" or "data" and key a plot key, or (channel, variable, variation)
+    for the systematic variations of the backgrounds; all empty if there is no store yet.
+    """
+    if not os.path.exists(path):
+        return {}, {}, {}
+    f = ROOT.TFile.Open(path, "READ")
+    if not f or f.IsZombie():
+        raise OSError(f"Could not open histogram store {path}")
+    hists, inputs = {}, {}
+    for plot_key, d in _plots(f):
+        hists[plot_key] = {"background": {}, "signal": _read_dir(d.Get("signals")), "data": _read_dir(d.Get("data"))}
+        recorded = d.Get("inputs")
+        inputs[plot_key] = json.loads(recorded.GetTitle()) if recorded else {}
+        for name, h in _read_dir(d.Get("samples")).items():
+            sample, _, variation = name.partition("__")
+            key = plot_key + (variation,) if variation else plot_key
+            hists.setdefault(key, {"background": {}})["background"][sample] = h
+            inputs[key] = inputs[plot_key]
+    meta = _meta(f)
+    f.Close()
+    return hists, inputs, meta
+
+
+def read_store(path, signal_names):
+    """Read a store back into ({plot key: group hists}, {plot key: [signals]}, {plot key: data or None},
+    {plot key: {variation: total background}}, meta).
+
+    The signals come in the order of ``signal_names``, a mass point missing from the store (filled
+    before it was added to the catalog) is an empty histogram.
+    """
+    f = ROOT.TFile.Open(path, "READ")
+    if not f or f.IsZombie():
+        raise OSError(f"Could not open histogram store {path}")
+    meta = _meta(f)
+    groups, signals, data, variations = {}, {}, {}, {}
+    for plot_key, d in _plots(f):
+        variations[plot_key] = _read_dir(d.Get("systematics"))
+        groups[plot_key] = _read_dir(d.Get("groups"))
+        stored = _read_dir(d.Get("signals"))
+        template = next(iter(list(stored.values()) + list(groups[plot_key].values())), None)
+        signals[plot_key] = []
+        for name in signal_names:
+            if name not in stored and template is not None:
+                stored[name] = template.Clone(name)
+                stored[name].Reset()
+            if name in stored:
+                signals[plot_key].append(stored[name])
+        total = d.Get("data_total")
+        if total:
+            total.SetDirectory(0)
+        data[plot_key] = total or None
+    f.Close()
+    return groups, signals, data, variations, meta
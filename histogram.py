@@ -0,0 +1,149 @@
+"""NumPy histogram results: the totals, bands, ratios and integrals of the plots as array operations.
+
+A Hist holds the bin contents and sums of squared weights of a 1D histogram, under- and overflow
+included (n + 2 entries), and its n + 1 bin edges. from_th1 wraps the arrays of a TH1 without
+copying them. The other direction is a copy: a TH1 owns its arrays and cannot take NumPy's, so
+write_th1 copies a Hist into the arrays of an existing TH1 through the same views, and to_th1
+into a new TH1D.
+
+summarize() works on many plots at once: the bins of every plot are laid side by side in one
+array per background group, so the stacked total, the statistical and systematic band, the
+Data/MC ratio and the integrals of all the plots of a campaign are a handful of NumPy operations
+instead of per-bin GetBinContent / SetPointError loops and Clone / Add chains.
+"""
+from collections import namedtuple
+
+import numpy as np
+import ROOT
+
+from systematics import band_errors
+
+Hist = namedtuple("Hist", ["values", "sumw2", "edges"])
+
+## Everything the plots draw besides the groups themselves, see summarize()
+PlotSummary = namedtuple("PlotSummary", ["total", "band_down", "band_up", "integral", "maximum",
+                                         "data", "data_integral", "ratio"])
+
+
+def _view(array, size):
+    ## GetArray() is a view of unknown length on the C++ array; NumPy shares its memory
+    array.reshape((size,))
+    return np.asarray(array)
+
+
+def from_th1(h):
+    """Hist of the arrays of the TH1 ``h`` (float32 for a TH1F), shared with it."""
+    n = h.GetNbinsX()
+    values = _view(h.GetArray(), n + 2)
+    sumw2 = _view(h.GetSumw2().GetArray(), n + 2) if h.GetSumw2N() else values
+    axis = h.GetXaxis()
+    if axis.GetXbins().GetSize():
+        edges = _view(axis.GetXbins().GetArray(), n + 1)
+    else:
+        edges = np.linspace(axis.GetXmin(), axis.GetXmax(), n + 1)
+    return Hist(values, sumw2, edges)
+
+
+def write_th1(hist, h):
+    """Copy the contents of ``hist`` into the TH1 ``h``, which has the same bins, and return ``h``."""
+    n = h.GetNbinsX()
+    if len(hist.values) != n + 2:
+        raise ValueError(f"{h.GetName()} has {n} bins, the histogram {len(hist.values) - 2}")
+    if not h.GetSumw2N():
+        h.Sumw2()
+    _view(h.GetArray(), n + 2)[:] = hist.values
+    _view(h.GetSumw2().GetArray(), n + 2)[:] = hist.sumw2
+    h.ResetStats()
+    return h
+
+
+def to_th1(hist, name, title=""):
+    """New TH1D with a copy of the contents of ``hist``, see write_th1."""
+    h = ROOT.TH1D(name, title, len(hist.edges) - 1, np.asarray(hist.edges, dtype=np.float64))
+    h.SetDirectory(0)
+    return write_th1(hist, h)
+
+
+def integral(hist):
+    """(integral, error) with under- and overflow, as TH1::IntegralAndError(0, n + 1)."""
+    return float(np.sum(hist.values, dtype=np.float64)), float(np.sqrt(np.sum(hist.sumw2, dtype=np.float64)))
+
+
+def ratio(numerator, denominator):
+    """numerator / denominator with the errors of TH1::Divide, 0 where the denominator is 0."""
+    num, den = np.asarray(numerator.values, dtype=np.float64), np.asarray(denominator.values, dtype=np.float64)
+    filled = den != 0
+    safe = np.where(filled, den, 1.0)
+    values = np.where(filled, num / safe, 0.0)
+    sumw2 = np.where(filled, (numerator.sumw2 * den**2 + denominator.sumw2 * num**2) / safe**4, 0.0)
+    return Hist(values, sumw2, numerator.edges)
+
+
+def _side_by_side(hists):
+    return np.concatenate([np.asarray(h, dtype=np.float64) for h in hists])
+
+
+def summarize(plots, stacked):
+    """{plot key: PlotSummary} of many plots, computed over all their bins at once.
+
+    ``plots`` maps a plot key to (group histograms {group: TH1}, data TH1 or None, {variation:
+    total background TH1}); ``stacked`` are the groups that make the total background, the
+    maximum is taken over all the groups. A plot without data has None for data, data_integral
+    and ratio.
+    """
+    keys = list(plots)
+    if not keys:
+        return {}
+    groups = {key: [from_th1(plots[key][0][group]) for group in stacked] for key in keys}
+    sizes = [len(groups[key][0].values) for key in keys]
+    bounds = np.cumsum([0] + sizes)
+
+    ## One row per stacked group, one column per bin of every plot
+    values = np.stack([_side_by_side(groups[key][i].values for key in keys) for i in range(len(stacked))])
+    sumw2 = np.stack([_side_by_side(groups[key][i].sumw2 for key in keys) for i in range(len(stacked))])
+    total_values, total_sumw2 = values.sum(axis=0), sumw2.sum(axis=0)
+
+    ## The variations of a plot without them are the nominal, they add nothing to the band
+    names = list(dict.fromkeys(name for key in keys for name in plots[key][2]))
+    shifted = {}
+    for name in names:
+        shifted[name] = _side_by_side(
+            from_th1(plots[key][2][name]).values if name in plots[key][2] else total_values[start:stop]
+            for key, start, stop in zip(keys, bounds[:-1], bounds[1:]))
+    syst_down, syst_up = band_errors(total_values, shifted)
+    stat = np.sqrt(total_sumw2)
+    band_down, band_up = np.hypot(stat, syst_down), np.hypot(stat, syst_up)
+
+    ## Largest in-range bin of any single group, the unstacked ones included, as max(h.GetMaximum())
+    in_range = np.ones(bounds[-1], dtype=bool)
+    in_range[bounds[:-1]] = False
+    in_range[bounds[1:] - 1] = False
+    all_groups = list(dict.fromkeys(group for key in keys for group in plots[key][0]))
+    peaks = np.stack([_side_by_side(from_th1(plots[key][0][group]).values if group in plots[key][0] else np.zeros(size)
+                                    for key, size in zip(keys, sizes)) for group in all_groups])
+    maxima = np.maximum.reduceat(np.where(in_range, peaks.max(axis=0), -np.inf), bounds[:-1])
+
+    has_data = [plots[key][1] is not None for key in keys]
+    data_values = data_sumw2 = None
+    if any(has_data):
+        data = [from_th1(plots[key][1]) if plots[key][1] is not None else None for key in keys]
+        data_values = _side_by_side(h.values if h else np.zeros(size) for h, size in zip(data, sizes))
+        data_sumw2 = _side_by_side(h.sumw2 if h else np.zeros(size) for h, size in zip(data, sizes))
+        ratios = ratio(Hist(data_values, data_sumw2, None), Hist(total_values, total_sumw2, None))
+
+    integrals = np.add.reduceat(total_values, bounds[:-1])
+    errors = np.sqrt(np.add.reduceat(total_sumw2, bounds[:-1]))
+    summaries = {}
+    for i, (key, start, stop) in enumerate(zip(keys, bounds[:-1], bounds[1:])):
+        edges = groups[key][0].edges
+        data_hist = data_integral = ratio_hist = None
+        if has_data[i]:
+            data_hist = Hist(data_values[start:stop], data_sumw2[start:stop], edges)
+            data_integral = integral(data_hist)
+            ratio_hist = Hist(ratios.values[start:stop], ratios.sumw2[start:stop], edges)
+        summaries[key] = PlotSummary(
+            total=Hist(total_values[start:stop], total_sumw2[start:stop], edges),
+            band_down=band_down[start:stop], band_up=band_up[start:stop],
+            integral=(float(integrals[i]), float(errors[i])), maximum=float(maxima[i]),
+            data=data_hist, data_integral=data_integral, ratio=ratio_hist)
+    return summaries
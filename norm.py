@@ -4,16 +4,269 @@ ROOT.TH1.AddDirectory(False)
 ROOT.TH1.SetDefaultSumw2(True)
 
 import argparse
+import collections
+import json
+import concurrent.futures
+import ctypes
 import os
 import glob
 from samples import redirector_MC, Signals, Backgrounds
 from observed import observed
 
 from variable_dictionaries import variableAxisTitleDictionary, variableFileNameDictionary, variableSettingDictionary
+from readahead import bytes_read, enable_thread_safety, keeps_files_open, on_close, open_events, read_ahead, release
+from expressions import axis_expressions
+import auto_binning
+import histogram
+import sample_catalog
+import timing
 import time
 import re
 
 
+## Stacking order of the background groups, "Other" collects the samples of any other category.
+BACKGROUND_GROUPS = ["DiBoson", "STop", "TTbar", "QCD", "WJets", "Drell-Yan", "Other"]
+STACKED_GROUPS = ["DiBoson", "STop", "TTbar", "QCD", "WJets", "Drell-Yan"]
+
+## Background sample -> group: the categories of samples.Backgrounds are the groups
+SAMPLE_GROUPS = {proc_name: category for category, sample_type in Backgrounds.items() for proc_name in sample_type}
+
+GROUP_COLORS = {
+    "DiBoson": "#9d99bd",
+    "STop": "#a5e7fa",
+    "TTbar": "#92cfe0",
+    "QCD": "#f29b6f",
+    "WJets": "#fcd068",
+    "Drell-Yan": "#d8ed79",
+    "Other": "#ffff00",
+}
+
+## Line colours of the signal mass points, in increasing mass order
+SIGNAL_COLORS = [ROOT.kRed, ROOT.kBlue+2, ROOT.kViolet+3, ROOT.kCyan+4, ROOT.kGreen+3, ROOT.kOrange+7, ROOT.kMagenta+2, ROOT.kGray+2]
+
+def signal_points(signals):
+    """(sample name, legend label, line colour) for every entry of the Signals catalog, by increasing mass."""
+    def mass(sample):
+        match = re.search(r"_M-(\d+)", sample)
+        return int(match.group(1)) if match else 0
+    points = []
+    for i, sample in enumerate(sorted(signals, key=mass)):
+        label = f"{mass(sample) / 1000:g}TeV (1pb x 0.073 (bbtt BR))" if mass(sample) else sample
+        points.append((sample, label, SIGNAL_COLORS[i % len(SIGNAL_COLORS)]))
+    return points
+
+## Signal mass points drawn on the plots, a new entry in samples.Signals is picked up here
+SIGNAL_POINTS = signal_points(Signals)
+
+## Selection added for each requested channel, so one pass can fill several channels at once
+CHANNEL_CUTS = {
+    "tt": "(channel==0)",
+    "et": "(channel==1)",
+    "mt": "(channel==2)",
+    "lt": "((channel==1) || (channel==2))",
+    "all": None,
+}
+
+CHANNEL_HEADERS = {
+    "tt": "#tau-#tau Channel",
+    "et": "e-#tau Channel",
+    "mt": "#mu-#tau Channel",
+    "lt": "l-#tau Channel",
+    "all": "all Channels",
+}
+
+
+## Fills any number of histograms from a single pass over a tree. Each histogram gets its own
+## variable and selection formula, they follow the same instance logic as TTree::Draw
+## (TSelectorDraw), so "Tau_pt[index_gTaus]" fills one entry per selected tau as before.
+## With an entry list (see entry_index.py) only the listed entries are visited. Multi-dimensional
+## histograms (THnD or THnSparseD) have one formula per axis and are filled in the same loop.
+## With ``keep`` the compiled formulas stay with the tree for the next fill of the same
+## expressions (files kept open by plot_daemon.py), until ForgetFormulas(tree) before it is closed.
+if not hasattr(ROOT, "FillMultiple"):
+    ROOT.gInterpreter.Declare(r"""
+#include "TTree.h"
+#include "TTreeFormula.h"
+#include "TTreeFormulaManager.h"
+#include "TH1.h"
+#include "THnBase.h"
+#include "TEntryList.h"
+#include <map>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <utility>
+#include <vector>
+
+// The axes of one histogram and its selection, compiled on a tree and evaluated together.
+struct FillFormulas {
+   std::vector<TTreeFormula *> axes;
+   std::vector<bool> axisMultiple;
+   TTreeFormula *selection = nullptr;
+   bool selMultiple = false;
+   // The manager is owned by its formulas and goes away with the last one.
+   ~FillFormulas()
+   {
+      delete selection;
+      for (auto *form : axes)
+         delete form;
+   }
+};
+
+std::map<std::pair<TTree *, std::string>, std::shared_ptr<FillFormulas>> gFillFormulas;
+std::mutex gFillFormulasLock;
+
+// Compiled formulas of ``axes`` and ``selection``, nullptr if one of them does not compile.
+std::shared_ptr<FillFormulas> CompileFormulas(TTree *tree, const std::vector<std::string> &axes,
+                                              const std::string &selection, bool keep)
+{
+   std::string key = selection;
+   for (const auto &axis : axes)
+      key += '\n' + axis;
+   if (keep) {
+      std::lock_guard<std::mutex> lock(gFillFormulasLock);
+      auto found = gFillFormulas.find({tree, key});
+      if (found != gFillFormulas.end())
+         return found->second;
+   }
+   auto formulas = std::make_shared<FillFormulas>();
+   formulas->selection = new TTreeFormula("fm_sel", selection.c_str(), tree);
+   bool compiled = formulas->selection->GetNdim() != 0;
+   for (size_t a = 0; a < axes.size(); ++a) {
+      formulas->axes.push_back(new TTreeFormula(Form("fm_axis_%zu", a), axes[a].c_str(), tree));
+      compiled = compiled && formulas->axes.back()->GetNdim() != 0;
+   }
+   if (!compiled)
+      return nullptr;
+   auto *manager = new TTreeFormulaManager;
+   for (auto *form : formulas->axes)
+      manager->Add(form);
+   manager->Add(formulas->selection);
+   manager->Sync();
+   for (auto *form : formulas->axes)
+      formulas->axisMultiple.push_back(form->GetMultiplicity() != 0);
+   formulas->selMultiple = formulas->selection->GetMultiplicity() != 0;
+   if (keep) {
+      std::lock_guard<std::mutex> lock(gFillFormulasLock);
+      gFillFormulas[{tree, key}] = formulas;
+   }
+   return formulas;
+}
+
+// Drop the formulas kept for ``tree``, before it is deleted.
+void ForgetFormulas(TTree *tree)
+{
+   std::lock_guard<std::mutex> lock(gFillFormulasLock);
+   for (auto it = gFillFormulas.begin(); it != gFillFormulas.end();)
+      it = it->first.first == tree ? gFillFormulas.erase(it) : std::next(it);
+}
+
+Long64_t FillMultiple(TTree *tree,
+                      const std::vector<std::string> &exprs,
+                      const std::vector<std::string> &selections,
+                      const std::vector<TH1 *> &hists,
+                      Long64_t &nselected,
+                      Long64_t first = 0,
+                      Long64_t last = -1,
+                      TEntryList *entries = nullptr,
+                      const std::vector<std::vector<std::string>> &axesN = {},
+                      const std::vector<std::string> &selectionsN = {},
+                      const std::vector<THnBase *> &histsN = {},
+                      bool keep = false)
+{
+   const size_t n = hists.size();
+   std::vector<std::shared_ptr<FillFormulas>> forms(n);
+   bool ok = true;
+   for (size_t i = 0; i < n; ++i) {
+      forms[i] = CompileFormulas(tree, {exprs[i]}, selections[i], keep);
+      ok = ok && forms[i];
+   }
+
+   const size_t m = histsN.size();
+   std::vector<std::shared_ptr<FillFormulas>> formsN(m);
+   std::vector<std::vector<Double_t>> points(m);
+   for (size_t j = 0; j < m; ++j) {
+      formsN[j] = CompileFormulas(tree, axesN[j], selectionsN[j], keep);
+      ok = ok && formsN[j];
+      points[j].resize(axesN[j].size());
+   }
+
+   Long64_t nentries = -1;
+   nselected = 0;
+   if (ok) {
+      // first and last are positions in ``entries`` when it is given, entry numbers otherwise
+      nentries = entries ? entries->GetN() : tree->GetEntries();
+      if (last >= 0 && last < nentries)
+         nentries = last;
+      for (Long64_t pos = first; pos < nentries; ++pos) {
+         const Long64_t entry = entries ? entries->GetEntry(pos) : pos;
+         if (entry < 0 || tree->LoadTree(entry) < 0)
+            break;
+         bool selected = false;
+         for (size_t i = 0; i < n; ++i) {
+            FillFormulas &f = *forms[i];
+            const Int_t ndata = f.selection->GetManager()->GetNdata();
+            if (ndata <= 0)
+               continue;
+            Double_t w = f.selection->EvalInstance(0);
+            if (w == 0 && !f.selMultiple)
+               continue;
+            Double_t x = f.axes[0]->EvalInstance(0);
+            if (w != 0) {
+               hists[i]->Fill(x, w);
+               selected = true;
+            }
+            for (Int_t k = 1; k < ndata; ++k) {
+               if (f.selMultiple) {
+                  w = f.selection->EvalInstance(k);
+                  if (w == 0)
+                     continue;
+               }
+               if (f.axisMultiple[0])
+                  x = f.axes[0]->EvalInstance(k);
+               hists[i]->Fill(x, w);
+               selected = true;
+            }
+         }
+         for (size_t j = 0; j < m; ++j) {
+            FillFormulas &f = *formsN[j];
+            const Int_t ndata = f.selection->GetManager()->GetNdata();
+            if (ndata <= 0)
+               continue;
+            Double_t w = f.selection->EvalInstance(0);
+            if (w == 0 && !f.selMultiple)
+               continue;
+            std::vector<Double_t> &x = points[j];
+            for (size_t a = 0; a < x.size(); ++a)
+               x[a] = f.axes[a]->EvalInstance(0);
+            if (w != 0) {
+               histsN[j]->Fill(x.data(), w);
+               selected = true;
+            }
+            for (Int_t k = 1; k < ndata; ++k) {
+               if (f.selMultiple) {
+                  w = f.selection->EvalInstance(k);
+                  if (w == 0)
+                     continue;
+               }
+               for (size_t a = 0; a < x.size(); ++a)
+                  if (f.axisMultiple[a])
+                     x[a] = f.axes[a]->EvalInstance(k);
+               histsN[j]->Fill(x.data(), w);
+               selected = true;
+            }
+         }
+         if (selected)
+            ++nselected;
+      }
+   }
+   return nentries < 0 ? nentries : nentries - first;
+}
+""")
+## The event loop is pure C++, let the read-ahead threads run Python meanwhile
+ROOT.FillMultiple.__release_gil__ = True
+on_close(ROOT.ForgetFormulas)
+
 
 def create_cut_string(weights, base_cut, additional_cuts, is_observed=False):
     if additional_cuts is None:
@@ -34,27 +287,20 @@ def create_cut_string(weights, base_cut, additional_cuts, is_observed=False):
     else:
         return f"{weights} * ({cut_expr})"
 
-def group_key_from_name(name: str) -> str:
-    ## Strip any trailing _<digits> or variable suffix to make matching robust
-    import re
-    name_clean = re.sub(r"_[0-9]+$", "", name)      
-    name_clean = re.sub(r"(_HTT_m.*)$", "", name_clean)  
-
-    if any(s in name_clean for s in ["WW", "WZ", "ZZ"]):
-        return "DiBoson"
-    if any(s in name_clean for s in ["TWminus", "TbarWplus", "TbarBQ", "TBbarQ"]):
-        return "STop"
-    if "TTto" in name_clean:
-        return "TTbar"
-    if "QCD" in name_clean:
-        return "QCD"
-    if "Wto" in name_clean:
-        return "WJets"
-    if "DYto" in name_clean:
-        return "Drell-Yan"
-    if "GluGlutoRadion" in name_clean:
-        return "Signal"
-    return "Other"
+def sample_group(proc_name):
+    group = SAMPLE_GROUPS.get(proc_name, "Other")
+    return group if group in BACKGROUND_GROUPS else "Other"
+
+def accumulate(sample_hists, key, h):
+    """Add the histogram ``h`` of one file into the running total of its sample, ``sample_hists`` ({key: [total]})."""
+    hlist = sample_hists.setdefault(key, [])
+    if not hlist:
+        hlist.append(h)
+    elif auto_binning.is_fine(key[1]):
+        ## The fine histograms of automatic binning extend their axis per file
+        hlist[0] = auto_binning.merge(hlist[0], h)
+    else:
+        hlist[0].Add(h)
 
 
 import numpy as np
@@ -71,328 +317,900 @@ def format_scientific(val, err=0, sig_val=3, sig_err=2):
     else:
         return f"{mantissa_val:.{sig_val}g}×10^{exponent}"
 
-def get_integral_with_error(hist):
-    import ctypes
-    err = ctypes.c_double(0.0)
-    val = hist.IntegralAndError(0, hist.GetNbinsX() + 1, err)
-    return val, err.value
-
 def get_full_path(base_dir, path):
     if os.path.isabs(path):
         return path
     return os.path.join(base_dir, path)
 
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Generate histograms from ROOT files.")
-    parser.add_argument('--year',
-                        nargs='?',
-                        choices=['2024'],
-                        help='Use the file\'s fake factor weightings when making plots for these files.',
-                        required=True)
-    parser.add_argument("--variables", nargs="+", required=True, help="Variables to plot.")
-    parser.add_argument("--cuts", default="", help="Standard cut string.")
-    parser.add_argument("--additional_cuts", nargs="+", default=[], help="Additional selection cuts.")
-    parser.add_argument("--weights", default="FinalWeighting", help="Event weight expression.")
-    parser.add_argument("--log_scale", action="store_true", help="Enable logarithmic Y-axis scaling.")
-    parser.add_argument('--Channel',choices=["tt","et","mt","all","lt"], required=True)
-    parser.add_argument("--signals_only", action="store_true", help="Plot signals only (skip backgrounds, stack, and error band).")
-    parser.add_argument("--dataMC",action="store_true", help="Overlay observed data and draw Data/MC ratio")
-
-
-    start = time.time()
-    args = parser.parse_args()
-    variable = args.variables[0]
-    weights = args.weights
-    base_cut = args.cuts
-    additional_cuts_o = args.additional_cuts
-    log_scale = args.log_scale
-    
-    for dirname in ["SignalandBackground", "Signal_only", "DataMC"]:
-        os.makedirs(dirname, exist_ok=True)
-
-    bins = variableSettingDictionary.get(variable, "21,0,1000")  
+def get_binning(variable):
+    ## (nbins, low, high) from variableSettingDictionary, with the historical default for unknown variables
+    if is_multidim(variable):
+        return tuple(get_binning(axis) for axis in axis_expressions(variable))
+    bin_edges = auto_binning.edges(variable)
+    if bin_edges:
+        return len(bin_edges) - 1, bin_edges[0], bin_edges[-1]
+    if auto_binning.is_fine(variable):
+        return auto_binning.FINE_BINS, 0.0, 1.0
+    bins = variableSettingDictionary.get(variable, "21,0,1000")
     bin_values = tuple(map(float, bins.split(',')))
+    return int(bin_values[0]), bin_values[1], bin_values[2]
+
+## Above this many cells (under- and overflow included) a multi-dimensional histogram is sparse
+SPARSE_CELLS = 10**6
+
+def is_multidim(variable):
+    return len(axis_expressions(variable)) > 1
+
+def auto_binned_axes(variables, auto_variables):
+    """Multi-dimensional ``variables`` with an axis in ``auto_variables``, as {variable: [axes]}.
+
+    make_ndhist needs the bins of every axis before the fill, the automatic ones are only chosen after it.
+    """
+    found = {}
+    for variable in variables:
+        axes = [axis for axis in axis_expressions(variable) if is_multidim(variable) and axis in auto_variables]
+        if axes:
+            found[variable] = axes
+    return found
+
+def make_ndhist(name, variable, title=None):
+    """THnD over the axes of a "y:x" variable, each binned as the 1D variable; THnSparseD for large grids."""
+    axes = axis_expressions(variable)
+    binnings = [get_binning(axis) for axis in axes]
+    cells = math.prod(nbins + 2 for nbins, _, _ in binnings)
+    hist_class = ROOT.THnSparseD if cells > SPARSE_CELLS else ROOT.THnD
+    h = hist_class(name, variable if title is None else title, len(axes),
+                   np.array([nbins for nbins, _, _ in binnings], dtype=np.int32),
+                   np.array([low for _, low, _ in binnings], dtype=np.float64),
+                   np.array([high for _, _, high in binnings], dtype=np.float64))
+    h.Sumw2()
+    for i, axis in enumerate(axes):
+        h.GetAxis(i).SetTitle(variableAxisTitleDictionary.get(axis, axis))
+    return h
+
+def same_binning(h, variable):
+    """Whether ``h`` has the binning ``variable`` is filled with now."""
+    if is_multidim(variable):
+        axes = [h.GetAxis(i) for i in range(h.GetNdimensions())]
+        return tuple((axis.GetNbins(), axis.GetXmin(), axis.GetXmax()) for axis in axes) == get_binning(variable)
+    return (h.GetNbinsX(), h.GetXaxis().GetXmin(), h.GetXaxis().GetXmax()) == get_binning(variable)
+
+def project(h, *dims):
+    """Projection of the THn ``h`` on ``dims``: a TH1D, or a TH2D with dims = (y, x) as in "y:x"."""
+    projection = h.Projection(*dims, "E")
+    projection.SetName(f"{h.GetName()}_proj{''.join(str(dim) for dim in dims)}")
+    projection.SetDirectory(0)
+    return projection
+
+def hist_integral(h):
+    ## THn of the multi-dimensional variables have no Integral(), their projections do
+    return h.Integral() if isinstance(h, ROOT.TH1) else project(h, 0).Integral()
+
+def make_hist(name, variable, title=None):
+    if is_multidim(variable):
+        return make_ndhist(name, variable, title)
+    title = variableAxisTitleDictionary.get(variable, variable) if title is None else title
+    if auto_binning.is_fine(variable):
+        return auto_binning.fine_hist(name, title)
+    bin_edges = auto_binning.edges(variable)
+    if bin_edges:
+        h = ROOT.TH1F(name, title, len(bin_edges) - 1, np.asarray(bin_edges, dtype=np.float64))
+    else:
+        nbins, low, high = get_binning(variable)
+        h = ROOT.TH1F(name, title, nbins, low, high)
+    h.Sumw2()
+    h.SetDirectory(0)
+    return h
+
+def fill_file(full_path, variables, selections, keys=None, opened=None, sample=None, part=(0, 1),
+              index=None, index_cuts=(), expressions=None):
+    """Open ``full_path`` once and fill every variable for every selection in a single pass over its Events tree.
+
+    ``selections`` maps a channel name to its full (weighted) selection string; ``keys`` restricts
+    the fill to some (channel, variable) pairs. ``opened`` is the (file, tree) pair of a file
+    already opened by read_ahead, it is closed here. ``part`` = (i, n) fills only the i-th of n equal
+    entry ranges. With an EntryIndex only the entries passing one of ``index_cuts`` (the unweighted
+    channel cuts) are visited, their list is built once for all the parts of the file.
+    ``expressions`` gives the (variable, selection) filled for the systematic variation keys
+    (channel, variable, variation), see systematics.py. A "y:x" variable fills a multi-dimensional
+    histogram (see make_ndhist) in the same pass. Returns a {key: TH1F or THn} dict, or None if
+    the file or tree could not be read.
+    """
+    if keys is None:
+        keys = [(channel, variable) for channel in selections for variable in variables]
+    filled = key_expressions(selections, keys, expressions)
+    if opened is None:
+        ## Only deserialize the baskets of the branches the expressions actually use
+        opened = open_events(full_path, fill_expressions(selections, keys, expressions))
+    if opened is None:
+        return None
+    root_file, tree = opened
+
+    stem = os.path.basename(full_path).replace('.root', '')
+    hists = {key: make_hist("_".join((stem,) + key[1:]), key[1]) for key in keys}
+
+    exprs = ROOT.std.vector('std::string')()
+    sels = ROOT.std.vector('std::string')()
+    targets = ROOT.std.vector('TH1*')()
+    axes_nd = ROOT.std.vector('std::vector<std::string>')()
+    sels_nd = ROOT.std.vector('std::string')()
+    targets_nd = ROOT.std.vector('THnBase*')()
+    for key, h in hists.items():
+        variable, selection = filled[key]
+        if is_multidim(key[1]):
+            axes = ROOT.std.vector('std::string')()
+            for axis in axis_expressions(variable):
+                axes.push_back(axis)
+            axes_nd.push_back(axes)
+            sels_nd.push_back(selection)
+            targets_nd.push_back(h)
+            continue
+        exprs.push_back(variable)
+        sels.push_back(selection)
+        targets.push_back(h)
+
+    nselected = ctypes.c_longlong(0)
+    entry_list = index.part_list(tree, full_path, index_cuts, part[1]) if index is not None and index_cuts else None
+    total = entry_list.GetN() if entry_list else tree.GetEntries()
+    first, last = total * part[0] // part[1], total * (part[0] + 1) // part[1]
+    start = time.perf_counter()
+    nentries = ROOT.FillMultiple(tree, exprs, sels, targets, nselected, first, last, entry_list or ROOT.nullptr,
+                                 axes_nd, sels_nd, targets_nd, keeps_files_open())
+    timing.record_file(full_path, sample, fill_time=time.perf_counter() - start, entries=max(nentries, 0),
+                       selected=nselected.value, bytes_read=bytes_read(root_file))
+    release(full_path, root_file, tree)
+    if nentries < 0:
+        print(f"Draw failed for {full_path}. variables={list(variables)} selections={selections}")
+        return None
+    return hists
+
+def key_expressions(selections, keys, expressions=None):
+    """{key: (variable expression, selection)}, ``expressions`` has those of the variation keys."""
+    expressions = expressions or {}
+    return {key: expressions.get(key) or (key[1], selections[key[0]]) for key in keys}
+
+def fill_expressions(selections, keys, expressions=None):
+    return sorted({text for pair in key_expressions(selections, keys, expressions).values() for text in pair})
+
+def hist_from_arrays(name, variable, sumw, sumw2, entries):
+    """TH1F from ROOT-numbered bin arrays (bin 0 underflow, last bin overflow), as made by uproot_engine."""
+    h = make_hist(name, variable)
+    for b in range(len(sumw)):
+        h.SetBinContent(b, sumw[b])
+        h.SetBinError(b, math.sqrt(sumw2[b]))
+    h.SetEntries(entries)
+    return h
+
+def fill_file_uproot(full_path, variables, selections, keys=None, threads=1, sample=None, expressions=None):
+    """Same as fill_file, but read with uproot and filled with NumPy (see uproot_engine.py)."""
+    import uproot_engine
+    binnings = {variable: get_binning(variable) for variable in variables}
+    filled = uproot_engine.fill_file(full_path, variables, selections, binnings, keys=keys, threads=threads, sample=sample,
+                                     expressions=expressions)
+    if filled is None:
+        return None
+    stem = os.path.basename(full_path).replace('.root', '')
+    return {key: hist_from_arrays("_".join((stem,) + key[1:]), key[1], *arrays) for key, arrays in filled.items()}
+
+def fill_samples(samples, variables, cuts, weight=None, engine="draw", cache=None, threads=1, read_ahead_depth=2, jobs=1,
+                 parts=1, index=None, variations=(), per_file=False, failed=None):
+    """Fill every variable in every channel for every sample in ``samples`` ({sample name: [full paths]}).
+
+    ``cuts`` maps a channel name to its parenthesised selection and ``weight`` is the event weight
+    expression (None for data). Returns {sample name: {(channel, variable): [histogram]}}, the total
+    of the sample: each file is added to it once filled (see accumulate) and then released, so the
+    memory does not grow with the number of files.
+    With a HistogramCache only the histograms missing from the cache are filled. The draw engine
+    opens up to ``read_ahead_depth`` files ahead of the one being filled (0 disables it). With
+    ``jobs`` > 1 the draw and uproot engines fill that many files at the same time, in threads (the
+    ``threads`` of the uproot engine are then shared between the files), and the draw engine
+    splits every file into ``parts`` entry ranges filled as separate jobs. With an EntryIndex the
+    draw engine only visits the entries passing the channel cuts. Each of the systematic
+    ``variations`` (see systematics.py) adds a (channel, variable, variation) histogram per plot,
+    filled in the same pass (draw and uproot engines).
+
+    The files of each sample are added in their order, cached or not. With ``per_file`` (draw and
+    uproot engines) the result is {sample name: {path: {key: histogram}}} instead. The files that
+    could not be filled are appended to the list ``failed`` and left out of the per-file results.
+    """
+    import systematics
+    selections = {channel: f"{weight} * {cut}" if weight else cut for channel, cut in cuts.items()}
+    plot_keys = [(channel, variable) for channel in cuts for variable in variables]
+    all_keys = plot_keys + systematics.variation_keys(plot_keys, variations)
+    expressions = systematics.variation_expressions(variations, cuts, weight, all_keys)
+    filled_by_key = key_expressions(selections, all_keys, expressions)
+
+    def lookup(paths):
+        specs = {key: filled_by_key[key] + (get_binning(key[1]),) for key in all_keys}
+        cached = cache.get(paths, specs) if cache else {}
+        return specs, cached, [key for key in all_keys if key not in cached]
+
+    def store(paths, specs, filled):
+        if cache:
+            cache.put(paths, {key: (h,) + specs[key] for key, h in filled.items()})
+
+    if engine == "rdf":
+        if variations:
+            raise ValueError("Systematic variations are filled by the draw and uproot engines only")
+        import rdf_engine
+        binnings = {variable: get_binning(variable) for variable in variables}
+        booked, cached_by_sample, specs_by_sample = {}, {}, {}
+        for name, paths in samples.items():
+            specs_by_sample[name], cached_by_sample[name], missing = lookup(paths)
+            if not missing:
+                print(f"All histograms of {name} found in cache")
+                continue
+            print(f"Booking {name} ({len(paths)} files)")
+            booked[name] = rdf_engine.book_sample(name, paths, variables, binnings, cuts, weight,
+                                                  titles=variableAxisTitleDictionary, keys=missing)
+        with timing.stage("rdf_event_loop"):
+            filled = rdf_engine.run_booked(booked)
+        results = {}
+        for name, paths in samples.items():
+            store(paths, specs_by_sample[name], filled.get(name, {}))
+            sample_hists = {**cached_by_sample[name], **filled.get(name, {})}
+            results[name] = {key: [h] for key, h in sample_hists.items()}
+        return results
+
+    plan = []
+    for name, paths in samples.items():
+        for full_path in paths:
+            specs, cached, missing = lookup([full_path])
+            plan.append((name, full_path, specs, cached, missing))
+            if not missing:
+                print(f"Processing {full_path} (cached)")
+    todo = [(name, full_path, specs, missing) for name, full_path, specs, cached, missing in plan if missing]
+    ## The uproot files filled at the same time share the cores instead of each using all of them
+    file_threads = max(threads // min(jobs, len(todo)), 1) if jobs > 1 and todo else threads
+
+    def fill_one(name, full_path, missing, opened=None, part=(0, 1)):
+        print(f"Processing {full_path}" + (f" (part {part[0] + 1}/{part[1]})" if part[1] > 1 else ""))
+        if engine == "uproot":
+            return fill_file_uproot(full_path, variables, selections, keys=missing, threads=file_threads, sample=name,
+                                    expressions=expressions)
+        ## No index for a channel without any cut, it would list every entry; a shifted cut selects other entries
+        index_cuts = [cut for channel in dict.fromkeys(key[0] for key in missing)
+                      for cut in [cuts[channel]] + systematics.shifted_cuts(variations, cuts[channel])]
+        if "(1)" in index_cuts:
+            index_cuts = []
+        return fill_file(full_path, variables, selections, keys=missing, opened=opened, sample=name, part=part,
+                         index=index, index_cuts=index_cuts, expressions=expressions)
+
+    def merge_parts(filled_parts):
+        ## Each part has its own histograms (no shared directory), they are only added here
+        if any(file_hists is None for file_hists in filled_parts):
+            return None
+        merged = filled_parts[0]
+        for file_hists in filled_parts[1:]:
+            for key, h in file_hists.items():
+                if auto_binning.is_fine(key[1]):
+                    ## The fine histograms of automatic binning extend their axis per part
+                    merged[key] = auto_binning.merge(merged[key], h)
+                else:
+                    merged[key].Add(h)
+        return merged
+
+    pool = opened_files = None
+    if jobs > 1 and (len(todo) > 1 or parts > 1):
+        ## One file or entry range per thread, the C++ event loop and the NumPy kernels run without the GIL
+        enable_thread_safety()
+        nparts = parts if engine != "uproot" else 1
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        pending, in_flight = iter(todo), collections.deque()
+        ## About two entry ranges per thread in flight: the files finished behind a slow one stay few,
+        ## the next ones are submitted as the results are merged
+        window = -(-2 * jobs // nparts)
+
+        def submit():
+            while len(in_flight) < window:
+                item = next(pending, None)
+                if item is None:
+                    return
+                name, full_path, _, missing = item
+                in_flight.append([pool.submit(fill_one, name, full_path, missing, None, (i, nparts)) for i in range(nparts)])
+
+        def in_order():
+            ## Dropping each file's futures once it is merged releases its histograms
+            submit()
+            while in_flight:
+                futures = in_flight.popleft()
+                submit()
+                yield merge_parts([future.result() for future in futures])
+
+        filled_files = in_order()
+    else:
+        if engine == "uproot":
+            opened_files = ((path, None) for _, path, _, _ in todo)
+        else:
+            ## Open the next files while the current one is filled
+            used = fill_expressions(selections, all_keys, expressions)
+            opened_files = read_ahead([path for _, path, _, _ in todo], used, read_ahead_depth)
+        filled_files = (fill_one(name, full_path, missing, opened)
+                        for (name, full_path, _, missing), (_, opened) in zip(todo, opened_files))
+
+    results = {name: {} for name in samples}
+    filled_files = iter(filled_files)
+    try:
+        for name, full_path, specs, cached, missing in plan:
+            file_hists = dict(cached)
+            if missing:
+                filled = next(filled_files)
+                if filled is None:
+                    if failed is not None:
+                        failed.append(full_path)
+                    if per_file:
+                        continue
+                else:
+                    store([full_path], specs, filled)
+                    file_hists.update(filled)
+            if per_file:
+                results[name][full_path] = file_hists
+                continue
+            for key, h in file_hists.items():
+                accumulate(results[name], key, h)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if opened_files is not None:
+            ## Releases the files read ahead of a failed fill
+            opened_files.close()
+    if per_file:
+        return results
+    return {name: {key: sample_hists.get(key, []) for key in all_keys} for name, sample_hists in results.items()}
+
+def split_updates(kind, samples, stored, plot_keys):
+    """Files left to fill, and stored histograms to start from, for an incremental update (--update).
+
+    ``stored`` is the (histograms, inputs) pair of hist_store.read_samples, ``kind`` one of
+    background, signal or data and ``plot_keys`` the keys filled, with the systematic variations. A sample starts from its stored histograms when every plot has one
+    with the current binning, filled from files that are all still in ``samples`` unchanged; only
+    its other files are filled. Any other sample is filled from scratch.
+    Returns ({sample: [paths to fill]}, {sample: {plot key: [stored histogram]}}).
+    """
+    from hist_store import input_states
+    stored_hists, stored_inputs = stored
+    todo, start = {}, {}
+    for sample, paths in samples.items():
+        states = input_states(paths)
+        known = [stored_inputs.get(plot_key, {}).get(kind, {}).get(sample) for plot_key in plot_keys]
+        hists = [stored_hists.get(plot_key, {}).get(kind, {}).get(sample) for plot_key in plot_keys]
+        reusable = (
+            known and known[0] is not None and all(k == known[0] for k in known)
+            and all(state in states for state in known[0])
+            and all(h and same_binning(h, key[1]) for h, key in zip(hists, plot_keys))
+        )
+        if reusable:
+            start[sample] = {plot_key: [h] for plot_key, h in zip(plot_keys, hists)}
+            paths = [path for path, state in zip(paths, states) if state not in known[0]]
+        if paths:
+            todo[sample] = paths
+    return todo, start
+
+def without_files(inputs, paths):
+    """``inputs`` ({kind: {sample: [paths]}}) without ``paths``, e.g. the files that could not be filled."""
+    paths = set(paths)
+    return {kind: {sample: [path for path in sample_paths if path not in paths] for sample, sample_paths in samples.items()}
+            for kind, samples in inputs.items()}
+
+def add_stored(results, start):
+    """Put the stored histograms of split_updates in front of the freshly filled ones."""
+    for sample, plot_hists in start.items():
+        sample_hists = results.setdefault(sample, {})
+        for plot_key, hlist in plot_hists.items():
+            sample_hists[plot_key] = hlist + sample_hists.get(plot_key, [])
+    return results
+
+## Output directory and file suffix of each plotting mode
+PLOT_OUTPUTS = {
+    "signals_only": ("Signal_only", "signals_only"),
+    "dataMC": ("DataMC", "DataMC"),
+    "SignalandBackground": ("SignalandBackground", "SignalandBackground"),
+}
+
+def plot_path(year, mode, channel, variable):
+    dirname, suffix = PLOT_OUTPUTS[mode]
+    return os.path.join(dirname, f"{year}_{channel}_{variable}_{suffix}.png")
+
+def multidim_name(variable):
+    ## "y:x" becomes y_vs_x in file names
+    return "_vs_".join(axis_expressions(variable)[::-1])
+
+def projection_names(variable):
+    """{axis: output name} of the 1D projections drawn for a multi-dimensional variable."""
+    return {axis: f"{multidim_name(variable)}_proj_{axis}" for axis in axis_expressions(variable)}
+
+def correlation_path(year, channel, variable, label):
+    return os.path.join("Correlations", f"{year}_{channel}_{multidim_name(variable)}_{label}.png")
+
+def plot_files(year, mode, channel, variable):
+    """Every file drawn for the plot of (channel, variable) in ``mode``."""
+    if not is_multidim(variable):
+        return [plot_path(year, mode, channel, variable)]
+    files = [plot_path(year, mode, channel, name) for name in projection_names(variable).values()]
+    if len(axis_expressions(variable)) == 2 and mode != "signals_only":
+        files.append(correlation_path(year, channel, variable, "Background"))
+    return files
+
+def set_channel_header(legend, channel):
+    if channel in CHANNEL_HEADERS:
+        legend.SetHeader(CHANNEL_HEADERS[channel], "C")
+    else:
+        print ("Enter a valid channel")
+
+def style_signals(signals):
+    for (sample, label, color), signal in zip(SIGNAL_POINTS, signals):
+        signal.SetLineColor(color)
+        signal.SetLineWidth(2)
+
+def make_error_band(summary):
+    ## Statistical errors, plus the systematic variations in quadrature, as computed by histogram.summarize
+    total = summary.total
+    n = len(total.edges) - 1
+    edges = np.asarray(total.edges, dtype=np.float64)
+    half_widths = np.diff(edges) / 2
+    bkg_errors = ROOT.TGraphAsymmErrors(n, edges[:-1] + half_widths, np.asarray(total.values[1:-1], dtype=np.float64),
+                                        half_widths, half_widths, summary.band_down[1:-1].copy(), summary.band_up[1:-1].copy())
+    bkg_errors.SetFillStyle(3008)
+    bkg_errors.SetFillColor(ROOT.TColor.GetColor("#545252"))
+    return bkg_errors
+
+def summarize_plot(hists, data=None, variations=None):
+    return histogram.summarize({"plot": (hists, data, variations or {})}, STACKED_GROUPS)["plot"]
+
+def build_background_stack(hists):
+    ## styling for category-sum histograms
+    for key in BACKGROUND_GROUPS:
+        hists[key].SetLineColor(ROOT.TColor.GetColor(GROUP_COLORS[key]))
+        hists[key].SetFillColor(ROOT.TColor.GetColor(GROUP_COLORS[key]))
+        print(f"{key} background Integral is:")
+        print(hists[key].Integral(0, hists[key].GetNbinsX()+1))
 
-
-    hists = {}
-    integral_values = []
     hist_stack = ROOT.THStack("hist_stack", "")
+    for key in STACKED_GROUPS:
+        hist_stack.Add(hists[key])
+    return hist_stack
 
-    hists['DiBoson'] = ROOT.TH1F("DiBoson", "DiBoson",  int(bin_values[0]), bin_values[1], bin_values[2])
-    hists['DiBoson'].Sumw2()
-    hists['DiBoson'].SetDirectory(0)
-    
-    hists['STop'] = ROOT.TH1F("STop", "STop", int(bin_values[0]), bin_values[1], bin_values[2])
-    hists['STop'].Sumw2()
-    hists['STop'].SetDirectory(0)
-    
-    hists['TTbar'] = ROOT.TH1F("TTbar","TTbar", int(bin_values[0]), bin_values[1], bin_values[2])
-    hists['TTbar'].Sumw2()
-    hists['TTbar'].SetDirectory(0)
-    
-    hists['QCD'] = ROOT.TH1F("QCD", "QCD", int(bin_values[0]), bin_values[1], bin_values[2])
-    hists['QCD'].Sumw2()
-    hists['QCD'].SetDirectory(0)
-    
-    hists['WJets'] = ROOT.TH1F("WJets", "WJets", int(bin_values[0]), bin_values[1], bin_values[2])
-    hists['WJets'].Sumw2()
-    hists['WJets'].SetDirectory(0)
-
-    hists['Drell-Yan'] = ROOT.TH1F("Drell-Yan","Drell-Yan",int(bin_values[0]), bin_values[1], bin_values[2])
-    hists['Drell-Yan'].Sumw2()
-    hists['Drell-Yan'].SetDirectory(0)
-
-    hists['Other'] = ROOT.TH1F("Other", "Other", int(bin_values[0]), bin_values[1], bin_values[2])
-    hists['Other'].Sumw2()
-    hists['Other'].SetDirectory(0)
 
+def plot_signals_only(args, channel, variable, signals, output_name=None):
+    nbins, low, high = get_binning(variable)
     hist_title = variableAxisTitleDictionary.get(variable, variable)
-    
-    cut_w  = create_cut_string(weights, base_cut, additional_cuts_o, is_observed=False)   
-    cut_un = create_cut_string("",      base_cut, additional_cuts_o, is_observed=True)   
-    print(f"Weighted selection:   {cut_w}")
-    print(f"Unweighted selection: {cut_un}")
 
-    ## We fill background histograms only when we are not plotting Signals Only Plots.
-    if not args.signals_only:
-        hists_by_proc   = {} 
-        
-        for category, sample_type in Backgrounds.items():
-            for proc_name, proc_info in sample_type.items():                
-                hists_by_proc.setdefault(proc_name, [])
-                
-                for path in proc_info["files"]:
-                    full_path = get_full_path(redirector_MC, path)
-                    print(f"Processing {full_path}")
-
-                    root_file = ROOT.TFile.Open(full_path, 'READ')
-                    if not root_file or root_file.IsZombie():
-                        print(f"Could not open {full_path}")
-                        continue
-                    tree = root_file.Get("Events")
-                    if not tree:
-                        print(f"No Events tree in {full_path}")
-                        root_file.Close()
-                        continue
-                    hist_name = f"{os.path.basename(path.replace('.root', ''))}_{variable}"
-                    h = ROOT.TH1F(hist_name, hist_title, int(bin_values[0]), bin_values[1], bin_values[2])
-                    h.SetDirectory(ROOT.gDirectory)
-                    h.Reset()
-                    tree.Draw(f"{variable} >> {hist_name}", cut_w)
-                    h.SetDirectory(0)
-                    hists_by_proc[proc_name].append(h)
-                    root_file.Close()
-                    print(f"Histogram bins and ranges are {int(bin_values[0]), bin_values[1], bin_values[2]}")
-                    #print(f"{hist_name} has entries={h.GetEntries()} and integral={h.Integral(0, h.GetNbinsX()+1)} \n")
-
-        for proc_name, hlist in hists_by_proc.items():
-            for h in hlist:
-                print(f"[DEBUG] {proc_name}: {h.GetName()} integral={h.Integral()}")
-                key = group_key_from_name(h.GetName())
-                print(f"[DEBUG] Grouped as: {key}")
-                if key not in hists:
-                    key = "Other"
-                hists[key].Add(h)
-        
-        # print("\n--- Group integrals after filling ---")
-        # for key, hist in hists.items():
-        #     print(f"{key:12} : {hist.Integral(0, hist.GetNbinsX()+1):.6f}")
-
-        # styling for category-sum histograms
-        hists["DiBoson"].SetLineColor(ROOT.TColor.GetColor("#9d99bd"))
-        hists["DiBoson"].SetFillColor(ROOT.TColor.GetColor("#9d99bd"))
-        print("Diboson background Integral is:")
-        print(hists["DiBoson"].Integral(0, hists["DiBoson"].GetNbinsX()+1))
-
-        hists["STop"].SetLineColor(ROOT.TColor.GetColor("#a5e7fa"))
-        hists["STop"].SetFillColor(ROOT.TColor.GetColor("#a5e7fa"))
-        print("STop background Integral is:")
-        print(hists["STop"].Integral(0, hists["STop"].GetNbinsX()+1))
-
-        hists["TTbar"].SetLineColor(ROOT.TColor.GetColor("#92cfe0"))
-        hists["TTbar"].SetFillColor(ROOT.TColor.GetColor("#92cfe0"))
-        print("TTbar background Integral is:")
-        print(hists["TTbar"].Integral(0, hists["TTbar"].GetNbinsX()+1))
-
-        hists["QCD"].SetLineColor(ROOT.TColor.GetColor("#f29b6f"))
-        hists["QCD"].SetFillColor(ROOT.TColor.GetColor("#f29b6f"))
-        print("QCD background Integral is:")
-        print(hists["QCD"].Integral(0, hists["QCD"].GetNbinsX()+1))
-
-        hists["WJets"].SetLineColor(ROOT.TColor.GetColor("#fcd068"))
-        hists["WJets"].SetFillColor(ROOT.TColor.GetColor("#fcd068"))
-        print("WJets background Integral is:")  
-        print(hists["WJets"].Integral(0, hists["WJets"].GetNbinsX()+1))
-
-        hists["Drell-Yan"].SetLineColor(ROOT.TColor.GetColor("#d8ed79"))
-        hists["Drell-Yan"].SetFillColor(ROOT.TColor.GetColor("#d8ed79"))
-        print("Drell-Yan background Integral is:")  
-        print(hists["Drell-Yan"].Integral(0, hists["Drell-Yan"].GetNbinsX()+1))
-
-        hists["Other"].SetLineColor(ROOT.TColor.GetColor("#ffff00"))
-        hists["Other"].SetFillColor(ROOT.TColor.GetColor("#ffff00"))
-        print("Other background Integral is:")  
-        print(hists["Other"].Integral(0, hists["Other"].GetNbinsX()+1))
-
-        backgrounds_sum = (
-            hists["DiBoson"].Integral(0, hists["DiBoson"].GetNbinsX()+1)
-            + hists["STop"].Integral(0, hists["STop"].GetNbinsX()+1)
-            + hists["TTbar"].Integral(0, hists["TTbar"].GetNbinsX()+1)
-            + hists["QCD"].Integral(0, hists["QCD"].GetNbinsX()+1)
-            + hists["WJets"].Integral(0, hists["WJets"].GetNbinsX()+1)
-            + hists["Drell-Yan"].Integral(0, hists["Drell-Yan"].GetNbinsX()+1)
-        )
-        # val, err = get_integral_with_error(backgrounds_sum)
-        # print(f"Total background integral = {format_scientific(val, err)}")
-        #print(f"Sum of background Integrals is: {backgrounds_sum}")
-        hist_stack.Add(hists["DiBoson"])
-        hist_stack.Add(hists["STop"])
-        hist_stack.Add(hists["TTbar"])
-        hist_stack.Add(hists["QCD"])
-        hist_stack.Add(hists["WJets"])
-        hist_stack.Add(hists["Drell-Yan"])
-        
-    
-    ## Signals are there in all the plots, we are adding them outside any if loops
+    canvas_sig = ROOT.TCanvas("canvas_sig", "Signal Only", 1600, 900)
+    canvas_sig.SetRightMargin(0.28)
+    canvas_sig.SetLeftMargin(0.1)
+    canvas_sig.SetBottomMargin(0.1)
+
+    frame = ROOT.TH1F("frame", "", nbins, low, high)
+    frame.SetDirectory(0)
+    frame.SetStats(0)
+    frame.GetXaxis().SetTitle(hist_title)
+    frame.GetYaxis().SetTitle("Events")
+
+    frame.GetXaxis().SetTitleSize(0.05)
+    frame.GetYaxis().SetTitleSize(0.05)
+
+    frame.GetYaxis().SetLabelSize(0.04)
+    frame.GetXaxis().SetLabelSize(0.04)
+
+    frame.GetXaxis().SetTitleOffset(1)
+    frame.GetYaxis().SetTitleOffset(0.8)
+
+    if args.log_scale:
+        canvas_sig.SetLogy()
+        frame.SetMinimum(1e-1)
+
+    frame.SetMaximum(1.2*max([s.GetMaximum() for s in signals] + [1.0]))
+    frame.Draw("hist")
+
+    style_signals(signals)
+    for signal in signals:
+        signal.Draw("hist SAME")
+
+    theLegend = ROOT.TLegend(0.73, 0.20, 0.96, 0.90, "", "brNDC")
+    set_channel_header(theLegend, channel)
+
+    theLegend.SetNColumns(1)
+    theLegend.SetLineWidth(0)
+    theLegend.SetLineStyle(1)
+    theLegend.SetFillStyle(1001)
+    theLegend.SetFillColor(0)
+    theLegend.SetMargin(0.15)
+    theLegend.SetTextSize(0.035)
+    theLegend.SetBorderSize(0)
+    theLegend.SetTextFont(42)
+
+    for (sample, label, color), signal in zip(SIGNAL_POINTS, signals):
+        theLegend.AddEntry(signal, label, "f")
+    theLegend.Draw()
+
+    cmsLatex = ROOT.TLatex()
+    cmsLatex.SetNDC(True)
+    cmsLatex.SetTextFont(61)
+    cmsLatex.SetTextSize(0.05)
+    cmsLatex.DrawLatex(0.10, 0.91, "CMS")
+    cmsLatex.SetTextFont(52)
+    cmsLatex.SetTextSize(0.04)
+    cmsLatex.DrawLatex(0.16, 0.91, "Preliminary")
+
+    with timing.stage("save"):
+        canvas_sig.SaveAs(plot_path(args.year, "signals_only", channel, output_name or variable))
+
+
+def plot_data_mc(args, channel, variable, hists, hist_stack, signals, data, variations=None, output_name=None,
+                 summary=None):
+    nbins, low, high = get_binning(variable)
+    hist_title = variableAxisTitleDictionary.get(variable, variable)
 
-    cut_sig = create_cut_string(weights, base_cut, additional_cuts_o, is_observed=False)
-
-    # Signal 1
-    sig_info = Signals["GluGlutoRadiontoHHto2B2Tau_M-1000"]
-    sig_file = sig_info["files"][0]
-    hist_name_1 = f"{os.path.basename(sig_file.replace('.root', ''))}_{variable}"
-    root_file_1 = ROOT.TFile.Open(os.path.join(redirector_MC, sig_file), 'READ')
-    tree_1 = root_file_1.Get("Events")
-    signal_1 = ROOT.TH1F(hist_name_1, hist_title, int(bin_values[0]), bin_values[1], bin_values[2])
-    
-    ROOT.gDirectory.Delete(f"{hist_name_1};*")   
-    signal_1.SetDirectory(ROOT.gDirectory)
-    tree_1.Draw(f"{variable} >> {hist_name_1}", cut_sig)
-    signal_1.SetDirectory(0)
-    print(f"Integral of {hist_name_1} is {signal_1.Integral(0, signal_1.GetNbinsX()+1)}")
-    print(f" - Entries: {signal_1.GetEntries()} | Mean: {signal_1.GetMean():.4f} | Std Dev: {signal_1.GetStdDev():.4f}")
-    root_file_1.Close()
-
-    # Signal 2
-    sig_info = Signals["GluGlutoRadiontoHHto2B2Tau_M-2000"]
-    sig_file = sig_info["files"][0]
-    hist_name_2 = f"{os.path.basename(sig_file.replace('.root', ''))}_{variable}"
-    root_file_2 = ROOT.TFile.Open(os.path.join(redirector_MC, sig_file), 'READ')
-    tree_2 = root_file_2.Get("Events")
-    signal_2 = ROOT.TH1F(hist_name_2, hist_title, int(bin_values[0]), bin_values[1], bin_values[2])
-    ROOT.gDirectory.Delete(f"{hist_name_2};*")
-    signal_2.SetDirectory(ROOT.gDirectory)
-    tree_2.Draw(f"{variable} >> {hist_name_2}", cut_sig)
-    signal_2.SetDirectory(0)
-    print(f"Integral of {hist_name_2} is {signal_2.Integral(0, signal_2.GetNbinsX()+1)}")
-    print(f" - Entries: {signal_2.GetEntries()} | Mean: {signal_2.GetMean():.4f} | Std Dev: {signal_2.GetStdDev():.4f}")
-    root_file_2.Close()
-
-    # Signal 3
-    sig_info = Signals["GluGlutoRadiontoHHto2B2Tau_M-3000"]
-    sig_file = sig_info["files"][0]
-    hist_name_3 = f"{os.path.basename(sig_file.replace('.root', ''))}_{variable}"
-    root_file_3 = ROOT.TFile.Open(os.path.join(redirector_MC, sig_file), 'READ')
-    tree_3 = root_file_3.Get("Events")
-    signal_3 = ROOT.TH1F(hist_name_3, hist_title, int(bin_values[0]), bin_values[1], bin_values[2])
-    ROOT.gDirectory.Delete(f"{hist_name_3};*")
-    signal_3.SetDirectory(ROOT.gDirectory)
-    tree_3.Draw(f"{variable} >> {hist_name_3}", cut_sig)
-    signal_3.SetDirectory(0)
-    print(f"Integral of {hist_name_3} is {signal_3.Integral(0, signal_3.GetNbinsX()+1)}")
-    print(f" - Entries: {signal_3.GetEntries()} | Mean: {signal_3.GetMean():.4f} | Std Dev: {signal_3.GetStdDev():.4f}")
-    root_file_3.Close()
-
-    # Signal 4
-    sig_info = Signals["GluGlutoRadiontoHHto2B2Tau_M-4000"]
-    sig_file = sig_info["files"][0]
-    hist_name_4 = f"{os.path.basename(sig_file.replace('.root', ''))}_{variable}"
-    root_file_4 = ROOT.TFile.Open(os.path.join(redirector_MC, sig_file), 'READ')
-    tree_4 = root_file_4.Get("Events")
-    signal_4 = ROOT.TH1F(hist_name_4, hist_title, int(bin_values[0]), bin_values[1], bin_values[2])
-    ROOT.gDirectory.Delete(f"{hist_name_4};*")
-    signal_4.SetDirectory(ROOT.gDirectory)
-    tree_4.Draw(f"{variable} >> {hist_name_4}", cut_sig)
-    signal_4.SetDirectory(0)
-    print(f"Integral of {hist_name_4} is {signal_4.Integral(0, signal_4.GetNbinsX()+1)}")
-    print(f" - Entries: {signal_4.GetEntries()} | Mean: {signal_4.GetMean():.4f} | Std Dev: {signal_4.GetStdDev():.4f}")
-    root_file_4.Close()
-
-    ## Signals Only Plotting
+    canvas_dataMC = ROOT.TCanvas("canvas_dataMC", "Data + MC", 1600, 1000)
+    canvas_dataMC.Divide(1, 2)
+
+    pad1 = canvas_dataMC.cd(1)
+    pad1.SetPad(0.0, 0.3, 1.0, 1.0)
+    pad1.SetBottomMargin(0.01)
+    pad1.SetRightMargin(0.28)
+    pad1.SetLeftMargin(0.1)
+
+    theLegend = ROOT.TLegend(0.73, 0, 0.97, 0.9, "", "brNDC")
+    if channel in CHANNEL_HEADERS:
+        theLegend.SetHeader(CHANNEL_HEADERS[channel], "C")
+
+    theLegend.SetNColumns(1)
+    theLegend.SetLineWidth(0)
+    theLegend.SetLineStyle(1)
+    theLegend.SetFillStyle(1001)
+    theLegend.SetFillColor(0)
+    theLegend.SetMargin(0.15)
+    theLegend.SetTextSize(0.037)
+    theLegend.SetBorderSize(0)
+    theLegend.SetTextFont(42)
+
+    # Total background, error band and ratio
+    if summary is None:
+        summary = summarize_plot(hists, data, variations)
+    bkg_errors = make_error_band(summary)
+
+    val, err = summary.integral
+    print(f"Total background integral = {format_scientific(val, err)}")
+
+    # Signals
+    style_signals(signals)
+
+    # Data
+    data.SetMarkerStyle(20)
+    data.SetLineColor(ROOT.kBlack)
+    val, err = summary.data_integral
+    print(f"Total Data integral = {format_scientific(val, err)}")
+
+    max_bkg = summary.maximum
+    max_sig = max(s.GetMaximum() for s in signals)
+    max_data = data.GetMaximum() if data.GetMaximum() > 0 else 0
+
+    pad1.cd()
+    hist_stack.SetMaximum(max(max_bkg, max_sig, max_data) * 1.8)
+    hist_stack.Draw("hist")
+    hist_stack.GetXaxis().SetTitle("")
+    hist_stack.GetXaxis().SetLabelSize(0)
+    hist_stack.GetYaxis().SetTitle("Events")
+    hist_stack.GetYaxis().SetTitleSize(0.05)
+    hist_stack.GetYaxis().SetLabelSize(0.04)
+    hist_stack.GetYaxis().SetTitleOffset(0.8)
+    #pad1.Update()
+    hist_stack.Draw("hist same")
+
+    if args.log_scale:
+        pad1.SetLogy()
+        hist_stack.SetMinimum(1e-1)
+
+    pad1.Update()
+
+    bkg_errors.Draw("E2 SAME")
+    for signal in signals:
+        signal.Draw("hist SAME")
+    data.Draw("ep SAME")
+
+    pad1.RedrawAxis()
+
+    for key in STACKED_GROUPS:
+        theLegend.AddEntry(hists[key], key, "f")
+    for (sample, label, color), signal in zip(SIGNAL_POINTS, signals):
+        theLegend.AddEntry(signal, label, "f")
+    theLegend.AddEntry(data, "Observed", "lep")
+    if variations:
+        theLegend.AddEntry(bkg_errors, "Stat. #oplus syst. unc.", "f")
+    theLegend.Draw()
+
+    # CMS label
+    cmsLatex = ROOT.TLatex()
+    cmsLatex.SetNDC(True)
+    cmsLatex.SetTextFont(61)
+    cmsLatex.SetTextSize(0.05)
+    cmsLatex.DrawLatex(0.10, 0.91, "CMS")
+    cmsLatex.SetTextFont(52)
+    cmsLatex.SetTextSize(0.04)
+    cmsLatex.DrawLatex(0.15, 0.91, "Preliminary")
+    if args.year == '2024':
+        cmsLatex.SetTextAlign(31)
+        cmsLatex.SetTextFont(42)
+        cmsLatex.DrawLatex(0.72,0.91,"109.08 fb^{-1}, 13.6 TeV (2024)")
+
+    pad2 = canvas_dataMC.cd(2)
+    pad2.SetPad(0.0, 0.0, 1.0, 0.3)
+    pad1.SetLeftMargin(0.1)
+    pad2.SetRightMargin(0.28)
+    pad2.SetTopMargin(0.04)
+    pad2.SetBottomMargin(0.35)
+    pad2.SetGridy()
+
+    ratio = histogram.to_th1(summary.ratio, "Data_MC_Ratio")
+    ratio.SetLineColor(ROOT.kBlack)
+    ratio.SetStats(0)
+    ratio.SetMarkerStyle(20)
+    ratio.SetMarkerSize(0.9)
+
+    ratio.GetXaxis().SetTitleSize(0.14)
+    ratio.GetXaxis().SetLabelSize(0.10)
+    ratio.GetXaxis().SetLabelOffset(0.04)
+    ratio.GetXaxis().SetTitle(hist_title)
+    ratio.GetYaxis().SetTitle("Data / MC")
+    ratio.GetYaxis().SetTitleSize(0.12)
+    ratio.GetYaxis().SetTitleOffset(0.3)
+    ratio.GetYaxis().SetLabelSize(0.10)
+    ratio.GetYaxis().SetNdivisions(505)
+    ratio.GetYaxis().SetRangeUser(0, 2)
+    ratio.Draw("ep")
+
+    line = ROOT.TLine(low, 1.0, high, 1.0)
+    line.SetLineColor(ROOT.kRed)
+    line.SetLineStyle(2)
+    line.SetLineWidth(2)
+    line.Draw("same")
+
+    with timing.stage("save"):
+        canvas_dataMC.SaveAs(plot_path(args.year, "dataMC", channel, output_name or variable))
+
+    data_val, data_err = summary.data_integral
+    mc_val, mc_err     = summary.integral
+
+    if mc_val > 0:
+        ratio_val = data_val / mc_val
+        ratio_err = ratio_val * math.sqrt(
+            (data_err / data_val) ** 2 + (mc_err / mc_val) ** 2
+        ) if data_val > 0 else 0.0
+    else:
+        ratio_val, ratio_err = float("nan"), 0.0
+    print("\n")
+    print(f"Data Integral : {format_scientific(data_val, data_err)}")
+    print(f"MC Integral   : {format_scientific(mc_val, mc_err)}")
+    print(f"Data/MC Ratio : {format_scientific(ratio_val, ratio_err)}")
+
+
+def plot_signal_background(args, channel, variable, hists, hist_stack, signals, variations=None, output_name=None,
+                           summary=None):
+    canvas_sb = ROOT.TCanvas("canvas_sb", "Signal + Backgrounds", 1600, 800)
+    canvas_sb.SetRightMargin(0.30)
+
+    theLegend = ROOT.TLegend(0.80, 0.20, 0.98, 0.90, "", "brNDC")
+    set_channel_header(theLegend, channel)
+
+    theLegend.SetTextSize(0.035)
+    theLegend.SetBorderSize(0)
+    theLegend.SetFillStyle(0)
+    theLegend.SetTextFont(42)
+
+    style_signals(signals)
+
+    if summary is None:
+        summary = summarize_plot(hists, None, variations)
+    bkg_errors = make_error_band(summary)
+    bkg_errors.SetLineColor(0)
+    bkg_errors.SetMarkerStyle(0)
+    bkg_errors.SetLineWidth(0)
+
+    max_bkg = summary.maximum
+    max_sig = max(s.GetMaximum() for s in signals)
+
+    canvas_sb.cd()
+    hist_stack.SetMaximum(1.2 * max(max_bkg, max_sig))
+    hist_stack.Draw("hist")
+    canvas_sb.Update()
+    hist_stack.Draw("hist same")
+    if args.log_scale:
+        canvas_sb.SetLogy()
+        hist_stack.SetMinimum(1e-1)
+    canvas_sb.Update()
+
+    for signal in signals:
+        signal.Draw("hist SAME")
+    bkg_errors.Draw("E2 SAME")
+
+    for key in STACKED_GROUPS:
+        theLegend.AddEntry(hists[key], key, "f")
+
+    for (sample, label, color), signal in zip(SIGNAL_POINTS, signals):
+        theLegend.AddEntry(signal, label, "f")
+    if variations:
+        theLegend.AddEntry(bkg_errors, "Stat. #oplus syst. unc.", "f")
+
+
+    cmsLatex = ROOT.TLatex()
+    cmsLatex.SetNDC(True)
+    cmsLatex.SetTextFont(61)
+    cmsLatex.SetTextSize(0.05)
+    cmsLatex.DrawLatex(0.10, 0.92, "CMS")
+    cmsLatex.SetTextFont(52)
+    cmsLatex.SetTextSize(0.04)
+    cmsLatex.DrawLatex(0.18, 0.92, "Preliminary")
+
+    cmsLatex.SetTextAlign(31)
+    cmsLatex.SetTextFont(42)
+    if args.year == '2024':
+        lumiText = '109.08 fb^{-1}, 13.6 TeV (2024)'
+    cmsLatex.DrawLatex(0.700,0.91,lumiText)
+
+    theLegend.SetNColumns(1)
+    theLegend.SetLineWidth(0)
+    theLegend.SetLineStyle(1)
+    theLegend.SetFillStyle(1001)
+    theLegend.SetFillColor(0)
+    theLegend.SetMargin(0.2)
+    theLegend.SetTextSize(0.035)
+    theLegend.SetBorderSize(0)
+    theLegend.SetTextFont(42)
+    theLegend.Draw()
+
+    with timing.stage("save"):
+        canvas_sb.SaveAs(plot_path(args.year, "SignalandBackground", channel, output_name or variable))
+
+
+def make_channel_cuts(channels, base_cut, additional_cuts):
+    """{channel: parenthesised selection} with each channel's own selection added to the shared cuts."""
+    cuts = {}
+    for channel in channels:
+        channel_cuts = [CHANNEL_CUTS[channel]] if CHANNEL_CUTS[channel] else []
+        cuts[channel] = create_cut_string("", base_cut, channel_cuts + list(additional_cuts), is_observed=True)
+    return cuts
+
+def background_samples(mc_dir=redirector_MC):
+    ## The active sample catalog (--catalog) has the files already resolved
+    catalog = sample_catalog.active()
+    if catalog is not None:
+        return catalog.samples("background")
+    return {
+        proc_name: [get_full_path(mc_dir, path) for path in proc_info["files"]]
+        for category, sample_type in Backgrounds.items()
+        for proc_name, proc_info in sample_type.items()
+    }
+
+def signal_samples(mc_dir=redirector_MC):
+    catalog = sample_catalog.active()
+    if catalog is not None:
+        files = catalog.samples("signal")
+        return {sample: files.get(sample, []) for sample, label, color in SIGNAL_POINTS}
+    return {
+        sample: [get_full_path(mc_dir, path) for path in Signals[sample]["files"]]
+        for sample, label, color in SIGNAL_POINTS
+    }
+
+def data_samples(data_dir=None):
+    ## With data_dir the era files are looked up by name there, e.g. for local copies
+    catalog = sample_catalog.active()
+    if catalog is not None:
+        return catalog.samples("data")
+    if data_dir is None:
+        return {category: sample_type["files"] for category, sample_type in observed.items()}
+    return {
+        category: [os.path.join(data_dir, os.path.basename(path)) for path in sample_type["files"]]
+        for category, sample_type in observed.items()
+    }
+
+def group_backgrounds(hists_by_proc, plot_keys):
+    """Sum the per-file/per-sample background histograms into one set of group histograms per plot."""
+    hists = {(channel, variable): {key: make_hist(key, variable, key) for key in BACKGROUND_GROUPS} for channel, variable in plot_keys}
+    for plot_key in plot_keys:
+        for proc_name, proc_hists in hists_by_proc.items():
+            key = sample_group(proc_name)
+            for h in proc_hists.get(plot_key, []):
+                print(f"[DEBUG] {proc_name}: {h.GetName()} integral={hist_integral(h)}, grouped as {key}")
+                hists[plot_key][key].Add(h)
+    return hists
+
+def background_variations(hists_by_proc, plot_keys, variations):
+    """{plot key: {variation name: total stacked background}} of the systematic variations."""
+    totals = {}
+    for channel, variable in plot_keys:
+        totals[(channel, variable)] = {}
+        for variation in variations:
+            total = make_hist(f"total_bkg_{variation.name}", variable)
+            for proc_name, proc_hists in hists_by_proc.items():
+                if sample_group(proc_name) not in STACKED_GROUPS:
+                    continue
+                for h in proc_hists.get((channel, variable, variation.name), []):
+                    total.Add(h)
+            totals[(channel, variable)][variation.name] = total
+    return totals
+
+def collect_signals(sig_hists, plot_keys):
+    """{plot key: [one histogram per SIGNAL_POINTS entry]}, empty histograms for missing samples."""
+    signals = {plot_key: [] for plot_key in plot_keys}
+    for sample, label, color in SIGNAL_POINTS:
+        for channel, variable in plot_keys:
+            filled = sig_hists.get(sample, {}).get((channel, variable), [])
+            signal = make_hist(f"{sample}_{variable}", variable)
+            for h in filled:
+                signal.Add(h)
+            if is_multidim(variable):
+                print(f"[{channel}] Integral of {signal.GetName()} is {hist_integral(signal)}, entries {signal.GetEntries()}")
+                signals[(channel, variable)].append(signal)
+                continue
+            print(f"[{channel}] Integral of {signal.GetName()} is {signal.Integral(0, signal.GetNbinsX()+1)}")
+            print(f" - Entries: {signal.GetEntries()} | Mean: {signal.GetMean():.4f} | Std Dev: {signal.GetStdDev():.4f}")
+            signals[(channel, variable)].append(signal)
+    return signals
+
+def sum_data(data_hists, plot_keys):
+    data = {(channel, variable): make_hist("Observed_Data", variable, "") for channel, variable in plot_keys}
+    for era, era_hists in data_hists.items():
+        for plot_key, hlist in era_hists.items():
+            if plot_key not in data:
+                continue
+            for htemp in hlist:
+                data[plot_key].Add(htemp)
+    return data
+
+def render_plot(args, channel, variable, group_hists, signals, data=None, variations=None, output_name=None,
+                summary=None):
+    """Draw and save the plot of one (channel, variable) in the mode selected by ``args``.
+
+    ``variations`` are the total backgrounds of the systematic variations, see background_variations.
+    A multi-dimensional variable is drawn as the 1D plot of each axis projection, plus COLZ maps
+    for a two-dimensional one. ``output_name`` replaces the variable in the file name. ``summary``
+    is the plot's histogram.summarize result when it was computed with the other plots.
+    """
+    if is_multidim(variable):
+        for i, (axis, name) in enumerate(projection_names(variable).items()):
+            render_plot(args, channel, axis,
+                        {group: project(h, i) for group, h in group_hists.items()},
+                        [project(signal, i) for signal in signals],
+                        project(data, i) if data is not None else None,
+                        {variation: project(h, i) for variation, h in (variations or {}).items()},
+                        output_name=name)
+        if len(axis_expressions(variable)) == 2 and not args.signals_only:
+            plot_correlations(args, channel, variable, group_hists, data if args.dataMC else None)
+        return
 
     if args.signals_only:
-        canvas_sig = ROOT.TCanvas("canvas_sig", "Signal Only", 1600, 900)
-        canvas_sig.SetRightMargin(0.28)
-        canvas_sig.SetLeftMargin(0.1)
-        canvas_sig.SetBottomMargin(0.1)
-
-        frame = ROOT.TH1F("frame", "", int(bin_values[0]), bin_values[1], bin_values[2])
-        frame.SetDirectory(0)
-        frame.SetStats(0)
-        frame.GetXaxis().SetTitle(hist_title)
-        frame.GetYaxis().SetTitle("Events")
-        
-        frame.GetXaxis().SetTitleSize(0.05)      
-        frame.GetYaxis().SetTitleSize(0.05)
-
-        frame.GetYaxis().SetLabelSize(0.04)
-        frame.GetXaxis().SetLabelSize(0.04)
-
-        frame.GetXaxis().SetTitleOffset(1)     
-        frame.GetYaxis().SetTitleOffset(0.8)
-
-        if log_scale:
-            canvas_sig.SetLogy()
-            frame.SetMinimum(1e-1)
-
-        frame.SetMaximum(1.2*max(signal_1.GetMaximum(), signal_2.GetMaximum(), signal_3.GetMaximum(), signal_4.GetMaximum(), 1.0))
-        frame.Draw("hist")
-
-        signal_1.SetLineColor(ROOT.kRed)
-        signal_1.SetLineWidth(2)
-        signal_2.SetLineColor(ROOT.kBlue+2)
-        signal_2.SetLineWidth(2)
-        signal_3.SetLineColor(ROOT.kViolet+3)
-        signal_3.SetLineWidth(2)
-        signal_4.SetLineColor(ROOT.kCyan+4)
-        signal_4.SetLineWidth(2)
-        
-        signal_1.Draw("hist SAME")
-        signal_2.Draw("hist SAME")
-        signal_3.Draw("hist SAME")
-        signal_4.Draw("hist SAME")
-
-        theLegend = ROOT.TLegend(0.73, 0.20, 0.96, 0.90, "", "brNDC")
-        if (args.Channel == "tt"):
-            theLegend.SetHeader("#tau-#tau Channel","C")
-        elif (args.Channel == "et"):
-            theLegend.SetHeader("e-#tau Channel","C")
-        elif (args.Channel == "mt"):
-            theLegend.SetHeader("#mu-#tau Channel","C")
-        elif (args.Channel == "lt"):
-            theLegend.SetHeader("l-#tau Channel","C")
-        elif (args.Channel == "all"):
-            theLegend.SetHeader("all Channels","C")
-        else:
-            print ("Enter a valid channel")
+        plot_signals_only(args, channel, variable, signals, output_name)
+        return
 
-
-        theLegend.SetNColumns(1)
-        theLegend.SetLineWidth(0)
-        theLegend.SetLineStyle(1)
-        theLegend.SetFillStyle(1001)
-        theLegend.SetFillColor(0)
-        theLegend.SetMargin(0.15)
-        theLegend.SetTextSize(0.035)  
-        theLegend.SetBorderSize(0)
-        theLegend.SetTextFont(42)
-
-        theLegend.AddEntry(signal_1, '1TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_2, '2TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_3, '3TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_4, '4TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.Draw()
+    with timing.stage("stack"):
+        hist_stack = build_background_stack(group_hists)
+    if args.dataMC:
+        plot_data_mc(args, channel, variable, group_hists, hist_stack, signals, data, variations, output_name, summary)
+    else:
+        ## Signal & Backgrounds both
+        plot_signal_background(args, channel, variable, group_hists, hist_stack, signals, variations, output_name, summary)
+
+def plot_correlations(args, channel, variable, group_hists, data=None):
+    """COLZ maps of the stacked background (and of the data) of a two-dimensional "y:x" variable."""
+    x_axis, y_axis = axis_expressions(variable)
+    maps = {"Background": None}
+    for group in STACKED_GROUPS:
+        h = project(group_hists[group], 1, 0)
+        if maps["Background"] is None:
+            maps["Background"] = h
+        else:
+            maps["Background"].Add(h)
+    if data is not None:
+        maps["Data"] = project(data, 1, 0)
+    for label, h in maps.items():
+        canvas = ROOT.TCanvas(f"canvas_corr_{label}", "", 800, 700)
+        canvas.SetRightMargin(0.15)
+        h.SetTitle("")
+        h.SetStats(0)
+        h.GetXaxis().SetTitle(variableAxisTitleDictionary.get(x_axis, x_axis))
+        h.GetYaxis().SetTitle(variableAxisTitleDictionary.get(y_axis, y_axis))
+        h.Draw("COLZ")
+        print(f"[{channel}] {label} correlation of {y_axis} and {x_axis}: {h.GetCorrelationFactor():.3f}")
 
         cmsLatex = ROOT.TLatex()
         cmsLatex.SetNDC(True)
@@ -402,357 +1220,357 @@ if __name__ == "__main__":
         cmsLatex.SetTextFont(52)
         cmsLatex.SetTextSize(0.04)
         cmsLatex.DrawLatex(0.16, 0.91, "Preliminary")
+        cmsLatex.SetTextFont(42)
+        cmsLatex.DrawLatex(0.60, 0.91, label)
+
+        with timing.stage("save"):
+            canvas.SaveAs(correlation_path(args.year, channel, variable, label))
+
+def summarize_plots(plot_keys, group_hists, data, variations):
+    """histogram.summarize of every 1D plot of ``plot_keys`` at once; the multi-dimensional ones are projected when drawn."""
+    return histogram.summarize({plot_key: (group_hists[plot_key], data.get(plot_key), variations.get(plot_key) or {})
+                                for plot_key in plot_keys if not is_multidim(plot_key[1])}, STACKED_GROUPS)
+
+def render_campaign(args, plot_keys, hists_by_proc, sig_hists, data_hists, variations, meta, read_inputs):
+    """Group the filled histograms, draw every plot and write them to ``args.store`` if given.
+
+    The filled histograms are fill_samples results, ``meta`` is recorded in the store with the
+    files of ``read_inputs`` ({kind: {sample: [paths]}}).
+    """
+    with timing.stage("group_backgrounds"):
+        hists = group_backgrounds(hists_by_proc, plot_keys)
+        shifted = background_variations(hists_by_proc, plot_keys, variations)
+    with timing.stage("collect_signals"):
+        signals = collect_signals(sig_hists, plot_keys)
+    data = {}
+    if args.dataMC and not args.signals_only:
+        with timing.stage("sum_data"):
+            data = sum_data(data_hists, plot_keys)
+
+    summaries = {}
+    if not args.signals_only:
+        with timing.stage("summarize"):
+            summaries = summarize_plots(plot_keys, hists, data, shifted)
+    for plot_key in plot_keys:
+        channel, variable = plot_key
+        with timing.stage("render"):
+            render_plot(args, channel, variable, hists[plot_key], signals[plot_key], data.get(plot_key), shifted[plot_key],
+                        summary=summaries.get(plot_key))
+
+    if args.store:
+        from hist_store import write_store
+        with timing.stage("store"):
+            write_store(args.store, plot_keys, hists, signals, [sample for sample, label, color in SIGNAL_POINTS], data,
+                        hists_by_proc, data_hists, meta=meta, update=args.update, inputs=read_inputs, variations=shifted)
+        print(f"Histograms written to {args.store}")
+
+def merge_partials(args):
+    """Merge the --shard partial results of ``args.merge_from`` (see shards.py) and draw the plots of the campaign."""
+    import shards
+    import systematics
+    meta, catalog, filled = shards.read_partials(args.merge_from, args.allow_missing)
+    if meta["year"] != args.year:
+        raise ValueError(f"The partial results are for {meta['year']}, not {args.year}")
+    if not args.signals_only and "background" not in catalog:
+        raise ValueError("The partial results have no backgrounds, merge them with --signals_only")
+    if args.dataMC and not args.signals_only and "data" not in catalog:
+        raise ValueError("The partial results have no data, they were filled without --dataMC")
+    specs = json.loads(meta.pop("systematics"))
+    variables, channels = json.loads(meta.pop("variables")), json.loads(meta.pop("channels"))
+    meta.pop("catalog")
+    plot_keys = [(channel, variable) for channel in channels for variable in variables]
+    for dirname in ["SignalandBackground", "Signal_only", "DataMC", "Correlations"]:
+        os.makedirs(dirname, exist_ok=True)
+    render_campaign(args, plot_keys, filled.get("background", {}), filled.get("signal", {}), filled.get("data", {}),
+                    systematics.parse_systematics(specs), dict(meta, systematics=" ".join(specs)), catalog)
+
+def render_from_store(args):
+    """Draw the plots selected by ``args`` from a histogram store (see hist_store.py)."""
+    from hist_store import read_store
+    group_hists, signals, data, variations, meta = read_store(args.render_from, [sample for sample, label, color in SIGNAL_POINTS])
+    print(f"Rendering from {args.render_from}, filled with weights {meta.get('weights')} and cuts {meta.get('cuts')}")
+    ## Frames and ratio lines follow the stored binning, automatic or not
+    for (channel, variable), groups in group_hists.items():
+        if groups and not is_multidim(variable):
+            auto_binning.set_edges(variable, auto_binning.axis_edges(next(iter(groups.values()))))
+    for dirname in ["SignalandBackground", "Signal_only", "DataMC", "Correlations"]:
+        os.makedirs(dirname, exist_ok=True)
+    plot_keys = []
+    for plot_key in group_hists:
+        channel, variable = plot_key
+        if (args.Channel and channel not in args.Channel) or (args.variables and variable not in args.variables):
+            continue
+        if args.dataMC and not args.signals_only and data[plot_key] is None:
+            print(f"No data in the store for {channel} {variable}, skipping the Data/MC plot")
+            continue
+        plot_keys.append(plot_key)
+    summaries = {}
+    if not args.signals_only:
+        summaries = summarize_plots(plot_keys, group_hists, data if args.dataMC else {}, variations)
+    for plot_key in plot_keys:
+        channel, variable = plot_key
+        render_plot(args, channel, variable, group_hists[plot_key], signals[plot_key], data[plot_key], variations[plot_key],
+                    summary=summaries.get(plot_key))
 
-        canvas_sig.SaveAs(os.path.join("Signal_only", f"{args.year}_{args.Channel}_{variable}_signals_only.png"))
-
-    elif args.dataMC:
-
-        canvas_dataMC = ROOT.TCanvas("canvas_dataMC", "Data + MC", 1600, 1000)  
-        canvas_dataMC.Divide(1, 2)  
-
-        pad1 = canvas_dataMC.cd(1)
-        pad1.SetPad(0.0, 0.3, 1.0, 1.0)
-        pad1.SetBottomMargin(0.01)
-        pad1.SetRightMargin(0.28)
-        pad1.SetLeftMargin(0.1)
-        
-        theLegend = ROOT.TLegend(0.73, 0, 0.97, 0.9, "", "brNDC")
-        if (args.Channel == "tt"):
-            theLegend.SetHeader("#tau-#tau Channel","C")
-        elif (args.Channel == "et"):
-            theLegend.SetHeader("e-#tau Channel","C")
-        elif (args.Channel == "mt"):
-            theLegend.SetHeader("#mu-#tau Channel","C")
-        elif (args.Channel == "lt"):
-            theLegend.SetHeader("l-#tau Channel","C")
-        elif (args.Channel == "all"):
-            theLegend.SetHeader("all Channels","C")
-
-        theLegend.SetNColumns(1)
-        theLegend.SetLineWidth(0)
-        theLegend.SetLineStyle(1)
-        theLegend.SetFillStyle(1001)
-        theLegend.SetFillColor(0)
-        theLegend.SetMargin(0.15)
-        theLegend.SetTextSize(0.037)  
-        theLegend.SetBorderSize(0)
-        theLegend.SetTextFont(42)
-
-        # Total background
-        total_bkg_hist = hists["DiBoson"].Clone("total_bkg")
-        total_bkg_hist.Add(hists["STop"])
-        total_bkg_hist.Add(hists["TTbar"])
-        total_bkg_hist.Add(hists["QCD"])
-        total_bkg_hist.Add(hists["WJets"])
-        total_bkg_hist.Add(hists["Drell-Yan"])
-        
-        # Error band
-        bkg_errors = ROOT.TGraphAsymmErrors(total_bkg_hist)
-        for b in range(1, total_bkg_hist.GetNbinsX() + 1):
-            bin_content = total_bkg_hist.GetBinContent(b)
-            bin_error = total_bkg_hist.GetBinError(b)
-            bkg_errors.SetPoint(b - 1, total_bkg_hist.GetBinCenter(b), bin_content)
-            bkg_errors.SetPointError(b - 1,
-                                    total_bkg_hist.GetBinWidth(b)/2,
-                                    total_bkg_hist.GetBinWidth(b)/2,
-                                    bin_error, bin_error)
-        bkg_errors.SetFillStyle(3008)
-        bkg_errors.SetFillColor(ROOT.TColor.GetColor("#545252"))
-
-        val, err = get_integral_with_error(total_bkg_hist)
-        print(f"Total background integral = {format_scientific(val, err)}")
-
-        # Signals
-        signal_1.SetLineColor(ROOT.kRed)
-        signal_1.SetLineWidth(2)
-        signal_2.SetLineColor(ROOT.kBlue+2)
-        signal_2.SetLineWidth(2)
-        signal_3.SetLineColor(ROOT.kViolet+3)
-        signal_3.SetLineWidth(2)
-        signal_4.SetLineColor(ROOT.kCyan+4)
-        signal_4.SetLineWidth(2)
-
-
-        # Data
-        import re
-
-        def _sanitize(name: str) -> str:
-            return re.sub(r'[^A-Za-z0-9_]', '_', name)
-
-        cut_data = create_cut_string("", base_cut, additional_cuts_o, is_observed=True)
-        print(f"cut-data string is {cut_data}")
-
-        data = ROOT.TH1F("Observed_Data", "", int(bin_values[0]), bin_values[1], bin_values[2])
-        data.Sumw2()
-        data.SetDirectory(0)
-
-        prev_adddir = ROOT.TH1.AddDirectoryStatus()   
-        data_hists = []
-
-        for category, sample_type in observed.items():
-            for path in sample_type["files"]:
-                f = ROOT.TFile.Open(path, "READ")
-                if not f or f.IsZombie():
-                    print(f"Could not open {path}")
-                    continue
-                tree = f.Get("Events")
-                if not tree:
-                    print(f"No Events tree in {path}")
-                    f.Close()
-                    continue
-
-                raw_name  = f"{os.path.basename(path).replace('.root','')}_{variable}"
-                safe_name = _sanitize(raw_name)
 
-                ROOT.TH1.AddDirectory(True)
-                ROOT.gROOT.cd()
-                ROOT.gDirectory.Delete(f"{safe_name};*")
+def main(argv=None):
+    """Run norm.py with the command line ``argv`` (default: sys.argv), also used by plot_daemon.py."""
+    parser = argparse.ArgumentParser(description="Generate histograms from ROOT files.")
+    parser.add_argument('--year',
+                        nargs='?',
+                        choices=['2024'],
+                        help='Use the file\'s fake factor weightings when making plots for these files.',
+                        required=True)
+    parser.add_argument("--variables", nargs="+", help="Variables to plot, all filled in the same pass over each file.")
+    parser.add_argument("--cuts", default="", help="Standard cut string.")
+    parser.add_argument("--additional_cuts", nargs="+", default=[], help="Additional selection cuts.")
+    parser.add_argument("--weights", default="FinalWeighting", help="Event weight expression.")
+    parser.add_argument("--log_scale", action="store_true", help="Enable logarithmic Y-axis scaling.")
+    parser.add_argument('--Channel', nargs="+", choices=["tt","et","mt","all","lt"],
+                        help="One or more channels, all filled in the same pass. The channel selection is added to --cuts.")
+    parser.add_argument("--signals_only", action="store_true", help="Plot signals only (skip backgrounds, stack, and error band).")
+    parser.add_argument("--dataMC",action="store_true", help="Overlay observed data and draw Data/MC ratio")
+    parser.add_argument("--engine", choices=["draw", "rdf", "uproot"], default="draw",
+                        help="Filling engine: TTreeFormula loop per file (draw), RDataFrame with one multithreaded event loop per sample (rdf), "
+                             "or uproot + NumPy over chunks of each file (uproot).")
+    parser.add_argument("--threads", type=int, default=0, help="Threads for the rdf and uproot engines (0 = all cores).")
+    parser.add_argument("--jobs", type=int, default=0,
+                        help="Signal and data files filled at the same time in threads (0 = all signal files, and one "
+                             "thread per core for the data, whose files are split in entry ranges).")
+    parser.add_argument("--read_ahead", type=int, default=2,
+                        help="Files the draw engine opens and pre-reads in the background while filling the current one (0 = off).")
+    parser.add_argument("--cache_dir", default=None, help="Directory of the persistent histogram cache (disabled if not given).")
+    parser.add_argument("--cache_size", type=float, default=10.0, help="Histogram cache size limit in GB, least recently used entries are evicted.")
+    parser.add_argument("--index_dir", default=None,
+                        help="Directory of the per-file entry lists of the channel cuts, built once and reused (draw engine).")
+    parser.add_argument("--skim_dir", default=None, help="Read the local skims made by skim.py instead of the original files where they are valid.")
+    parser.add_argument("--mc_dir", default=redirector_MC, help="Directory of the MC files listed in samples.py.")
+    parser.add_argument("--data_dir", default=None, help="Directory holding the observed files by name (default: the paths in observed.py).")
+    parser.add_argument("--catalog", default=None,
+                        help="Sample catalog built by sample_catalog.py: the files of every sample and their metadata, "
+                             "instead of --mc_dir and --data_dir.")
+    parser.add_argument("--systematics", nargs="+", default=[],
+                        help="Systematic variations filled with the nominal histograms and added to the background band: "
+                             "NAME:BRANCH=UP[,DOWN] renames a branch (e.g. jes:FatJet_pt_nom=FatJet_pt_jesUp,FatJet_pt_jesDown), "
+                             "NAME:weight=UP[,DOWN] replaces the weight. A single value is mirrored.")
+    parser.add_argument("--auto_binning", choices=["missing", "all"], default=None,
+                        help="Choose the range and bins from the filled distributions, in the same pass: for the variables "
+                             "missing from variableSettingDictionary, or for all of them (draw engine).")
+    parser.add_argument("--auto_bins", type=int, default=20, help="Number of bins of the automatic binning.")
+    parser.add_argument("--variable_width", action="store_true",
+                        help="Automatic bins of equal content (quantiles) instead of equal width.")
+    parser.add_argument("--store", default=None,
+                        help="Write every sample, group, signal and data histogram of the run to this ROOT file.")
+    parser.add_argument("--update", action="store_true",
+                        help="Start from the histograms of --store and only fill the files added or changed since it was written.")
+    parser.add_argument("--render_from", default=None,
+                        help="Only draw the plots from a file written with --store, without reading any input file. "
+                             "--variables and --Channel then select plots of the store (default: all).")
+    parser.add_argument("--shard", default=None,
+                        help="Fill only shard I/N of the files (every N-th file of each kind from the I-th) and write them "
+                             "to --partial, for campaigns spread over several nodes (draw and uproot engines).")
+    parser.add_argument("--partial", default=None, help="File the partial histograms of --shard are written to.")
+    parser.add_argument("--merge_from", nargs="+", default=None,
+                        help="Merge the --partial files of the shards of a campaign, draw its plots and write the --store.")
+    parser.add_argument("--allow_missing", action="store_true",
+                        help="Let --merge_from draw the plots when files of the campaign are missing from the partial files.")
+    parser.add_argument("--timing_report", default=None,
+                        help="Write per-file (open, bytes read, entries, fill) and per-stage timings to this JSON file.")
 
-                expr = f"{variable} >> {safe_name}({int(bin_values[0])},{bin_values[1]},{bin_values[2]})"
-                nsel = tree.Draw(expr, cut_data, "goff")
 
-                htemp = ROOT.gDirectory.Get(safe_name)
-                ROOT.TH1.AddDirectory(prev_adddir)
+    start = time.time()
+    args = parser.parse_args(argv)
+    timing.reset()
+    auto_binning.reset()
+    ## Also resets the catalog of a previous plot_daemon.py request
+    catalog = sample_catalog.use(args.catalog)
+    if catalog is not None:
+        print(f"Sample catalog {args.catalog}: {len(catalog.files)} files")
+    if args.render_from:
+        render_from_store(args)
+        print(f"Execution time: {time.time() - start:.2f} seconds")
+        return
+    if args.merge_from:
+        try:
+            merge_partials(args)
+        except ValueError as error:
+            parser.error(str(error))
+        print(f"Execution time: {time.time() - start:.2f} seconds")
+        return
+    if not args.variables or not args.Channel:
+        parser.error("--variables and --Channel are required unless --render_from or --merge_from is given")
+    if args.update and not args.store:
+        parser.error("--update needs the --store to update")
+    shard = None
+    if args.shard:
+        import shards
+        try:
+            shard = shards.parse_shard(args.shard)
+        except ValueError as error:
+            parser.error(str(error))
+        if not args.partial:
+            parser.error("--shard needs the --partial file to write")
+        if args.engine == "rdf" or args.update or args.store:
+            parser.error("--shard fills single files (draw and uproot engines), the --store is written by --merge_from")
+    import systematics
+    try:
+        variations = systematics.parse_systematics(args.systematics)
+    except ValueError as error:
+        parser.error(str(error))
+    if variations and args.engine == "rdf":
+        parser.error("--systematics are filled by the draw and uproot engines")
+    variables = list(dict.fromkeys(args.variables))
+    if any(is_multidim(variable) for variable in variables) and args.engine != "draw":
+        parser.error("Multi-dimensional (y:x) variables are filled by the draw engine")
+    ## The axes of a multi-dimensional variable are binned as the 1D variables
+    auto_variables = [variable for variable in variables if not is_multidim(variable)
+                      and (args.auto_binning == "all" or (args.auto_binning and variable not in variableSettingDictionary))]
+    if auto_variables and args.engine != "draw":
+        parser.error("--auto_binning needs the draw engine, whose histograms can extend their range")
+    if auto_variables and shard:
+        parser.error("--auto_binning chooses the bins from every file, it cannot be combined with --shard")
+    nd_auto = auto_binned_axes(variables, auto_variables)
+    if nd_auto:
+        parser.error("--auto_binning cannot bin the axes of multi-dimensional variables, plot them in another run: "
+                     + ", ".join(f"{variable} ({', '.join(axes)})" for variable, axes in nd_auto.items()))
+    auto_binning.enable(auto_variables)
+    weights = args.weights
+    base_cut = args.cuts
+    additional_cuts_o = args.additional_cuts
 
-                if nsel < 0:
-                    print(f"Draw failed for {path}. expr={expr}")
-                    f.Close()
-                    continue
-                if not htemp:
-                    print(f"Histogram {safe_name} not created for {path} (likely 0 selected). Making empty.")
-                    htemp = ROOT.TH1F(safe_name, hist_title, int(bin_values[0]), bin_values[1], bin_values[2])
-                    htemp.Sumw2()
-
-                htemp.SetDirectory(0)
-                data_hists.append(htemp)
-                data.Add(htemp)
-                f.Close()
-
-        
-        data.SetMarkerStyle(20)
-        data.SetLineColor(ROOT.kBlack)
-        val, err = get_integral_with_error(data)
-        print(f"Total Data integral = {format_scientific(val, err)}")
-        
-        max_bkg = max(h.GetMaximum() for _, h in hists.items())
-        max_sig = max(signal_1.GetMaximum(), signal_2.GetMaximum(),
-                            signal_3.GetMaximum(), signal_4.GetMaximum())
-        max_data = data.GetMaximum() if data.GetMaximum() > 0 else 0
-
-        pad1.cd()
-        hist_stack.SetMaximum(max(max_bkg, max_sig, max_data) * 1.8)
-        hist_stack.Draw("hist")
-        hist_stack.GetXaxis().SetTitle("")
-        hist_stack.GetXaxis().SetLabelSize(0)
-        hist_stack.GetYaxis().SetTitle("Events")
-        hist_stack.GetYaxis().SetTitleSize(0.05)
-        hist_stack.GetYaxis().SetLabelSize(0.04)
-        hist_stack.GetYaxis().SetTitleOffset(0.8)
-        #pad1.Update()
-        hist_stack.Draw("hist same")  
-
-        if log_scale:
-            pad1.SetLogy()
-            hist_stack.SetMinimum(1e-1)
-
-        pad1.Update()
-
-        bkg_errors.Draw("E2 SAME")
-        signal_1.Draw("hist SAME")
-        signal_2.Draw("hist SAME")
-        signal_3.Draw("hist SAME")
-        signal_4.Draw("hist SAME")
-        data.Draw("ep SAME")
-
-        pad1.RedrawAxis()
-
-        theLegend.AddEntry(hists["DiBoson"], "DiBoson", "f")
-        theLegend.AddEntry(hists["STop"], "STop", "f")
-        theLegend.AddEntry(hists["TTbar"], "TTbar", "f")
-        theLegend.AddEntry(hists["QCD"], "QCD", "f")
-        theLegend.AddEntry(hists["WJets"], "WJets", "f")
-        theLegend.AddEntry(hists["Drell-Yan"], "Drell-Yan", "f")
-        theLegend.AddEntry(signal_1, '1TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_2, '2TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_3, '3TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_4, '4TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(data, "Observed", "lep")
-        theLegend.Draw()
-
-        # CMS label
-        cmsLatex = ROOT.TLatex()
-        cmsLatex.SetNDC(True)
-        cmsLatex.SetTextFont(61)
-        cmsLatex.SetTextSize(0.05)
-        cmsLatex.DrawLatex(0.10, 0.91, "CMS")
-        cmsLatex.SetTextFont(52)
-        cmsLatex.SetTextSize(0.04)
-        cmsLatex.DrawLatex(0.15, 0.91, "Preliminary")
-        if args.year == '2024':
-            cmsLatex.SetTextAlign(31)
-            cmsLatex.SetTextFont(42)
-            cmsLatex.DrawLatex(0.72,0.91,"109.08 fb^{-1}, 13.6 TeV (2024)")
-
-        pad2 = canvas_dataMC.cd(2)
-        pad2.SetPad(0.0, 0.0, 1.0, 0.3)
-        pad1.SetLeftMargin(0.1)
-        pad2.SetRightMargin(0.28)
-        pad2.SetTopMargin(0.04)
-        pad2.SetBottomMargin(0.35)
-        pad2.SetGridy()
-
-        ratio = data.Clone("Data_MC_Ratio")
-        ratio.Divide(total_bkg_hist)
-        ratio.SetStats(0)
-        ratio.SetMarkerStyle(20)
-        ratio.SetMarkerSize(0.9)
-
-        ratio.GetXaxis().SetTitleSize(0.14)
-        ratio.GetXaxis().SetLabelSize(0.10)
-        ratio.GetXaxis().SetLabelOffset(0.04)
-        ratio.GetXaxis().SetTitle(hist_title)
-        ratio.GetYaxis().SetTitle("Data / MC")
-        ratio.GetYaxis().SetTitleSize(0.12)
-        ratio.GetYaxis().SetTitleOffset(0.3)
-        ratio.GetYaxis().SetLabelSize(0.10)
-        ratio.GetYaxis().SetNdivisions(505)
-        ratio.GetYaxis().SetRangeUser(0, 2)
-        ratio.Draw("ep")
-
-        line = ROOT.TLine(bin_values[1], 1.0, bin_values[2], 1.0)
-        line.SetLineColor(ROOT.kRed)
-        line.SetLineStyle(2)
-        line.SetLineWidth(2)
-        line.Draw("same")
-
-        canvas_dataMC.SaveAs(os.path.join("DataMC", f"{args.year}_{args.Channel}_{variable}_DataMC.png"))
-
-        data_val, data_err = get_integral_with_error(data)
-        mc_val, mc_err     = get_integral_with_error(total_bkg_hist)
-
-        if mc_val > 0:
-            ratio_val = data_val / mc_val
-            ratio_err = ratio_val * math.sqrt(
-                (data_err / data_val) ** 2 + (mc_err / mc_val) ** 2
-            ) if data_val > 0 else 0.0
-        else:
-            ratio_val, ratio_err = float("nan"), 0.0
-        print("\n")
-        print(f"Data Integral : {format_scientific(data_val, data_err)}")
-        print(f"MC Integral   : {format_scientific(mc_val, mc_err)}")
-        print(f"Data/MC Ratio : {format_scientific(ratio_val, ratio_err)}")
-    
-    else:  
-        ## Signal & Backgrounds both
+    for dirname in ["SignalandBackground", "Signal_only", "DataMC", "Correlations"]:
+        os.makedirs(dirname, exist_ok=True)
 
-        canvas_sb = ROOT.TCanvas("canvas_sb", "Signal + Backgrounds", 1600, 800)  
-        canvas_sb.SetRightMargin(0.30)
-
-        theLegend = ROOT.TLegend(0.80, 0.20, 0.98, 0.90, "", "brNDC")
-
-        if (args.Channel == "tt"):
-            theLegend.SetHeader("#tau-#tau Channel","C")
-        elif (args.Channel == "et"):
-            theLegend.SetHeader("e-#tau Channel","C")
-        elif (args.Channel == "mt"):
-            theLegend.SetHeader("#mu-#tau Channel","C")
-        elif (args.Channel == "lt"):
-            theLegend.SetHeader("l-#tau Channel","C")
-        elif (args.Channel == "all"):
-            theLegend.SetHeader("all Channels","C")
+    for variable in variables:
+        if variable in auto_variables:
+            print(f"Histogram bins and ranges for {variable} are chosen from the data")
         else:
-            print ("Enter a valid channel")
-
-        theLegend.SetTextSize(0.035)
-        theLegend.SetBorderSize(0)
-        theLegend.SetFillStyle(0)
-        theLegend.SetTextFont(42)
-
-        signal_1.SetLineColor(ROOT.kRed)
-        signal_1.SetLineWidth(2)
-        signal_2.SetLineColor(ROOT.kBlue+2)
-        signal_2.SetLineWidth(2)
-        signal_3.SetLineColor(ROOT.kViolet+3)
-        signal_3.SetLineWidth(2)
-        signal_4.SetLineColor(ROOT.kCyan+4)
-        signal_4.SetLineWidth(2)
-        
-        total_bkg_hist = hists["DiBoson"].Clone("total_bkg")
-        total_bkg_hist.Add(hists["STop"])
-        total_bkg_hist.Add(hists["TTbar"])
-        total_bkg_hist.Add(hists["QCD"])
-        total_bkg_hist.Add(hists["WJets"])
-        total_bkg_hist.Add(hists["Drell-Yan"])
-        bkg_errors = ROOT.TGraphAsymmErrors(total_bkg_hist)
-        for b in range(1, total_bkg_hist.GetNbinsX() + 1):
-            bin_content = total_bkg_hist.GetBinContent(b)
-            bin_error = total_bkg_hist.GetBinError(b)
-            bkg_errors.SetPoint(b - 1, total_bkg_hist.GetBinCenter(b), bin_content)
-            bkg_errors.SetPointError(b - 1, total_bkg_hist.GetBinWidth(b)/2,
-                                    total_bkg_hist.GetBinWidth(b)/2,
-                                    bin_error, bin_error)
-        bkg_errors.SetLineColor(0)
-        bkg_errors.SetFillStyle(3008)
-        bkg_errors.SetFillColor(ROOT.TColor.GetColor("#545252"))
-        bkg_errors.SetMarkerStyle(0)
-        bkg_errors.SetLineWidth(0)
-        
-        pad1.cd()
-        hist_stack.GetHistogram().SetMaximum(1.2 * max(max_bkg, max_sig))
-        hist_stack.Draw("hist")
-        pad1.Update()
-        hist_stack.Draw("hist same")
-        if log_scale:
-            pad1.SetLogy()
-            hist_stack.SetMinimum(1e-1)
-        pad1.Update()
-
-        signal_1.Draw("hist SAME")
-        signal_2.Draw("hist SAME")
-        signal_3.Draw("hist SAME")
-        signal_4.Draw("hist SAME")
-        bkg_errors.Draw("E2 SAME")
-
-        theLegend.AddEntry(hists["DiBoson"], "DiBoson", "f")
-        theLegend.AddEntry(hists["STop"], "STop", "f")
-        theLegend.AddEntry(hists["TTbar"], "TTbar", "f")
-        theLegend.AddEntry(hists["QCD"], "QCD", "f")
-        theLegend.AddEntry(hists["WJets"], "WJets", "f")
-        theLegend.AddEntry(hists["Drell-Yan"], "Drell-Yan", "f")
-
-        theLegend.AddEntry(signal_1, '1TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_2, '2TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_3, '3TeV (1pb x 0.073 (bbtt BR))', "f")
-        theLegend.AddEntry(signal_4, '4TeV (1pb x 0.073 (bbtt BR))', "f")
-
+            print(f"Histogram bins and ranges for {variable} are {get_binning(variable)}")
+
+    channels = list(dict.fromkeys(args.Channel))
+    cuts = make_channel_cuts(channels, base_cut, additional_cuts_o)
+    for channel in channels:
+        print(f"[{channel}] Weighted selection:   {weights} * {cuts[channel]}")
+        print(f"[{channel}] Unweighted selection: {cuts[channel]}")
+    for variation in variations:
+        print(f"Systematic variation {variation.name}: branches {variation.shifts}, weight {variation.weight or weights}")
+
+    ## Every (channel, variable) pair is one plot
+    plot_keys = [(channel, variable) for channel in channels for variable in variables]
+
+    if args.engine == "rdf":
+        import rdf_engine
+        rdf_engine.enable_threads(args.threads)
+    threads = args.threads or os.cpu_count()
+
+    cache = None
+    if args.cache_dir:
+        from hist_cache import HistogramCache
+        cache = HistogramCache(args.cache_dir, int(args.cache_size * 1024**3))
+
+    index = None
+    if args.index_dir:
+        from entry_index import EntryIndex
+        index = EntryIndex(args.index_dir)
+
+    if args.skim_dir and variations:
+        print("Not reading the skims: they only keep the events and branches of the nominal selection")
+
+    def inputs(samples):
+        if not args.skim_dir or variations:
+            return samples
+        import skim
+        branches = skim.campaign_branches(variables, cuts, weights)
+        return skim.use_skims(samples, args.skim_dir, branches, base_cut, channels, additional_cuts_o)
+
+    ## With --update, the samples of the store whose files did not change are not read again
+    stored = ({}, {})
+    if args.update:
+        from hist_store import read_samples, same_selection
+        stored_hists, stored_inputs, meta = read_samples(args.store)
+        if same_selection(meta, weights, base_cut, additional_cuts_o, args.systematics):
+            stored = (stored_hists, stored_inputs)
+        elif meta:
+            print(f"{args.store} was filled with other weights, cuts or systematics, filling every file")
+    read_inputs = {}
+    failed_files = []
+
+    def updated(kind, samples, keys=plot_keys):
+        read_inputs[kind] = samples
+        if shard:
+            return shards.select(samples, shard), {}
+        todo, start = split_updates(kind, samples, stored, keys)
+        if args.update:
+            nfiles = sum(len(paths) for paths in samples.values())
+            print(f"[{kind}] {nfiles - sum(len(paths) for paths in todo.values())} of {nfiles} files taken from {args.store}")
+        return todo, start
 
-        cmsLatex = ROOT.TLatex()
-        cmsLatex.SetNDC(True)
-        cmsLatex.SetTextFont(61)
-        cmsLatex.SetTextSize(0.05)
-        cmsLatex.DrawLatex(0.10, 0.92, "CMS")
-        cmsLatex.SetTextFont(52)
-        cmsLatex.SetTextSize(0.04)
-        cmsLatex.DrawLatex(0.18, 0.92, "Preliminary")
+    ## We fill background histograms only when we are not plotting Signals Only Plots.
+    hists_by_proc = {}
+    if not args.signals_only:
+        bkg_todo, bkg_start = updated("background", inputs(background_samples(args.mc_dir)),
+                                      plot_keys + systematics.variation_keys(plot_keys, variations))
+        with timing.stage("fill_background"):
+            hists_by_proc = add_stored(fill_samples(bkg_todo, variables, cuts, weights, args.engine, cache, threads, args.read_ahead,
+                                                    index=index, variations=variations, per_file=bool(shard),
+                                                    failed=failed_files), bkg_start)
 
-        cmsLatex.SetTextAlign(31)
-        cmsLatex.SetTextFont(42)
-        if args.year == '2024':
-            lumiText = '109.08 fb^{-1}, 13.6 TeV (2024)'
-        cmsLatex.DrawLatex(0.700,0.91,lumiText)
-
-        theLegend.SetNColumns(1)
-        theLegend.SetLineWidth(0)
-        theLegend.SetLineStyle(1)
-        theLegend.SetFillStyle(1001)
-        theLegend.SetFillColor(0)
-        theLegend.SetMargin(0.2)
-        theLegend.SetTextSize(0.035)  
-        theLegend.SetBorderSize(0)
-        theLegend.SetTextFont(42)
-        theLegend.Draw()
-    
-        canvas_sb.SaveAs(os.path.join("SignalandBackground", f"{args.year}_{args.Channel}_{variable}_SignalandBackground.png"))
+    ## Signals are there in all the plots, we are adding them outside any if loops
+    ## The mass points are small and independent, fill them all at once
+    signal_todo, signal_start = updated("signal", inputs(signal_samples(args.mc_dir)))
+    signal_jobs = args.jobs or max(min(sum(len(paths) for paths in signal_todo.values()), os.cpu_count()), 1)
+    with timing.stage("fill_signal"):
+        sig_hists = add_stored(fill_samples(signal_todo, variables, cuts, weights, args.engine, cache, threads, args.read_ahead,
+                                            signal_jobs, index=index, per_file=bool(shard), failed=failed_files),
+                                 signal_start)
+
+    ## Data
+    data_hists = {}
+    if args.dataMC and not args.signals_only:
+        print(f"cut-data strings are {cuts}")
+        ## The era files are the largest inputs: all of them at once, each split in entry ranges to fill the cores
+        data_todo, data_start = updated("data", inputs(data_samples(args.data_dir)))
+        data_jobs = args.jobs or os.cpu_count()
+        ## A file split in entry ranges is summed in another order: shards fill whole files, so that
+        ## the merged histograms do not depend on how many files each shard had
+        data_parts = 1 if shard else -(-data_jobs // max(sum(len(paths) for paths in data_todo.values()), 1))
+        with timing.stage("fill_data"):
+            data_hists = add_stored(fill_samples(data_todo, variables, cuts, None, args.engine, cache, threads, args.read_ahead,
+                                                 data_jobs, data_parts, index, per_file=bool(shard), failed=failed_files),
+                                    data_start)
+
+    meta = {"year": args.year, "weights": weights, "cuts": base_cut, "additional_cuts": " && ".join(additional_cuts_o),
+            "engine": args.engine}
+    if failed_files:
+        print(f"{len(failed_files)} files could not be filled and are missing from the plots, e.g. {failed_files[0]}")
+    if shard:
+        filled = {"background": hists_by_proc, "signal": sig_hists, "data": data_hists}
+        with timing.stage("store"):
+            shards.write_partial(args.partial, shard, read_inputs, {kind: filled[kind] for kind in read_inputs},
+                                 dict(meta, systematics=json.dumps(args.systematics), variables=json.dumps(variables),
+                                      channels=json.dumps(channels)))
+        print(f"Shard {args.shard} written to {args.partial}")
+    else:
+        ## Every file is filled: the automatic binnings can be chosen from everything that was read
+        if auto_variables:
+            with timing.stage("auto_binning"):
+                auto_binning.finalize([hists_by_proc, sig_hists, data_hists], args.auto_bins, args.variable_width)
+        ## The store only lists the files it holds: the failed ones are read again by the next --update
+        render_campaign(args, plot_keys, hists_by_proc, sig_hists, data_hists, variations,
+                        dict(meta, systematics=" ".join(args.systematics)), without_files(read_inputs, failed_files))
+
+    if cache:
+        print(f"Histogram cache: {cache.hits} hits, {cache.misses} misses")
+    if index:
+        print(f"Entry lists: {index.loaded} reused, {index.built} built")
 
     end = time.time()
     print(f"Execution time: {end - start:.2f} seconds")
+    if args.timing_report:
+        timing.write_report(args.timing_report, engine=args.engine, variables=variables, channels=channels,
+                            wall_time=end - start, cache={"hits": cache.hits, "misses": cache.misses} if cache else None)
+        print(f"Timing report written to {args.timing_report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
-import concurrent.futures
-import subprocess
+import json
 import os
-import threading
 from tqdm import tqdm
 
-MAX_JOBS = 40
-
-cuts = {
-    "tt": "((channel==0) && (Flag_JetVetoed==0) && (Flag_FatJetVetoed==0))",
-    "et": "((channel==1) && (Flag_JetVetoed==0) && (Flag_FatJetVetoed==0))",
-    "mt": "((channel==2) && (Flag_JetVetoed==0) && (Flag_FatJetVetoed==0))",
-}
+import timing
+from scheduler import Plot, auto_workers, run_campaign
+
+MAX_JOBS = None   # worker processes, None to fit them in the available cores and memory
+MODE = "dataMC"
+CACHE_DIR = None  # e.g. "hist_cache" to reuse unchanged per-file histograms between campaigns
+INDEX_DIR = None  # e.g. "entry_lists" to evaluate the channel cuts once per file across campaigns
+SKIM_DIR = None   # e.g. "skims" to copy the needed branches and events to local files first
+STORE = "histograms.root"  # every merged histogram of the campaign, None to not keep them
+RENDER_ONLY = False        # redraw the plots from STORE without reading any input file
+RESUME = True              # skip the plots already drawn from the same inputs, cuts and weights
+## norm.py --systematics specs, filled with the backgrounds into the uncertainty band,
+## e.g. ["corr:FatJet_pt_nom=FatJet_pt", "pileup:weight=xsWeight*puWeightUp,xsWeight*puWeightDown"]
+SYSTEMATICS = []
+AUTO_BINNING = None  # "missing" or "all": choose the bins of those variables from the data (norm.py --auto_binning)
+CATALOG = None       # e.g. "catalog.json" from sample_catalog.py build: file lists and sizes without opening any file
+
+## Shared by all channels, norm.py adds (channel==N) for each channel
+base_cut = "((Flag_JetVetoed==0) && (Flag_FatJetVetoed==0))"
+channels = ["tt", "et", "mt"]
 
 variables_log = [
     "FatJet_pt[index_gFatJets[0]]",
@@ -99,87 +110,49 @@ variables_linear = [
     "HTT_boosted_Mu_phi",
 ]
 
-print_lock = threading.Lock()
-progress_bar = None
-
-def safe_print(*args, **kwargs):
-    with print_lock:
-        print(*args, **kwargs)
-
-def run_job(args):
-    global progress_bar
-    cmd = ["python3", "norm.py"] + args[:-1]
-    log_file = args[-1]
-
-    with open(log_file, "w") as f:
-        result = subprocess.run(cmd, stdout=f, stderr=subprocess.STDOUT)
-
-    with print_lock:
-        if progress_bar:
-            progress_bar.update(1)
-            if result.returncode != 0:
-                progress_bar.write(f"Failed: {log_file}")
-    return result.returncode
-
-def generate_commands():
+def generate_plots():
     for var in variables_log:
-        for ch in ["tt", "et", "mt"]:
-            cut_expr = cuts[ch]
-            safe_var = (
-                var.replace("[", "")
-                .replace("]", "")
-                .replace("(", "")
-                .replace(")", "")
-                .replace("/", "_")
-            )
-            log_name = f"logs/log_{ch}_{safe_var}_dataMC.txt"
-            yield [
-                "--year", "2024",
-                "--variables", var,
-                "--cuts", cut_expr,
-                "--weights", "xsWeight",
-                "--log_scale",
-                "--Channel", ch,
-                "--dataMC",
-                log_name,
-            ]
+        for ch in channels:
+            yield Plot(ch, var, log_scale=True)
 
     for var in variables_linear:
-        for ch in ["tt", "et", "mt"]:
-            cut_expr = cuts[ch]
-            safe_var = (
-                var.replace("[", "")
-                .replace("]", "")
-                .replace("(", "")
-                .replace(")", "")
-                .replace("/", "_")
-            )
-            log_name = f"logs/log_{ch}_{safe_var}_dataMC.txt"
-            yield [
-                "--year", "2024",
-                "--variables", var,
-                "--cuts", cut_expr,
-                "--weights", "xsWeight",
-                "--Channel", ch,
-                "--dataMC",
-                log_name,
-            ]
+        for ch in channels:
+            yield Plot(ch, var, log_scale=False)
 
 
 if __name__ == "__main__":
     os.makedirs("logs", exist_ok=True)
-    commands = list(generate_commands())
-    total_jobs = len(commands)
-
-    print(f"Launching {total_jobs} jobs with up to {MAX_JOBS} concurrent processes...\n")
-
-    # Initialize tqdm progress bar
-    progress_bar = tqdm(total=total_jobs, ncols=90, desc="Processing", unit="job")
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_JOBS) as executor:
-        futures = [executor.submit(run_job, cmd) for cmd in commands]
-        for _ in concurrent.futures.as_completed(futures):
-            pass  # tqdm updated in run_job()
+    plots = list(generate_plots())
+
+    workers = MAX_JOBS or auto_workers("logs")
+    print(f"Launching campaign of {len(plots)} plots on up to {workers} worker processes...\n")
+
+    # Initialize tqdm progress bar, run_campaign sets the total to fill + render tasks
+    progress_bar = tqdm(total=len(plots), ncols=90, desc="Processing", unit="task")
+
+    failed = run_campaign(
+        plots,
+        base_cut,
+        weights="xsWeight",
+        year="2024",
+        mode=MODE,
+        max_workers=workers,
+        log_dir="logs",
+        cache_dir=CACHE_DIR,
+        skim_dir=SKIM_DIR,
+        index_dir=INDEX_DIR,
+        store=STORE,
+        render_from=STORE if RENDER_ONLY else None,
+        resume=RESUME,
+        systematics=SYSTEMATICS,
+        auto_binning=AUTO_BINNING,
+        catalog=CATALOG,
+        progress_bar=progress_bar,
+    )
 
     progress_bar.close()
+    with open(os.path.join("logs", "timing.json")) as f:
+        print("\n" + timing.summary(json.load(f)))
+    if failed:
+        print(f"\n {len(failed)} tasks failed, see their log files.")
     print("\n All jobs finished!")
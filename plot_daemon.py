@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Long-lived norm.py server for quick one-off plots.
+
+Every norm.py run pays for importing ROOT, starting cling, compiling the FillMultiple and entry
+list helpers and loading the sample and variable dictionaries before the first event is read.
+The daemon does that once, keeps the last input files open (with their TTreeCache and the
+formulas FillMultiple compiled on them) between requests, and runs norm.py requests one at a
+time over a local Unix socket:
+
+    python3 plot_daemon.py serve &
+    python3 plot_daemon.py plot --year 2024 --variables PuppiMET_pt --Channel tt --signals_only
+    python3 plot_daemon.py stop
+
+A request takes exactly the norm.py arguments and runs in the caller's working directory; its
+output (Python and ROOT) is sent back to the client, which exits with the run's status.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"norm_daemon_{os.getuid()}.sock")
+
+
+class PlotHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        if request.get("command") == "stop":
+            self.wfile.write((json.dumps({"status": 0, "output": "Daemon stopped\n"}) + "\n").encode())
+            ## shutdown() waits for serve_forever(), which is running this handler
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        status, output = self.server.run(request["argv"], request["cwd"])
+        self.wfile.write((json.dumps({"status": status, "output": output}) + "\n").encode())
+
+
+class PlotServer(socketserver.UnixStreamServer):
+    def __init__(self, path, max_files):
+        import norm
+        import readahead
+        from scheduler import log_to
+        self.norm = norm
+        self.log_to = log_to
+        self.served = 0
+        readahead.keep_files_open(max_files)
+        super().__init__(path, PlotHandler)
+
+    def run(self, argv, cwd):
+        """Run norm.main(argv) in ``cwd``, returns (exit status, captured output)."""
+        start = time.time()
+        status = 0
+        with tempfile.NamedTemporaryFile("r", suffix=".txt") as log:
+            previous = os.getcwd()
+            with self.log_to(log.name):
+                try:
+                    os.chdir(cwd)
+                    self.norm.main(argv)
+                except SystemExit as stop:
+                    status = stop.code if isinstance(stop.code, int) else 1
+                except Exception:
+                    traceback.print_exc(file=sys.stdout)
+                    status = 1
+                finally:
+                    os.chdir(previous)
+            output = log.read()
+        self.served += 1
+        print(f"Request {self.served} ({' '.join(argv)}) done in {time.time() - start:.2f} s, status {status}")
+        return status, output
+
+
+def send(request, path=DEFAULT_SOCKET):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    with client, client.makefile("rwb") as stream:
+        stream.write((json.dumps(request) + "\n").encode())
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve norm.py requests from a warm process.", allow_abbrev=False)
+    parser.add_argument("command", choices=["serve", "plot", "stop"])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Path of the Unix socket.")
+    parser.add_argument("--max_files", type=int, default=64, help="Input files kept open between requests (serve).")
+    args, norm_args = parser.parse_known_args()
+
+    if args.command == "serve":
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = PlotServer(args.socket, args.max_files)
+        print(f"Serving norm.py requests on {args.socket}")
+        try:
+            server.serve_forever(poll_interval=0.2)
+        finally:
+            server.server_close()
+            os.remove(args.socket)
+    else:
+        request = {"command": "stop"} if args.command == "stop" else {"argv": norm_args, "cwd": os.getcwd()}
+        try:
+            reply = send(request, args.socket)
+        except (FileNotFoundError, ConnectionRefusedError):
+            sys.exit(f"No daemon on {args.socket}, start one with: python3 plot_daemon.py serve")
+        sys.stdout.write(reply["output"])
+        sys.exit(reply["status"])
@@ -0,0 +1,151 @@
+"""RDataFrame filling engine for norm.py (``--engine rdf``).
+
+Every histogram of a sample is booked lazily on one RDataFrame over all of its files, and the
+event loops of all booked samples are started together with ROOT.RDF.RunGraphs, so each sample
+is read exactly once and uses the thread pool set up by ROOT.EnableImplicitMT.
+"""
+import os
+import re
+
+import ROOT
+
+
+## TTreeFormula treats "a[b]" as "the instances of a selected by b" and silently drops
+## out-of-range indices, e.g. FatJet_pt[index_gFatJets[0]] in an event without a good fat jet.
+## fm::take reproduces that for both scalar and array indices, fm::first gives the first
+## instance (NaN when there is none) where a scalar is needed, as in cuts and weights.
+if not hasattr(ROOT, "fm"):
+    ROOT.gInterpreter.Declare(r"""
+#include "ROOT/RVec.hxx"
+#include <cstddef>
+#include <limits>
+#include <type_traits>
+
+namespace fm {
+template <typename T, typename I>
+ROOT::RVec<T> take(const ROOT::RVec<T> &v, const ROOT::RVec<I> &idx)
+{
+   ROOT::RVec<T> out;
+   out.reserve(idx.size());
+   for (auto i : idx)
+      if (i >= 0 && static_cast<std::size_t>(i) < v.size())
+         out.push_back(v[i]);
+   return out;
+}
+
+template <typename T, typename I, typename = std::enable_if_t<std::is_arithmetic<I>::value>>
+ROOT::RVec<T> take(const ROOT::RVec<T> &v, I i)
+{
+   ROOT::RVec<T> out;
+   if (i >= 0 && static_cast<std::size_t>(i) < v.size())
+      out.push_back(v[static_cast<std::size_t>(i)]);
+   return out;
+}
+
+template <typename T>
+double first(const ROOT::RVec<T> &v)
+{
+   return v.empty() ? std::numeric_limits<double>::quiet_NaN() : static_cast<double>(v[0]);
+}
+}
+""")
+
+
+_INDEXED = re.compile(r"\b([A-Za-z_]\w*)\s*\[")
+_ABS = re.compile(r"(?<![\w:.])abs\s*\(")
+
+
+def translate_expression(expr, scalar=False):
+    """Translate a TTree::Draw expression into the C++ used for RDataFrame columns.
+
+    ``a[b]`` becomes ``fm::take(a, b)``, which is an RVec (one value per instance, like Draw).
+    With ``scalar=True`` the outermost indexed terms are reduced to their first instance, which
+    is what a Filter or a weight needs.
+    """
+    out = []
+    pos = 0
+    while True:
+        m = _INDEXED.search(expr, pos)
+        if not m:
+            out.append(expr[pos:])
+            break
+        depth, end = 1, m.end()
+        while depth:
+            if end >= len(expr):
+                raise ValueError(f"Unbalanced brackets in expression {expr!r}")
+            depth += {"[": 1, "]": -1}.get(expr[end], 0)
+            end += 1
+        inner = translate_expression(expr[m.end():end - 1])
+        term = f"fm::take({m.group(1)}, {inner})"
+        out.append(expr[pos:m.start()])
+        out.append(f"fm::first({term})" if scalar else term)
+        pos = end
+    ## TTreeFormula's abs is TMath::Abs, make sure cling does not pick the integer C abs
+    return _ABS.sub("std::abs(", "".join(out))
+
+
+def enable_threads(threads=0):
+    """Turn on implicit multithreading, ``threads=0`` lets ROOT use every core of the node."""
+    if threads == 1:
+        return
+    if threads:
+        ROOT.EnableImplicitMT(threads)
+    else:
+        ROOT.EnableImplicitMT()
+    print(f"RDataFrame implicit MT enabled with {ROOT.GetThreadPoolSize()} threads")
+
+
+def book_sample(name, files, variables, binnings, cuts, weight=None, titles=None, keys=None):
+    """Book one histogram per (channel, variable) on a single RDataFrame over ``files``.
+
+    ``cuts`` maps a channel name to its selection; every channel is a Filter branch of the same
+    graph, so all channels share one event loop. Nothing is read here, the returned
+    {(channel, variable): RResultPtr} is filled by run_booked. ``binnings`` maps each variable
+    to (nbins, low, high); ``keys`` restricts the booking to some (channel, variable) pairs.
+    """
+    readable = []
+    for path in files:
+        if "://" in path or os.path.exists(path):
+            readable.append(path)
+        else:
+            print(f"Could not open {path}")
+    if not readable:
+        return {}
+
+    df = ROOT.RDataFrame("Events", ROOT.std.vector('std::string')(readable))
+    if weight:
+        df = df.Define("fm_weight", translate_expression(weight, scalar=True))
+    for i, variable in enumerate(variables):
+        df = df.Define(f"fm_var_{i}", translate_expression(variable))
+
+    booked = {}
+    for channel, cut in cuts.items():
+        selected = df.Filter(translate_expression(cut, scalar=True), f"{name}_{channel}")
+        for i, variable in enumerate(variables):
+            if keys is not None and (channel, variable) not in keys:
+                continue
+            column = f"fm_var_{i}"
+            nbins, low, high = binnings[variable]
+            title = titles.get(variable, variable) if titles else variable
+            model = ROOT.RDF.TH1DModel(f"{name}_{channel}_{variable}", title, nbins, low, high)
+            if weight:
+                booked[(channel, variable)] = selected.Histo1D(model, column, "fm_weight")
+            else:
+                booked[(channel, variable)] = selected.Histo1D(model, column)
+    return booked
+
+
+def run_booked(booked_samples):
+    """Run the event loops of all booked samples and return {sample: {(channel, variable): TH1}}."""
+    handles = [ptr for booked in booked_samples.values() for ptr in booked.values()]
+    if handles:
+        ROOT.RDF.RunGraphs(handles)
+
+    results = {}
+    for name, booked in booked_samples.items():
+        results[name] = {}
+        for key, ptr in booked.items():
+            h = ptr.GetValue().Clone()
+            h.SetDirectory(0)
+            results[name][key] = h
+    return results
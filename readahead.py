@@ -0,0 +1,175 @@
+"""Read-ahead of the input files for the draw engine.
+
+Opening a file on /hdfs and reading its first baskets costs more than filling the histograms for
+the many small samples (DiBoson, STop, the data eras). read_ahead() opens the next files in
+background threads, enables only the branches the fill needs and warms their TTreeCache with the
+first cluster, while the caller is filling the current file. At most ``depth`` files are open
+ahead of the one being processed.
+
+A long-lived process (plot_daemon.py) can also keep the files open between fills with
+keep_files_open(); a handle is taken out of that pool while it is in use, so two threads never
+read the same TTree. bytes_read() counts what the current fill read from such a file.
+"""
+import concurrent.futures
+import threading
+import time
+from collections import OrderedDict, deque
+
+import ROOT
+
+import timing
+from expressions import activate_branches
+from hist_cache import file_state
+
+## Bytes of TTreeCache per open file
+CACHE_SIZE = 30 * 1024**2
+
+_thread_safety = []
+
+## Open (file, tree, file state) by path, least recently released first; None unless keep_files_open() was called
+_handles = None
+_max_handles = 0
+_handles_lock = threading.Lock()
+## GetBytesRead() of the kept-open files when they were taken out of the pool, by id of the file
+_read_before = {}
+## Called with the tree of every file before it is closed, see on_close()
+_close_hooks = []
+
+
+def enable_thread_safety():
+    """ROOT has to be told before a second thread opens files; once per process is enough."""
+    if not _thread_safety:
+        ROOT.EnableThreadSafety()
+        _thread_safety.append(True)
+
+
+def keep_files_open(max_files):
+    """Keep up to ``max_files`` files open after release() instead of closing them."""
+    global _handles, _max_handles
+    with _handles_lock:
+        if _handles is None:
+            _handles = OrderedDict()
+        _max_handles = max_files
+
+
+def keeps_files_open():
+    return _handles is not None
+
+
+def on_close(hook):
+    """Call ``hook(tree)`` before the file of ``tree`` is closed by release(), e.g. to drop what refers to the tree."""
+    _close_hooks.append(hook)
+
+
+def _close(root_file, tree):
+    for hook in _close_hooks:
+        hook(tree)
+    root_file.Close()
+
+
+def _checkout(full_path):
+    with _handles_lock:
+        if not _handles or full_path not in _handles:
+            return None
+        root_file, tree, state = _handles.pop(full_path)
+    if state != file_state(full_path):
+        _close(root_file, tree)
+        return None
+    _read_before[id(root_file)] = root_file.GetBytesRead()
+    return root_file, tree
+
+
+def bytes_read(root_file):
+    """Bytes read from a file of open_events since it was opened, or taken out of the kept-open files."""
+    return root_file.GetBytesRead() - _read_before.get(id(root_file), 0)
+
+
+def release(full_path, root_file, tree):
+    """Give back a file from open_events: closed, or kept open for the next fill with keep_files_open()."""
+    _read_before.pop(id(root_file), None)
+    state = file_state(full_path)
+    with _handles_lock:
+        if _handles is None or state is None or full_path in _handles:
+            _close(root_file, tree)
+            return
+        _handles[full_path] = (root_file, tree, state)
+        while len(_handles) > _max_handles:
+            _, (oldest, oldest_tree, _) = _handles.popitem(last=False)
+            _close(oldest, oldest_tree)
+
+
+def open_events(full_path, exprs=(), cache_size=CACHE_SIZE):
+    """Open ``full_path`` and prepare its Events tree for reading ``exprs``.
+
+    Returns (file, tree), or None if the file or the tree could not be read.
+    """
+    start = time.perf_counter()
+    opened = _checkout(full_path)
+    if opened is not None:
+        root_file, tree = opened
+        ## Whatever the previous fill enabled
+        tree.SetBranchStatus("*", 1)
+    else:
+        root_file = ROOT.TFile.Open(full_path, "READ")
+        if not root_file or root_file.IsZombie():
+            print(f"Could not open {full_path}")
+            return None
+        tree = root_file.Get("Events")
+        if not tree:
+            print(f"No Events tree in {full_path}")
+            root_file.Close()
+            return None
+
+    active = activate_branches(tree, *exprs) if exprs else None
+    if cache_size:
+        tree.SetCacheSize(cache_size)
+        for name in (active if active is not None else ["*"]):
+            tree.AddBranchToCache(name, True)
+        tree.StopCacheLearningPhase()
+        ## Pulls the first cluster of every cached branch in one vectored read
+        if tree.GetEntries() > 0:
+            tree.GetEntry(0)
+    timing.record_file(full_path, open_time=time.perf_counter() - start)
+    return root_file, tree
+
+
+def read_ahead(paths, exprs=(), depth=2):
+    """Yield (path, opened) for every path in order, ``opened`` as returned by open_events.
+
+    With ``depth`` > 0 the next ``depth`` files are opened in background threads. The caller
+    owns the files it receives and closes them; the files opened ahead are released if it stops
+    early (close() of the generator).
+    """
+    if depth <= 0:
+        for path in paths:
+            yield path, open_events(path, exprs)
+        return
+
+    enable_thread_safety()
+    pending = deque()
+    remaining = iter(paths)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=depth) as pool:
+        for path in remaining:
+            pending.append((path, pool.submit(open_events, path, exprs)))
+            if len(pending) >= depth:
+                break
+        try:
+            while pending:
+                path, future = pending.popleft()
+                for next_path in remaining:
+                    pending.append((next_path, pool.submit(open_events, next_path, exprs)))
+                    break
+                yield path, future.result()
+        finally:
+            ## Nobody will fill the files opened ahead
+            for _, future in pending:
+                future.cancel()
+            for path, future in pending:
+                if future.cancelled():
+                    continue
+                try:
+                    opened = future.result()
+                except Exception:
+                    continue
+                if opened is not None:
+                    release(path, *opened)
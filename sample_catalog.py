@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Indexed sample catalog: the files of every sample with their metadata (``--catalog``).
+
+samples.py and observed.py only list file names. The catalog resolves them once (MC names
+against the MC directory, glob patterns expanded) and records for every file its size, mtime,
+entries of the Events tree, sum of the generator weights (genEventSumw of the Runs tree, MC only)
+and sha256, in one JSON file:
+
+    python3 sample_catalog.py build --out catalog.json --workers 16
+    python3 norm.py --catalog catalog.json ...        (CATALOG in parallel.py)
+
+The scan opens every file once, in parallel worker processes; a rebuild reuses the records of the
+local files whose size and mtime did not change. Loading the catalog is a single json.load, and
+the file lists, sizes (scheduler cost estimates) and the state of remote files (cache and index
+keys, see hist_cache.file_state) then come from it without opening any ROOT file.
+"""
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+from hist_cache import file_state
+
+VERSION = 1
+KINDS = ("background", "signal", "data")
+
+## The catalog given to norm.py or the scheduler, see use()
+_active = None
+
+
+class Catalog:
+    def __init__(self, data, path=None):
+        self.path = path
+        self.built = data.get("built")
+        self._samples = data["samples"]
+        self.files = data["files"]
+
+    def samples(self, kind):
+        """{sample: [paths]} of ``kind`` (background, signal or data), in the order of samples.py and observed.py."""
+        return {sample: list(paths) for sample, paths in self._samples.get(kind, {}).items()}
+
+    def info(self, path):
+        """The record of ``path`` (size, mtime_ns, entries, sum_weights, sha256), None if it was not scanned."""
+        return self.files.get(path)
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != VERSION:
+        raise ValueError(f"{path} is a version {data.get('version')} catalog, rebuild it with sample_catalog.py build")
+    return Catalog(data, path)
+
+
+def use(path):
+    """Load the catalog at ``path`` and make it the one norm.py, the scheduler and the caches use."""
+    global _active
+    _active = load(path) if path else None
+    return _active
+
+
+def active():
+    return _active
+
+
+def file_size(path):
+    """Size of ``path`` from the active catalog, else from the file system (0 if unknown)."""
+    record = _active.info(path) if _active is not None else None
+    if record is not None:
+        return record["size"]
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def remote_state(path):
+    ## Remote files have no mtime: they are known by what the catalog scan recorded
+    record = _active.info(path) if _active is not None else None
+    if record is None:
+        return None
+    return (path, record["size"], record["entries"], record["sha256"])
+
+
+def _expand(path):
+    if "://" in path or not glob.has_magic(path):
+        return [path]
+    matches = sorted(glob.glob(path))
+    if not matches:
+        print(f"No file matches {path}")
+    return matches
+
+
+def source_samples(mc_dir, data_dir=None):
+    """{kind: {sample: [paths]}} of samples.py and observed.py, with the glob patterns expanded."""
+    from samples import Backgrounds, Signals
+    from observed import observed
+
+    def mc_path(path):
+        return path if os.path.isabs(path) or "://" in path else os.path.join(mc_dir, path)
+
+    def data_path(path):
+        return path if data_dir is None else os.path.join(data_dir, os.path.basename(path))
+
+    sources = {
+        "background": {proc_name: [mc_path(path) for path in proc_info["files"]]
+                       for sample_type in Backgrounds.values() for proc_name, proc_info in sample_type.items()},
+        "signal": {sample: [mc_path(path) for path in info["files"]] for sample, info in Signals.items()},
+        "data": {era: [data_path(path) for path in info["files"]] for era, info in observed.items()},
+    }
+    return {kind: {sample: [match for path in paths for match in _expand(path)] for sample, paths in samples.items()}
+            for kind, samples in sources.items()}
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(16 * 1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_file(path, previous=None, checksum=True):
+    """Catalog record of ``path``; ``previous`` is reused for a local file whose size and mtime did not change."""
+    state = file_state(path) if "://" not in path else None
+    if previous and state and (previous["size"], previous["mtime_ns"]) == state[1:]:
+        return previous
+    import ROOT
+    f = ROOT.TFile.Open(path, "READ")
+    if not f or f.IsZombie():
+        raise OSError(f"Could not open {path}")
+    tree = f.Get("Events")
+    runs = f.Get("Runs")
+    sum_weights = None
+    if runs and runs.GetBranch("genEventSumw"):
+        sum_weights = sum(run.genEventSumw for run in runs)
+    record = {
+        "size": state[1] if state else f.GetSize(),
+        "mtime_ns": state[2] if state else None,
+        "entries": tree.GetEntries() if tree else 0,
+        "sum_weights": sum_weights,
+        ## Remote files would have to be read through in full: only local ones get a checksum
+        "sha256": _sha256(path) if checksum and state else None,
+    }
+    f.Close()
+    return record
+
+
+def build(out, mc_dir, data_dir=None, workers=None, checksum=True):
+    """Scan every file of samples.py and observed.py and write the catalog to ``out``."""
+    samples = source_samples(mc_dir, data_dir)
+    previous = {}
+    if os.path.exists(out):
+        try:
+            previous = load(out).files
+        except (ValueError, KeyError):
+            pass
+    paths = list(dict.fromkeys(path for kind in KINDS for paths in samples[kind].values() for path in paths))
+    files, failed = {}, []
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as pool:
+        futures = {pool.submit(scan_file, path, previous.get(path), checksum): path for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                files[path] = future.result()
+            except Exception as error:
+                failed.append(path)
+                print(f"Could not scan {path}: {error}")
+    data = {"version": VERSION, "built": time.time(), "mc_dir": mc_dir, "samples": samples,
+            "files": {path: files[path] for path in paths if path in files}}
+    tmp = out + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, out)
+    reused = sum(1 for path, record in files.items() if previous.get(path) is record or previous.get(path) == record)
+    print(f"Catalog of {len(files)} files written to {out} ({reused} unchanged, {len(failed)} failed)")
+    return Catalog(data, out)
+
+
+def summary(catalog):
+    for kind in KINDS:
+        for sample, paths in catalog.samples(kind).items():
+            records = [catalog.info(path) for path in paths]
+            known = [record for record in records if record is not None]
+            size = sum(record["size"] for record in known) / 1024**3
+            entries = sum(record["entries"] for record in known)
+            sum_weights = sum(record["sum_weights"] or 0 for record in known)
+            print(f"[{kind}] {sample}: {len(paths)} files ({len(paths) - len(known)} not scanned), "
+                  f"{size:.2f} GB, {entries} entries, sum of weights {sum_weights:.6g}")
+
+
+if __name__ == "__main__":
+    from samples import redirector_MC
+    parser = argparse.ArgumentParser(description="Build or show the sample catalog.")
+    parser.add_argument("command", choices=["build", "show"])
+    parser.add_argument("--out", "--catalog", dest="catalog", default="catalog.json", help="Catalog file.")
+    parser.add_argument("--mc_dir", default=redirector_MC, help="Directory of the MC files listed in samples.py.")
+    parser.add_argument("--data_dir", default=None, help="Directory holding the observed files by name (default: the paths in observed.py).")
+    parser.add_argument("--workers", type=int, default=None, help="Scan processes (default: one per core).")
+    parser.add_argument("--no_checksum", action="store_true", help="Do not compute the sha256 of the local files.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        summary(build(args.catalog, args.mc_dir, args.data_dir, args.workers, not args.no_checksum))
+    else:
+        summary(load(args.catalog))
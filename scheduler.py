@@ -0,0 +1,507 @@
+"""In-process campaign scheduler used by parallel.py.
+
+A campaign is a list of plots (channel, variable, y-axis scale). It is planned as one fill task
+per input file that covers every variable and channel of the campaign, so each file is read once.
+The tasks run on a pool of long-lived worker processes that import ROOT, norm.py and the sample
+dictionaries once. The parent merges the partial histograms as they come back, then sends the
+merged histograms to the same pool to be rendered. Every task writes its output to its own log file
+and returns its timing records (see timing.py), which are merged into log_dir/timing.json.
+
+The fill tasks are submitted longest first: log_dir/cost_history.json keeps the fill time and
+size of every input file of the previous campaigns, and a file never seen before is costed from
+its size. The same history gives the peak memory of a worker, which with the available memory
+and cores sizes the pool when no max_workers is given. log_dir/campaign_state.json records what
+each plot was made from, so a rerun only fills and draws the plots whose inputs, cuts or weights
+changed or whose PNG is missing. Those plots then start from the per-sample histograms of the
+store and only the files added to the catalog since are filled (see norm.split_updates).
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import multiprocessing
+import json
+import os
+import resource
+import statistics
+import sys
+from collections import namedtuple
+from contextlib import contextmanager
+
+import timing
+
+Plot = namedtuple("Plot", ["channel", "variable", "log_scale"])
+FillTask = namedtuple("FillTask", ["kind", "sample", "path", "log_file"])
+
+## Worker process state, set once by _init_worker
+_worker = {}
+
+COST_HISTORY = "cost_history.json"
+CAMPAIGN_STATE = "campaign_state.json"
+## Peak memory of a worker before any campaign has been recorded
+DEFAULT_WORKER_MB = 1500
+
+
+def safe_name(text):
+    return (
+        text.replace("[", "")
+        .replace("]", "")
+        .replace("(", "")
+        .replace(")", "")
+        .replace("/", "_")
+    )
+
+
+@contextmanager
+def log_to(log_file):
+    """Send Python and ROOT (C++) output of the enclosed block to ``log_file``."""
+    import ROOT
+    sys.stdout.flush()
+    sys.stderr.flush()
+    ROOT.gSystem.RedirectOutput(log_file, "w")
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        ROOT.gSystem.RedirectOutput(ROOT.nullptr)
+
+
+def _init_worker(settings):
+    import auto_binning
+    ## Declares and JIT-compiles FillMultiple when the worker starts, not in its first fill task
+    import norm  # noqa: F401
+    import systematics
+    _worker.update(settings)
+    if settings.get("catalog"):
+        import sample_catalog
+        sample_catalog.use(settings["catalog"])
+    auto_binning.enable(settings["auto_variables"])
+    _worker["variations"] = systematics.parse_systematics(settings["systematics"])
+    _worker["cache"] = None
+    if settings.get("cache_dir"):
+        from hist_cache import HistogramCache
+        _worker["cache"] = HistogramCache(settings["cache_dir"], int(settings["cache_size"] * 1024**3))
+    _worker["index"] = None
+    if settings.get("index_dir"):
+        from entry_index import EntryIndex
+        _worker["index"] = EntryIndex(settings["index_dir"])
+
+
+def _fill(task):
+    import norm
+    import timing
+    timing.reset()
+    weight = None if task.kind == "data" else _worker["weights"]
+    ## The systematic variations only enter the background band
+    variations = _worker["variations"] if task.kind == "background" else ()
+    failed = []
+    with log_to(task.log_file), timing.stage(f"fill_{task.kind}"):
+        filled = norm.fill_samples({task.sample: [task.path]}, _worker["variables"], _worker["cuts"],
+                                   weight, "draw", _worker["cache"], index=_worker["index"], variations=variations,
+                                   failed=failed)
+    if failed:
+        raise RuntimeError(f"Could not fill {task.path}, see {task.log_file}")
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return filled.get(task.sample, {}), timing.report(peak_rss_mb=peak_rss_mb)
+
+
+def _render(plot, group_hists, signals, data, variations, edges, summary, log_file):
+    import auto_binning
+    import norm
+    import timing
+    timing.reset()
+    if edges:
+        auto_binning.set_edges(plot.variable, edges)
+    args = argparse.Namespace(
+        year=_worker["year"],
+        log_scale=plot.log_scale,
+        signals_only=_worker["mode"] == "signals_only",
+        dataMC=_worker["mode"] == "dataMC",
+    )
+    with log_to(log_file), timing.stage("render"):
+        norm.render_plot(args, plot.channel, plot.variable, group_hists, signals, data, variations, summary=summary)
+    return timing.report()
+
+
+def plot_log_file(plot, mode, log_dir="logs"):
+    return os.path.join(log_dir, f"log_{plot.channel}_{safe_name(plot.variable)}_{mode}.txt")
+
+
+def plan_fill_tasks(mode="dataMC", log_dir="logs", resolve=None):
+    """One FillTask per input file needed for plots in ``mode``.
+
+    ``resolve`` maps a {sample: [paths]} dict to the paths actually read, e.g. skim.use_skims.
+    """
+    import norm
+    kinds = [("signal", norm.signal_samples())]
+    if mode != "signals_only":
+        kinds.insert(0, ("background", norm.background_samples()))
+    if mode == "dataMC":
+        kinds.append(("data", norm.data_samples()))
+
+    tasks = []
+    for kind, samples in kinds:
+        if resolve is not None:
+            samples = resolve(samples)
+        for sample, paths in samples.items():
+            for path in paths:
+                stem = os.path.basename(path).replace(".root", "")
+                tasks.append(FillTask(kind, sample, path, os.path.join(log_dir, f"fill_{kind}_{stem}.txt")))
+    return tasks
+
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _file_size(path):
+    from sample_catalog import file_size
+    return file_size(path)
+
+
+def available_memory_mb():
+    """MemAvailable of /proc/meminfo in MB, None where it cannot be read."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def auto_workers(log_dir="logs", max_workers=None):
+    """Worker processes that fit in the cores and the available memory, at most ``max_workers``."""
+    per_worker = _load_json(os.path.join(log_dir, COST_HISTORY)).get("peak_rss_mb") or DEFAULT_WORKER_MB
+    workers = os.cpu_count() or 1
+    memory = available_memory_mb()
+    if memory is not None:
+        ## Leave some room for the parent, which holds the merged histograms
+        workers = min(workers, max(1, int(0.9 * memory // per_worker)))
+    if max_workers:
+        workers = min(workers, max_workers)
+    return workers
+
+
+def estimate_costs(tasks, log_dir="logs"):
+    """Expected seconds of each task: the last fill time of its file, else its size at the median rate."""
+    files = _load_json(os.path.join(log_dir, COST_HISTORY)).get("files", {})
+    rates = [record["seconds"] / record["size"] for record in files.values() if record.get("size")]
+    rate = statistics.median(rates) if rates else None
+    costs = {}
+    for task in tasks:
+        size = _file_size(task.path)
+        record = files.get(task.path)
+        if record is not None and record.get("size") == size:
+            costs[task] = record["seconds"]
+        elif rate is not None:
+            costs[task] = size * rate
+        else:
+            ## No history yet: relative cost only, still orders the tasks
+            costs[task] = size
+    return costs
+
+
+def update_cost_history(reports, log_dir="logs"):
+    path = os.path.join(log_dir, COST_HISTORY)
+    history = _load_json(path)
+    files = history.setdefault("files", {})
+    for file_path, record in timing.aggregate(reports)["files"].items():
+        seconds = record.get("open_time", 0) + record.get("fill_time", 0)
+        if seconds > 0:
+            files[file_path] = {"seconds": seconds, "size": _file_size(file_path)}
+    peaks = [rep["peak_rss_mb"] for rep in reports if rep.get("peak_rss_mb")]
+    if peaks:
+        history["peak_rss_mb"] = max(peaks)
+    _save_json(path, history)
+
+
+def plot_signature(plot, mode, year, weights, base_cut, additional_cuts, inputs, systematics=(), binning=None):
+    """Hash of everything a plot is made from; ``inputs`` are the (path, size, mtime) of its files.
+
+    ``binning`` describes an automatic binning, the dictionary binning is used otherwise.
+    """
+    import norm
+    text = repr((plot, mode, year, weights, base_cut, tuple(additional_cuts), binning or norm.get_binning(plot.variable),
+                 inputs, tuple(systematics)))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def input_states(tasks):
+    """File states of the inputs of ``tasks``, remote files are compared by path only."""
+    from hist_cache import file_state
+    return sorted(file_state(task.path) or (task.path,) for task in tasks)
+
+
+def pending_plots(plots, signatures, mode, year, log_dir="logs"):
+    """The plots with a missing PNG or made from other inputs than ``signatures``."""
+    import norm
+    done = _load_json(os.path.join(log_dir, CAMPAIGN_STATE))
+    return [plot for plot in plots
+            if done.get(_state_key(plot, mode)) != signatures[plot]
+            or not all(os.path.exists(path) for path in norm.plot_files(year, mode, plot.channel, plot.variable))]
+
+
+def incremental_tasks(tasks, store, plot_keys, weights, base_cut, additional_cuts, systematics=()):
+    """The fill tasks of the files not in ``store`` yet, and {kind: {sample: {key: [hist]}}} to start from."""
+    import norm
+    from hist_store import read_samples, same_selection
+    from systematics import parse_systematics, variation_keys
+    hists, inputs, meta = read_samples(store)
+    if not same_selection(meta, weights, base_cut, additional_cuts, systematics):
+        return tasks, {}
+    background_keys = plot_keys + variation_keys(plot_keys, parse_systematics(systematics))
+    todo, start = {}, {}
+    for kind in ("background", "signal", "data"):
+        samples = {}
+        for task in tasks:
+            if task.kind == kind:
+                samples.setdefault(task.sample, []).append(task.path)
+        keys = background_keys if kind == "background" else plot_keys
+        todo[kind], start[kind] = norm.split_updates(kind, samples, (hists, inputs), keys)
+    return [task for task in tasks if task.path in todo[task.kind].get(task.sample, ())], start
+
+
+def _state_key(plot, mode):
+    return f"{mode} {plot.channel} {plot.variable}"
+
+
+def run_campaign(plots, base_cut, weights, year="2024", mode="dataMC", additional_cuts=(),
+                 max_workers=None, log_dir="logs", cache_dir=None, cache_size=10.0, skim_dir=None,
+                 index_dir=None, store=None, render_from=None, resume=False, systematics=(), auto_binning=None,
+                 auto_bins=20, variable_width=False, catalog=None, progress_bar=None):
+    """Fill and render every plot of the campaign, returns the log files of the failed tasks.
+
+    ``mode`` is one of "dataMC", "signals_only" or "SignalandBackground". ``progress_bar`` is an
+    optional tqdm bar, updated once per finished fill or render task. With ``skim_dir`` the
+    inputs are skimmed first (see skim.py) and the fill tasks read the skims. With ``index_dir``
+    the fill tasks share the per-file entry lists of the channel cuts (see entry_index.py).
+    ``store`` writes every merged histogram to a histogram store, and ``render_from`` skips the
+    filling and draws the plots from such a store (see hist_store.py).
+
+    With ``resume`` the plots already drawn from the same inputs, cuts and weights are skipped.
+    ``max_workers`` None sizes the pool from the cores and the available memory. ``systematics``
+    are norm.py --systematics specs, filled with the backgrounds and drawn in the uncertainty band.
+    ``auto_binning`` ("missing" or "all"), ``auto_bins`` and ``variable_width`` are the norm.py
+    automatic binning options, the edges are chosen here once every fill task is merged. ``catalog``
+    is a sample catalog (see sample_catalog.py) giving the files and their sizes, in every worker too.
+    If a fill task fails, no plot is drawn and the store is not written.
+    Raises ValueError if an axis of a multi-dimensional variable would be binned automatically.
+    """
+    import norm
+    import auto_binning as binning
+    import sample_catalog
+    from systematics import parse_systematics
+    from variable_dictionaries import variableSettingDictionary
+    timing.reset()
+    binning.reset()
+    sample_catalog.use(catalog)
+    os.makedirs(log_dir, exist_ok=True)
+    for dirname in ["SignalandBackground", "Signal_only", "DataMC", "Correlations"]:
+        os.makedirs(dirname, exist_ok=True)
+    if max_workers is None:
+        max_workers = auto_workers(log_dir)
+
+    all_plots = list(plots)
+    auto_variables = list(dict.fromkeys(
+        plot.variable for plot in all_plots if not norm.is_multidim(plot.variable)
+        and (auto_binning == "all" or (auto_binning and plot.variable not in variableSettingDictionary))))
+    nd_auto = norm.auto_binned_axes([plot.variable for plot in all_plots], auto_variables)
+    if nd_auto:
+        raise ValueError("Automatic binning cannot bin the axes of multi-dimensional variables, plot them in another campaign: "
+                         + ", ".join(f"{variable} ({', '.join(axes)})" for variable, axes in nd_auto.items()))
+    auto_settings = ("auto", auto_bins, variable_width)
+    signatures = {}
+    if not render_from:
+        inputs = input_states(plan_fill_tasks(mode, log_dir))
+        signatures = {plot: plot_signature(plot, mode, year, weights, base_cut, additional_cuts, inputs, systematics,
+                                           auto_settings if plot.variable in auto_variables else None)
+                      for plot in all_plots}
+        if resume:
+            plots = pending_plots(all_plots, signatures, mode, year, log_dir)
+            if progress_bar is not None and len(plots) < len(all_plots):
+                progress_bar.write(f"{len(all_plots) - len(plots)} plots up to date, {len(plots)} to make")
+    if not plots:
+        with open(os.path.join(log_dir, "timing.json"), "w") as f:
+            json.dump(timing.aggregate([]), f)
+        return []
+
+    channels = list(dict.fromkeys(plot.channel for plot in plots))
+    variables = list(dict.fromkeys(plot.variable for plot in plots))
+    plot_keys = [(plot.channel, plot.variable) for plot in plots]
+    settings = {
+        "year": year,
+        "mode": mode,
+        "weights": weights,
+        "variables": variables,
+        "cuts": norm.make_channel_cuts(channels, base_cut, additional_cuts),
+        "cache_dir": cache_dir,
+        "index_dir": index_dir,
+        "cache_size": cache_size,
+        "systematics": list(systematics),
+        "auto_variables": [variable for variable in auto_variables if variable in variables],
+        "catalog": catalog,
+    }
+    binning.enable(settings["auto_variables"])
+
+    resolve = None
+    ## The skims only keep the events and branches of the nominal selection
+    if skim_dir and not render_from and not systematics:
+        import skim
+        samples = dict(norm.signal_samples())
+        if mode != "signals_only":
+            samples.update(norm.background_samples())
+        if mode == "dataMC":
+            samples.update(norm.data_samples())
+        branches = skim.campaign_branches(variables, settings["cuts"], weights)
+        failed_skims = skim.skim_campaign(samples, skim_dir, branches, settings["cuts"], base_cut, channels,
+                                          additional_cuts, max_workers=max_workers, progress_bar=progress_bar)
+        for source in failed_skims:
+            if progress_bar is not None:
+                progress_bar.write(f"Skim failed, reading original: {source}")
+        resolve = lambda samples: skim.use_skims(samples, skim_dir, branches, base_cut, channels, additional_cuts)
+
+    tasks = [] if render_from else plan_fill_tasks(mode, log_dir, resolve)
+    costs = estimate_costs(tasks, log_dir)
+    ## Longest first, so no long file starts last and holds up the merge
+    tasks.sort(key=lambda task: -costs[task])
+    read_inputs = {}
+    for task in tasks:
+        read_inputs.setdefault(task.kind, {}).setdefault(task.sample, []).append(task.path)
+    results = {"background": {}, "signal": {}, "data": {}}
+    if resume and store and tasks and os.path.exists(store):
+        ## Every file still in the store is taken from it, only the new ones are read
+        tasks, start = incremental_tasks(tasks, store, plot_keys, weights, base_cut, additional_cuts, systematics)
+        for kind, samples in start.items():
+            results[kind] = {sample: {key: list(hlist) for key, hlist in plot_hists.items()}
+                             for sample, plot_hists in samples.items()}
+    if progress_bar is not None:
+        progress_bar.reset(total=len(tasks) + len(plots))
+
+    def finished(log_file, error=None):
+        if progress_bar is not None:
+            progress_bar.update(1)
+            if error is not None:
+                progress_bar.write(f"Failed: {log_file} ({error})")
+
+    failed = []
+    reports = []
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                                initializer=_init_worker, initargs=(settings,)) as pool:
+        futures = {pool.submit(_fill, task): task for task in tasks}
+        for future in concurrent.futures.as_completed(futures):
+            task = futures[future]
+            try:
+                file_hists, report = future.result()
+            except Exception as error:
+                failed.append(task.log_file)
+                ## Not in the store inputs, a resumed campaign reads the file again
+                read_inputs[task.kind][task.sample].remove(task.path)
+                finished(task.log_file, error)
+                continue
+            reports.append(report)
+            ## Added to the sample totals as they come, the per-file histograms are not kept
+            sample_hists = results[task.kind].setdefault(task.sample, {})
+            for key, hlist in file_hists.items():
+                for h in hlist:
+                    norm.accumulate(sample_hists, key, h)
+            finished(task.log_file)
+
+        if failed_fills(failed, tasks):
+            ## The totals miss the failed files: keep the previous plots and store rather than draw lower yields
+            message = f"{len(plots)} plots not drawn and no store written, {len(failed)} fill tasks failed"
+            if progress_bar is not None:
+                progress_bar.update(len(plots))
+                progress_bar.write(message)
+            else:
+                print(message)
+            plots, plot_keys = [], []
+
+        signal_names = [sample for sample, label, color in norm.SIGNAL_POINTS]
+        with log_to(os.path.join(log_dir, "merge.txt")):
+            if render_from:
+                from hist_store import read_store
+                group_hists, signals, data, shifted, _ = read_store(render_from, signal_names)
+                for (channel, variable), groups in group_hists.items():
+                    if groups and not norm.is_multidim(variable):
+                        binning.set_edges(variable, binning.axis_edges(next(iter(groups.values()))))
+            else:
+                if settings["auto_variables"]:
+                    with timing.stage("auto_binning"):
+                        binning.finalize(results.values(), auto_bins, variable_width)
+                with timing.stage("group_backgrounds"):
+                    group_hists = norm.group_backgrounds(results["background"], plot_keys)
+                    shifted = norm.background_variations(results["background"], plot_keys,
+                                                         parse_systematics(systematics))
+                with timing.stage("collect_signals"):
+                    signals = norm.collect_signals(results["signal"], plot_keys)
+                with timing.stage("sum_data"):
+                    data = norm.sum_data(results["data"], plot_keys) if mode == "dataMC" else {}
+            if store and not render_from and plot_keys:
+                from hist_store import write_store
+                with timing.stage("store"):
+                    write_store(store, plot_keys, group_hists, signals, signal_names, data, results["background"],
+                                results["data"], meta={"year": year, "weights": weights, "cuts": base_cut,
+                                                       "additional_cuts": " && ".join(additional_cuts),
+                                                       "systematics": " ".join(systematics)},
+                                update=len(plots) < len(all_plots), inputs=read_inputs, variations=shifted)
+            ## Totals, bands and ratios of all the plots in one go, the workers only draw
+            summaries = {}
+            if mode != "signals_only":
+                with timing.stage("summarize"):
+                    summaries = norm.summarize_plots([plot_key for plot_key in plot_keys if plot_key in group_hists],
+                                                     group_hists, data if mode == "dataMC" else {}, shifted)
+
+        futures = {}
+        for plot, plot_key in zip(plots, plot_keys):
+            log_file = plot_log_file(plot, mode, log_dir)
+            if plot_key not in group_hists:
+                failed.append(log_file)
+                finished(log_file, "not in the histogram store")
+                continue
+            future = pool.submit(_render, plot, group_hists[plot_key], signals[plot_key], data.get(plot_key),
+                                 shifted.get(plot_key), binning.edges(plot.variable), summaries.get(plot_key), log_file)
+            futures[future] = plot
+        drawn = []
+        for future in concurrent.futures.as_completed(futures):
+            log_file = plot_log_file(futures[future], mode, log_dir)
+            try:
+                reports.append(future.result())
+            except Exception as error:
+                failed.append(log_file)
+                finished(log_file, error)
+                continue
+            drawn.append(futures[future])
+            finished(log_file)
+
+    reports.append(timing.report())
+    with open(os.path.join(log_dir, "timing.json"), "w") as f:
+        json.dump(timing.aggregate(reports), f, indent=1, sort_keys=True)
+    if tasks:
+        update_cost_history(reports, log_dir)
+    ## A plot drawn from a store is only as current as the store, keep its state as it was
+    if signatures and not failed_fills(failed, tasks):
+        state_path = os.path.join(log_dir, CAMPAIGN_STATE)
+        done = _load_json(state_path)
+        done.update({_state_key(plot, mode): signatures[plot] for plot in drawn})
+        _save_json(state_path, done)
+    return failed
+
+
+def failed_fills(failed, tasks):
+    """True if any fill task is among the ``failed`` log files, its plots then miss that input."""
+    logs = {task.log_file for task in tasks}
+    return any(log_file in logs for log_file in failed)
@@ -0,0 +1,156 @@
+"""Partial results of one shard of a campaign (``norm.py --shard I/N --partial``), merged by ``norm.py --merge_from``.
+
+A shard fills every N-th file of each kind (background, signal, data) of the catalog, starting at
+the I-th, so the N shards of a campaign can run on as many batch nodes, or as separate processes
+on one machine. It writes one histogram per file and plot to its partial file:
+
+    meta/<name>                     TNamed: year, weights, cuts, variables, the shard and the catalog
+    <kind>_<position>/file          TNamed, JSON of the sample, path and position of the file
+    <kind>_<position>/keys          TNamed, JSON of the plot key of each histogram
+    <kind>_<position>/h<i>          one histogram per (channel, variable[, variation])
+
+The merge puts every file back at its position in the catalog and adds the histograms in that
+order into the sample totals: the result is bit-identical whatever the number of shards and the
+order of the partial files. A file filled by two partials is taken once. Files missing from the
+partials (a forgotten shard, a failed file) are an error, unless the merge allows them.
+"""
+import json
+import os
+
+import ROOT
+
+from hist_cache import detach
+
+KINDS = ("background", "signal", "data")
+
+
+def parse_shard(spec):
+    """(index, count) of a shard given as I/N, 0 <= I < N."""
+    index, _, count = spec.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"Cannot parse shard {spec!r}, expected I/N") from None
+    if not 0 <= index < count:
+        raise ValueError(f"Shard {spec!r} out of range, I must be in [0, N)")
+    return index, count
+
+
+def positions(samples):
+    """{(sample, path): position} of the files of ``samples`` ({sample: [paths]}) in catalog order."""
+    order = [(sample, path) for sample, paths in samples.items() for path in paths]
+    return {file_key: position for position, file_key in enumerate(order)}
+
+
+def select(samples, shard):
+    """The files of ``samples`` in ``shard``, as {sample: [paths]}; samples without any are left out."""
+    index, count = shard
+    selected = {}
+    for (sample, path), position in positions(samples).items():
+        if position % count == index:
+            selected.setdefault(sample, []).append(path)
+    return selected
+
+
+def write_partial(path, shard, catalog, filled, meta):
+    """Write the per-file histograms of one shard.
+
+    ``catalog`` ({kind: {sample: [paths]}}) is the full, unsharded catalog and ``filled`` the
+    per_file results of norm.fill_samples for each kind. ``meta`` are the settings the merge must
+    agree on (weights, cuts, variables, ...).
+    """
+    tmp = path + ".tmp"
+    f = ROOT.TFile(tmp, "RECREATE")
+    top = f.mkdir("meta")
+    for key, value in dict(meta, shard="{}/{}".format(*shard), catalog=json.dumps(catalog)).items():
+        top.WriteTObject(ROOT.TNamed(key, value), key)
+    for kind, by_sample in filled.items():
+        where = positions(catalog[kind])
+        for sample, files in by_sample.items():
+            for source, file_hists in files.items():
+                position = where[(sample, source)]
+                d = f.mkdir(f"{kind}_{position}")
+                d.WriteTObject(ROOT.TNamed("file", json.dumps({"kind": kind, "sample": sample, "path": source,
+                                                               "position": position})), "file")
+                keys = []
+                for i, (key, h) in enumerate(file_hists.items()):
+                    d.WriteTObject(h, f"h{i}")
+                    keys.append([list(key), h.GetName()])
+                d.WriteTObject(ROOT.TNamed("keys", json.dumps(keys)), "keys")
+    f.Close()
+    os.replace(tmp, path)
+
+
+def _open_partial(path):
+    f = ROOT.TFile.Open(path, "READ")
+    if not f or f.IsZombie():
+        raise OSError(f"Could not open partial result {path}")
+    meta_dir = f.Get("meta")
+    meta = {key.GetName(): key.ReadObj().GetTitle() for key in meta_dir.GetListOfKeys()} if meta_dir else {}
+    files = {}
+    for key in f.GetListOfKeys():
+        if key.GetName() != "meta":
+            files[key.GetName()] = json.loads(f.Get(key.GetName()).Get("file").GetTitle())
+    return f, meta, files
+
+
+def _file_hists(d):
+    file_hists = {}
+    for i, (plot_key, name) in enumerate(json.loads(d.Get("keys").GetTitle())):
+        h = detach(d.Get(f"h{i}"))
+        h.SetName(name)
+        file_hists[tuple(plot_key)] = h
+    return file_hists
+
+
+def read_partials(paths, allow_missing=False):
+    """Merge the partial results in ``paths``.
+
+    Returns (meta, catalog, {kind: {sample: {key: [total]}}}) like norm.fill_samples, the files of
+    every sample added in catalog order and read one at a time. Raises ValueError if the partials
+    were filled with different settings, or if files of the catalog are missing from them and
+    ``allow_missing`` is not set (they are then only reported).
+    """
+    from norm import accumulate
+    opened, meta, found = [], None, {}
+    try:
+        for path in paths:
+            f, part_meta, files = _open_partial(path)
+            opened.append(f)
+            settings = {key: value for key, value in part_meta.items() if key != "shard"}
+            if meta is None:
+                meta = settings
+            elif settings != meta:
+                different = sorted(key for key in set(settings) | set(meta) if settings.get(key) != meta.get(key))
+                raise ValueError(f"{path} was filled with other settings than {paths[0]}: {', '.join(different)}")
+            print(f"{path}: shard {part_meta.get('shard')}, {len(files)} files")
+            for name, info in files.items():
+                ## Overlapping shards filled the same file the same way
+                found.setdefault((info["kind"], info["position"]), (info["sample"], f, name))
+        if meta is None:
+            raise ValueError("No partial result to merge")
+
+        catalog = json.loads(meta["catalog"])
+        missing = {kind: [source for (sample, source), position in positions(catalog[kind]).items()
+                          if (kind, position) not in found] for kind in KINDS if kind in catalog}
+        for kind, sources in missing.items():
+            if sources:
+                print(f"[{kind}] {len(sources)} of {len(positions(catalog[kind]))} files missing from the partial results:")
+                for source in sources:
+                    print(f"    {source}")
+        if any(missing.values()) and not allow_missing:
+            raise ValueError(f"{sum(len(sources) for sources in missing.values())} files are missing from the partial "
+                             "results, merge every shard or pass --allow_missing")
+        merged = {}
+        for kind in KINDS:
+            if kind not in catalog:
+                continue
+            merged[kind] = {sample: {} for sample in catalog[kind]}
+            for position in sorted(position for (found_kind, position) in found if found_kind == kind):
+                sample, f, name = found[(kind, position)]
+                for key, h in _file_hists(f.Get(name)).items():
+                    accumulate(merged[kind][sample], key, h)
+    finally:
+        for f in opened:
+            f.Close()
+    return meta, catalog, merged
@@ -0,0 +1,204 @@
+"""Local skims of the campaign inputs (``--skim_dir``).
+
+The NanoAOD inputs carry hundreds of branches but a campaign reads only the few referenced by
+its variables, cuts and weights. The skim stage copies exactly those branches (plus the counter
+branches of the arrays among them) of the events passing the loosest common cut, i.e. the OR of
+all channel selections, into small local files. norm.py and parallel.py then read the skims
+instead of the /hdfs originals whenever a skim is valid for the requested selection.
+
+skim_dir/manifest.json records, for every source file, its size and mtime at skim time, the
+requested branches and the cuts, so a changed source or a wider request falls back to (and
+can be re-skimmed from) the original file.
+
+    python3 skim.py --variables "FatJet_pt[index_gFatJets[0]]" PuppiMET_pt \
+        --cuts "((Flag_JetVetoed==0) && (Flag_FatJetVetoed==0))" --Channel tt et mt \
+        --weights xsWeight --dataMC --skim_dir skims
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+
+from expressions import activate_branches, implies, referenced_branches
+from hist_cache import file_state
+
+MANIFEST = "manifest.json"
+
+
+def load_manifest(skim_dir):
+    path = os.path.join(skim_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(skim_dir, manifest):
+    path = os.path.join(skim_dir, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def skim_path(skim_dir, source):
+    digest = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16]
+    return os.path.join(skim_dir, digest, os.path.basename(source))
+
+
+def loosest_cut(cuts):
+    """OR of the per-channel selections, every event any channel can select passes it."""
+    return "(" + " || ".join(cuts.values()) + ")" if cuts else "(1)"
+
+
+def skim_is_valid(entry, source, branches, base_cut, channels, additional_cuts):
+    """Whether a manifest entry can stand in for ``source`` for this selection and these branches."""
+    state = file_state(source)
+    if entry is None or state is None or list(state[1:]) != entry["source_state"]:
+        return False
+    if not os.path.exists(entry["skim"]):
+        return False
+    if not set(branches) <= set(entry["requested_branches"]):
+        return False
+    if not set(channels) <= set(entry["channels"]):
+        return False
+    ## The skim cut has to be implied by the requested one: the same terms, or more of them
+    if not implies(base_cut, entry["base_cut"]):
+        return False
+    return set(entry["additional_cuts"]) <= set(additional_cuts)
+
+
+def use_skims(samples, skim_dir, branches, base_cut, channels, additional_cuts=()):
+    """Replace every path of ``samples`` ({name: [paths]}) by its skim when one is valid."""
+    manifest = load_manifest(skim_dir)
+    resolved, used = {}, 0
+    for name, paths in samples.items():
+        resolved[name] = []
+        for path in paths:
+            entry = manifest.get(os.path.abspath(path))
+            if skim_is_valid(entry, path, branches, base_cut, channels, additional_cuts):
+                resolved[name].append(entry["skim"])
+                used += 1
+            else:
+                resolved[name].append(path)
+    print(f"Using skims for {used} of {sum(len(p) for p in samples.values())} files from {skim_dir}")
+    return resolved
+
+
+def skim_file(source, dest, branches, cut):
+    """Copy the ``branches`` of the events passing ``cut`` from ``source`` into ``dest``.
+
+    Returns (entries read, entries written, kept branches).
+    """
+    import ROOT
+    f = ROOT.TFile.Open(source, "READ")
+    if not f or f.IsZombie():
+        raise OSError(f"Could not open {source}")
+    tree = f.Get("Events")
+    if not tree:
+        f.Close()
+        raise OSError(f"No Events tree in {source}")
+
+    keep = activate_branches(tree, *branches)
+    if keep is None:
+        keep = {b.GetName() for b in tree.GetListOfBranches()}
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = dest + ".tmp"
+    out = ROOT.TFile(tmp, "RECREATE")
+    skimmed = tree.CopyTree(cut)
+    entries = (tree.GetEntries(), skimmed.GetEntries())
+    skimmed.Write()
+    out.Close()
+    f.Close()
+    os.replace(tmp, dest)
+    return entries + (sorted(keep),)
+
+
+def _skim_task(source, dest, branches, cut):
+    return skim_file(source, dest, branches, cut)
+
+
+def skim_campaign(samples, skim_dir, branches, cuts, base_cut, channels, additional_cuts=(),
+                  max_workers=None, progress_bar=None):
+    """Skim every local file of ``samples`` that has no valid skim yet. Returns the failed sources."""
+    os.makedirs(skim_dir, exist_ok=True)
+    manifest = load_manifest(skim_dir)
+    cut = loosest_cut(cuts)
+    branches = sorted(branches)
+
+    todo = []
+    for paths in samples.values():
+        for path in paths:
+            if file_state(path) is None:
+                continue
+            if skim_is_valid(manifest.get(os.path.abspath(path)), path, branches, base_cut, channels, additional_cuts):
+                continue
+            todo.append(path)
+    print(f"Skimming {len(todo)} files into {skim_dir} with cut {cut}")
+    if progress_bar is not None:
+        progress_bar.reset(total=len(todo))
+
+    failed = []
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        futures = {pool.submit(_skim_task, path, skim_path(skim_dir, path), branches, cut): path for path in todo}
+        for future in concurrent.futures.as_completed(futures):
+            source = futures[future]
+            try:
+                entries_in, entries_out, kept = future.result()
+            except Exception as error:
+                failed.append(source)
+                print(f"Skim failed for {source}: {error}")
+            else:
+                manifest[os.path.abspath(source)] = {
+                    "skim": skim_path(skim_dir, source),
+                    "source_state": list(file_state(source)[1:]),
+                    "requested_branches": branches,
+                    "kept_branches": kept,
+                    "base_cut": base_cut or "",
+                    "channels": list(channels),
+                    "additional_cuts": list(additional_cuts),
+                    "cut": cut,
+                    "entries_in": entries_in,
+                    "entries_out": entries_out,
+                }
+            if progress_bar is not None:
+                progress_bar.update(1)
+
+    save_manifest(skim_dir, manifest)
+    return failed
+
+
+def campaign_branches(variables, cuts, weights):
+    return referenced_branches(*variables, weights, *cuts.values())
+
+
+if __name__ == "__main__":
+    import norm
+
+    parser = argparse.ArgumentParser(description="Skim the campaign inputs to the branches and events it needs.")
+    parser.add_argument("--variables", nargs="+", required=True, help="Variables the campaign will plot.")
+    parser.add_argument("--cuts", default="", help="Standard cut string shared by all channels.")
+    parser.add_argument("--additional_cuts", nargs="+", default=[], help="Additional selection cuts.")
+    parser.add_argument("--weights", default="FinalWeighting", help="Event weight expression.")
+    parser.add_argument('--Channel', nargs="+", choices=["tt","et","mt","all","lt"], required=True)
+    parser.add_argument("--signals_only", action="store_true", help="Only skim the signal samples.")
+    parser.add_argument("--dataMC", action="store_true", help="Also skim the observed data.")
+    parser.add_argument("--skim_dir", default="skims", help="Output directory of the skims.")
+    parser.add_argument("--jobs", type=int, default=None, help="Parallel skim processes (default: all cores).")
+    args = parser.parse_args()
+
+    channels = list(dict.fromkeys(args.Channel))
+    cuts = norm.make_channel_cuts(channels, args.cuts, args.additional_cuts)
+    samples = dict(norm.signal_samples())
+    if not args.signals_only:
+        samples.update(norm.background_samples())
+        if args.dataMC:
+            samples.update(norm.data_samples())
+
+    failed = skim_campaign(samples, args.skim_dir, campaign_branches(args.variables, cuts, args.weights), cuts,
+                           args.cuts, channels, args.additional_cuts, max_workers=args.jobs)
+    if failed:
+        print(f"{len(failed)} files could not be skimmed")
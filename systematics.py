@@ -0,0 +1,105 @@
+"""Systematic variations filled in the same pass over each file as the nominal histograms (``--systematics``).
+
+A systematic renames branches in the variables and cuts (a shifted variable) or replaces the
+event weight:
+
+    jes:FatJet_pt_nom=FatJet_pt_jesUp,FatJet_pt_jesDown       shifted branch, up and down
+    corr:FatJet_pt_nom=FatJet_pt                               one-sided, mirrored for the down side
+    pileup:weight=xsWeight*puWeightUp,xsWeight*puWeightDown    alternative weights
+
+Specs with the same name are one systematic (jes:FatJet_pt_nom=... jes:Jet_pt_nom=...). Each
+variation ("jesUp", "jesDown", ...) gets one histogram per background file and plot, keyed
+(channel, variable, variation) next to the nominal (channel, variable) and filled by the same
+FillMultiple call. The variations only enter the background uncertainty band (band_errors).
+"""
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from expressions import substitute
+
+Variation = namedtuple("Variation", ["name", "shifts", "weight"])
+
+
+def _split_values(values):
+    ## Commas inside function calls, e.g. TMath::Max(a,b), are part of the expression
+    parts, depth, current = [], 0, ""
+    for char in values:
+        depth += {"(": 1, "[": 1, ")": -1, "]": -1}.get(char, 0)
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+    parts.append(current.strip())
+    return parts
+
+
+def parse_systematics(specs):
+    """[Variation] of the ``specs`` (see the module docstring), up before down."""
+    systematics = {}
+    for spec in specs:
+        name, _, rest = spec.partition(":")
+        target, _, values = rest.partition("=")
+        shifted = _split_values(values) if values else []
+        if not name or not target or not 1 <= len(shifted) <= 2 or not all(shifted):
+            raise ValueError(f"Cannot parse systematic {spec!r}, expected NAME:BRANCH=UP[,DOWN] or NAME:weight=UP[,DOWN]")
+        directions = systematics.setdefault(name, {})
+        for direction, value in zip(("Up", "Down"), shifted):
+            shifts, weight = directions.get(direction, ({}, None))
+            if target == "weight":
+                weight = value
+            else:
+                shifts = dict(shifts, **{target: value})
+            directions[direction] = (shifts, weight)
+    return [Variation(name + direction, shifts, weight)
+            for name, directions in systematics.items() for direction, (shifts, weight) in directions.items()]
+
+
+def variation_keys(plot_keys, variations):
+    return [(channel, variable, variation.name) for channel, variable in plot_keys for variation in variations]
+
+
+def variation_expressions(variations, cuts, weight, keys):
+    """{(channel, variable, variation): (variable expression, weighted selection)} of the variation keys in ``keys``."""
+    by_name = {variation.name: variation for variation in variations}
+    expressions = {}
+    for key in keys:
+        if len(key) < 3:
+            continue
+        channel, variable, name = key
+        variation = by_name[name]
+        event_weight = variation.weight or substitute(weight, variation.shifts)
+        selection = substitute(cuts[channel], variation.shifts)
+        expressions[key] = (substitute(variable, variation.shifts),
+                            f"{event_weight} * {selection}" if event_weight else selection)
+    return expressions
+
+
+def shifted_cuts(variations, cut):
+    """The unweighted ``cut`` as each variation applies it."""
+    return [substitute(cut, variation.shifts) for variation in variations]
+
+
+def band_errors(nominal, shifted):
+    """Per-bin (down, up) systematic errors of the ``nominal`` bin contents, NumPy arrays.
+
+    ``shifted`` maps variation names to the bin contents of the same total. Per systematic the
+    largest deviations above and below the nominal are taken, a one-sided systematic counts on
+    both sides; the systematics add in quadrature.
+    """
+    nominal = np.asarray(nominal, dtype=np.float64)
+    down, up = np.zeros_like(nominal), np.zeros_like(nominal)
+    by_systematic = {}
+    for name, values in shifted.items():
+        by_systematic.setdefault(re.sub(r"(Up|Down)$", "", name), []).append(values)
+    for values in by_systematic.values():
+        deltas = np.asarray(values, dtype=np.float64) - nominal
+        if len(deltas) == 1:
+            above = below = np.abs(deltas[0])
+        else:
+            above, below = np.maximum(deltas.max(axis=0), 0.0), np.maximum(-deltas.min(axis=0), 0.0)
+        up += above ** 2
+        down += below ** 2
+    return np.sqrt(down), np.sqrt(up)
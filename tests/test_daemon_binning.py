@@ -0,0 +1,51 @@
+"""plot_daemon.py runs norm.main once per request in the same process."""
+import json
+from array import array
+
+import pytest
+
+ROOT = pytest.importorskip("ROOT")
+
+import auto_binning
+import norm
+from variable_dictionaries import variableSettingDictionary
+
+VARIABLE = "PuppiMET_pt"
+
+
+def make_input(path):
+    f = ROOT.TFile(path, "RECREATE")
+    tree = ROOT.TTree("Events", "Events")
+    channel, met = array("i", [0]), array("f", [0.0])
+    tree.Branch("channel", channel, "channel/I")
+    tree.Branch(VARIABLE, met, f"{VARIABLE}/F")
+    for i in range(1000):
+        met[0] = 3.7 * i
+        tree.Fill()
+    tree.Write()
+    f.Close()
+
+
+def make_catalog(tmp_path):
+    source = str(tmp_path / "signal.root")
+    make_input(source)
+    sample = norm.SIGNAL_POINTS[0][0]
+    catalog = {"version": 1, "samples": {"background": {}, "signal": {sample: [source]}, "data": {}},
+               "files": {source: {"size": 0, "mtime_ns": None, "entries": 1000, "sum_weights": None, "sha256": None}}}
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(catalog))
+    return str(path)
+
+
+def test_auto_binning_does_not_leak_into_the_next_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    command = ["--year", "2024", "--variables", VARIABLE, "--Channel", "tt", "--weights", "1",
+               "--signals_only", "--catalog", make_catalog(tmp_path), "--read_ahead", "0"]
+
+    norm.main(command + ["--auto_binning", "all", "--auto_bins", "7"])
+    assert len(auto_binning.edges(VARIABLE)) == 8
+
+    norm.main(command)
+    assert auto_binning.edges(VARIABLE) is None
+    assert not auto_binning.is_fine(VARIABLE)
+    assert norm.get_binning(VARIABLE) == tuple(float(x) for x in variableSettingDictionary[VARIABLE].split(","))
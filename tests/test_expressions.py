@@ -0,0 +1,19 @@
+from expressions import conjunction_terms, implies
+
+
+def test_conjunction_terms_ignore_spacing_and_parentheses():
+    assert conjunction_terms("(nJet>2) && (lep_pt > 20)") == conjunction_terms("lep_pt>20&&nJet>2")
+    assert conjunction_terms("") == set()
+
+
+def test_tighter_cut_implies_the_skim_cut():
+    assert implies("(nJet>2) && (lep_pt>20)", "nJet>2")
+    assert implies("nJet > 2", "(nJet>2)")
+    assert implies("nJet>2", "")
+
+
+def test_cut_containing_the_skim_cut_as_text_does_not_imply_it():
+    assert not implies("(nJet>2) || (lep_pt>20)", "nJet>2")
+    assert not implies("!(nJet>2)", "nJet>2")
+    assert not implies("nJet>20", "nJet>2")
+    assert not implies("", "nJet>2")
@@ -0,0 +1,75 @@
+import ctypes
+
+import numpy as np
+import pytest
+
+ROOT = pytest.importorskip("ROOT")
+
+import histogram
+
+
+def filled(name, values, weights, bins=(6, 0.0, 6.0)):
+    h = ROOT.TH1D(name, name, *bins)
+    h.SetDirectory(0)
+    h.Sumw2()
+    for x, w in zip(values, weights):
+        h.Fill(x, w)
+    return h
+
+
+def contents(h):
+    n = h.GetNbinsX()
+    return (np.array([h.GetBinContent(i) for i in range(n + 2)]),
+            np.array([h.GetBinError(i) for i in range(n + 2)]))
+
+
+def test_round_trip():
+    h = filled("h", [-1, 0.5, 0.5, 2.5, 5.5, 9], [1.0, 2.0, 0.5, 3.0, 1.5, 4.0])
+    hist = histogram.from_th1(h)
+    back = histogram.to_th1(hist, "back")
+    for a, b in zip(contents(h), contents(back)):
+        assert np.array_equal(a, b)
+    assert np.array_equal(hist.edges, np.linspace(0, 6, 7))
+
+    ## from_th1 shares the arrays of the TH1
+    h.SetBinContent(3, 42.0)
+    assert hist.values[3] == 42.0
+
+    target = ROOT.TH1F("target", "target", 6, 0.0, 6.0)
+    target.SetDirectory(0)
+    histogram.write_th1(histogram.from_th1(back), target)
+    assert np.allclose(contents(target)[0], contents(back)[0])
+    with pytest.raises(ValueError):
+        histogram.write_th1(hist, ROOT.TH1F("other", "other", 3, 0.0, 6.0))
+
+
+def test_summarize_matches_root():
+    groups = {
+        "TTbar": filled("tt", [0.5, 1.5, 1.5, 3.5], [1.0, 2.0, 2.0, 0.5]),
+        "QCD": filled("qcd", [1.5, 2.5, 4.5, 7], [0.5, 1.0, 3.0, 2.0]),
+        "Other": filled("other", [2.5, 2.5, 2.5], [3.0, 3.0, 3.0]),
+    }
+    data = filled("data", [0.5, 1.5, 1.5, 2.5, 4.5, 4.5, 5.5], [1.0] * 7)
+    summary = histogram.summarize({("tt", "x"): (groups, data, {})}, ["TTbar", "QCD"])[("tt", "x")]
+
+    total = groups["TTbar"].Clone("total")
+    total.Add(groups["QCD"])
+    values, errors = contents(total)
+    assert np.allclose(summary.total.values, values)
+    ## Without variations the band is the statistical error of the total
+    assert np.allclose(summary.band_down, errors) and np.allclose(summary.band_up, errors)
+
+    error = ctypes.c_double(0.0)
+    integral = total.IntegralAndError(0, total.GetNbinsX() + 1, error)
+    assert summary.integral == pytest.approx((integral, error.value))
+    error = ctypes.c_double(0.0)
+    assert summary.data_integral == pytest.approx((data.IntegralAndError(0, data.GetNbinsX() + 1, error), error.value))
+
+    ratio = data.Clone("ratio")
+    ratio.Divide(total)
+    values, errors = contents(ratio)
+    assert np.allclose(summary.ratio.values, values)
+    assert np.allclose(np.sqrt(summary.ratio.sumw2), errors)
+
+    ## The unstacked groups count for the maximum
+    assert summary.maximum == max(h.GetMaximum() for h in groups.values()) == 9.0
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("ROOT")
+
+import readahead
+
+
+def test_files_opened_ahead_are_released_when_the_consumer_stops(monkeypatch):
+    opened, released = [], []
+
+    def open_events(path, exprs=()):
+        opened.append(path)
+        return (f"file {path}", f"tree {path}")
+
+    monkeypatch.setattr(readahead, "open_events", open_events)
+    monkeypatch.setattr(readahead, "release", lambda path, root_file, tree: released.append(path))
+
+    files = readahead.read_ahead([f"{i}.root" for i in range(10)], depth=3)
+    assert next(files)[0] == "0.root"
+    files.close()
+    ## The consumer owns 0.root, the others opened ahead are given back
+    assert sorted(released) == sorted(set(opened) - {"0.root"})
+    assert len(opened) <= 4
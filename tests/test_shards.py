@@ -0,0 +1,88 @@
+"""Merging the --shard partial results gives the same histograms whatever the shards and their order."""
+import json
+import random
+from array import array
+
+import numpy as np
+import pytest
+
+ROOT = pytest.importorskip("ROOT")
+
+import histogram
+import norm
+from hist_store import read_samples
+
+VARIABLE = "PuppiMET_pt"
+SAMPLES = {
+    "background": {"TTto2L2Nu_TuneCP5_13p6TeV_powheg-pythia8": 3, "WWto2L2Nu_TuneCP5_13p6TeV_powheg-pythia8": 2},
+    "signal": {norm.SIGNAL_POINTS[0][0]: 2},
+    "data": {"JetMET0_Run2024C_v1": 2},
+}
+
+
+def make_input(path, seed):
+    rng = random.Random(seed)
+    f = ROOT.TFile(path, "RECREATE")
+    tree = ROOT.TTree("Events", "Events")
+    channel, met, weight = array("i", [0]), array("f", [0.0]), array("f", [0.0])
+    tree.Branch("channel", channel, "channel/I")
+    tree.Branch(VARIABLE, met, f"{VARIABLE}/F")
+    tree.Branch("w", weight, "w/F")
+    for _ in range(500):
+        channel[0] = rng.randrange(3)
+        met[0] = rng.uniform(0, 1200)
+        weight[0] = rng.uniform(0.1, 3.0)
+        tree.Fill()
+    tree.Write()
+    f.Close()
+
+
+@pytest.fixture
+def campaign(tmp_path):
+    samples, files, seed = {}, {}, 0
+    for kind, counts in SAMPLES.items():
+        samples[kind] = {}
+        for sample, count in counts.items():
+            for i in range(count):
+                seed += 1
+                path = str(tmp_path / f"{kind}_{seed}.root")
+                make_input(path, seed)
+                samples[kind].setdefault(sample, []).append(path)
+                files[path] = {"size": 0, "mtime_ns": None, "entries": 500, "sum_weights": None, "sha256": None}
+    catalog = tmp_path / "catalog.json"
+    catalog.write_text(json.dumps({"version": 1, "samples": samples, "files": files}))
+    return ["--year", "2024", "--variables", VARIABLE, "--Channel", "tt", "et", "--weights", "w", "--dataMC",
+            "--catalog", str(catalog), "--read_ahead", "0", "--jobs", "1"]
+
+
+def merged_arrays(tmp_path, command, count, seed):
+    partials = [str(tmp_path / f"shard_{count}_{i}.root") for i in range(count)]
+    for i, partial in enumerate(partials):
+        norm.main(command + ["--shard", f"{i}/{count}", "--partial", partial])
+    random.Random(seed).shuffle(partials)
+    store = str(tmp_path / f"store_{count}.root")
+    norm.main(command[:2] + ["--dataMC", "--merge_from"] + partials + ["--store", store])
+    hists, _, _ = read_samples(store)
+    return {(key, kind, sample): (np.array(histogram.from_th1(h).values), np.array(histogram.from_th1(h).sumw2))
+            for key, kinds in hists.items() for kind, by_sample in kinds.items() for sample, h in by_sample.items()}
+
+
+def test_merge_is_bit_identical_for_any_shards_and_order(tmp_path, monkeypatch, campaign):
+    monkeypatch.chdir(tmp_path)
+    reference = merged_arrays(tmp_path, campaign, 1, 0)
+    assert {kind for _, kind, _ in reference} == {"background", "signal", "data"}
+    for count, seed in [(2, 1), (3, 2)]:
+        merged = merged_arrays(tmp_path, campaign, count, seed)
+        assert merged.keys() == reference.keys()
+        for name, (values, sumw2) in reference.items():
+            assert np.array_equal(merged[name][0], values), name
+            assert np.array_equal(merged[name][1], sumw2), name
+
+
+def test_merge_refuses_missing_files(tmp_path, monkeypatch, campaign):
+    monkeypatch.chdir(tmp_path)
+    partial = str(tmp_path / "shard_0.root")
+    norm.main(campaign + ["--shard", "0/2", "--partial", partial])
+    with pytest.raises(SystemExit):
+        norm.main(campaign[:2] + ["--dataMC", "--merge_from", partial])
+    norm.main(campaign[:2] + ["--dataMC", "--merge_from", partial, "--allow_missing"])
@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("ROOT")
+
+from hist_cache import file_state
+from skim import skim_is_valid
+
+
+@pytest.fixture
+def entry(tmp_path):
+    source, skimmed = tmp_path / "source.root", tmp_path / "skim.root"
+    source.write_bytes(b"events")
+    skimmed.write_bytes(b"skim")
+    return {"skim": str(skimmed), "source_state": list(file_state(str(source))[1:]), "requested_branches": ["nJet"],
+            "channels": ["tt"], "base_cut": "nJet>2", "additional_cuts": []}, str(source)
+
+
+@pytest.mark.parametrize("base_cut, valid", [
+    ("nJet>2", True),
+    ("(nJet > 2) && (lep_pt>20)", True),
+    ("(nJet>2) || (lep_pt>20)", False),
+    ("!(nJet>2)", False),
+    ("nJet>20", False),
+])
+def test_skim_cut_must_be_implied(entry, base_cut, valid):
+    entry, source = entry
+    assert skim_is_valid(entry, source, ["nJet"], base_cut, ["tt"], []) is valid
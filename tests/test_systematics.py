@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from systematics import Variation, band_errors, parse_systematics, variation_expressions
+
+
+def test_single_value_is_mirrored():
+    assert parse_systematics(["corr:FatJet_pt_nom=FatJet_pt"]) == [Variation("corrUp", {"FatJet_pt_nom": "FatJet_pt"}, None)]
+    down, up = band_errors([10.0, 20.0], {"corrUp": np.array([12.0, 19.0])})
+    assert np.array_equal(down, [2.0, 1.0]) and np.array_equal(up, [2.0, 1.0])
+
+
+def test_asymmetric_up_down_pair():
+    variations = parse_systematics(["jes:FatJet_pt_nom=FatJet_pt_jesUp,FatJet_pt_jesDown",
+                                    "jes:Jet_pt_nom=Jet_pt_jesUp,Jet_pt_jesDown"])
+    assert variations == [
+        Variation("jesUp", {"FatJet_pt_nom": "FatJet_pt_jesUp", "Jet_pt_nom": "Jet_pt_jesUp"}, None),
+        Variation("jesDown", {"FatJet_pt_nom": "FatJet_pt_jesDown", "Jet_pt_nom": "Jet_pt_jesDown"}, None),
+    ]
+    ## Largest deviation above and below the nominal in each bin, whichever variation it comes from
+    down, up = band_errors([10.0, 10.0], {"jesUp": np.array([13.0, 9.0]), "jesDown": np.array([8.0, 10.5])})
+    assert np.array_equal(up, [3.0, 0.5]) and np.array_equal(down, [2.0, 1.0])
+
+
+def test_weight_variation_next_to_branch_shift():
+    variations = parse_systematics(["jes:Jet_pt=Jet_pt_up,Jet_pt_down", "pileup:weight=w*puUp,w*puDown"])
+    assert [variation.name for variation in variations] == ["jesUp", "jesDown", "pileupUp", "pileupDown"]
+    keys = [("tt", "Jet_pt", variation.name) for variation in variations]
+    expressions = variation_expressions(variations, {"tt": "(Jet_pt>30)"}, "w", keys)
+    assert expressions[("tt", "Jet_pt", "jesUp")] == ("Jet_pt_up", "w * (Jet_pt_up>30)")
+    assert expressions[("tt", "Jet_pt", "pileupDown")] == ("Jet_pt", "w*puDown * (Jet_pt>30)")
+
+    ## The systematics add in quadrature
+    down, up = band_errors([10.0], {"jesUp": np.array([13.0]), "jesDown": np.array([10.0]),
+                                    "pileupUp": np.array([14.0]), "pileupDown": np.array([10.0])})
+    assert np.allclose(up, [5.0]) and np.allclose(down, [0.0])
+
+
+@pytest.mark.parametrize("spec", ["jes", "jes:Jet_pt", "jes:Jet_pt=a,b,c", ":weight=w", "jes:Jet_pt=a,"])
+def test_malformed_specs(spec):
+    with pytest.raises(ValueError):
+        parse_systematics([spec])
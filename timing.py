@@ -0,0 +1,94 @@
+"""Per-file and per-stage timings of a run (``--timing_report``).
+
+norm.py records, for every input file, the open time, bytes read, entries scanned, entries
+selected and fill time, and the time spent in each stage (filling, grouping, stacking, SaveAs).
+Records are kept per process; the read-ahead threads record their opens too. report() gives
+them as one JSON-ready dict, and aggregate() merges the reports of the tasks of a campaign.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_files = {}
+_stages = {}
+
+
+def reset():
+    with _lock:
+        _files.clear()
+        _stages.clear()
+
+
+def record_file(path, sample=None, **metrics):
+    """Add ``metrics`` (seconds, bytes or entries) to the record of ``path``."""
+    with _lock:
+        record = _files.setdefault(path, {"sample": sample})
+        if sample is not None:
+            record["sample"] = sample
+        for name, value in metrics.items():
+            record[name] = record.get(name, 0) + value
+
+
+def record_stage(name, seconds):
+    with _lock:
+        stage = _stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        stage["seconds"] += seconds
+        stage["calls"] += 1
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def report(**extra):
+    with _lock:
+        return dict(extra, stages={k: dict(v) for k, v in _stages.items()},
+                    files={k: dict(v) for k, v in _files.items()})
+
+
+def write_report(path, **extra):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report(**extra), f, indent=1, sort_keys=True)
+
+
+def aggregate(reports):
+    """Merge per-task reports: stages and files summed, plus per-sample totals."""
+    stages, files, samples = {}, {}, {}
+    for rep in reports:
+        for name, values in rep.get("stages", {}).items():
+            total = stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            total["seconds"] += values["seconds"]
+            total["calls"] += values["calls"]
+        for path, record in rep.get("files", {}).items():
+            merged = files.setdefault(path, {"sample": record.get("sample")})
+            per_sample = samples.setdefault(record.get("sample") or "unknown", {})
+            for name, value in record.items():
+                if name == "sample":
+                    continue
+                merged[name] = merged.get(name, 0) + value
+                per_sample[name] = per_sample.get(name, 0) + value
+    return {"stages": stages, "files": files, "samples": samples}
+
+
+def summary(aggregated, top=10):
+    """Readable table of the stages and the ``top`` samples by fill time."""
+    lines = ["Stage                         seconds   calls"]
+    for name, values in sorted(aggregated["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        lines.append(f"{name:28} {values['seconds']:9.2f} {values['calls']:7d}")
+    lines.append("")
+    lines.append("Sample                                                     open [s]  fill [s]   MB read    entries")
+    by_fill = sorted(aggregated["samples"].items(), key=lambda item: -item[1].get("fill_time", 0))
+    for name, values in by_fill[:top]:
+        lines.append(f"{name[:56]:56} {values.get('open_time', 0):9.2f} {values.get('fill_time', 0):9.2f} "
+                     f"{values.get('bytes_read', 0) / 1024**2:9.1f} {values.get('entries', 0):10d}")
+    return "\n".join(lines)
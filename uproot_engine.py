@@ -0,0 +1,226 @@
+"""uproot + NumPy filling engine (``--engine uproot``).
+
+Only the branches referenced by the variables and selections are read, in chunks of entries that
+are processed by a thread pool (uproot decompression and the NumPy/awkward kernels release the
+GIL). The TTree::Draw expressions are parsed by expressions.parse and evaluated as array
+operations with the same instance semantics as Draw, and the histograms are filled with
+np.bincount into ROOT-style bins, with underflow in bin 0 and overflow in bin nbins+1.
+
+Nothing here imports ROOT, so the engine also runs on worker nodes without a ROOT install:
+
+    python3 uproot_engine.py --files a.root b.root --variables PuppiMET_pt \
+        --selection tt="xsWeight * ((channel==0))" --threads 8 --output hists.npz
+"""
+import argparse
+import concurrent.futures
+import time
+
+import awkward as ak
+import numpy as np
+import uproot
+
+import timing
+from expressions import names_in, parse
+
+_FUNCTIONS = {
+    "abs": np.abs, "fabs": np.abs, "TMath::Abs": np.abs,
+    "sqrt": np.sqrt, "TMath::Sqrt": np.sqrt,
+    "exp": np.exp, "TMath::Exp": np.exp,
+    "log": np.log, "TMath::Log": np.log,
+    "log10": np.log10, "TMath::Log10": np.log10,
+    "sin": np.sin, "cos": np.cos, "tan": np.tan,
+    "atan2": np.arctan2, "TMath::ATan2": np.arctan2,
+    "pow": np.power, "TMath::Power": np.power,
+    "min": np.minimum, "TMath::Min": np.minimum,
+    "max": np.maximum, "TMath::Max": np.maximum,
+    "TMath::Pi": lambda: np.pi,
+}
+
+_BINARY = {
+    "+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide, "%": np.fmod,
+    "==": np.equal, "!=": np.not_equal, "<": np.less, "<=": np.less_equal,
+    ">": np.greater, ">=": np.greater_equal,
+    "&&": np.logical_and, "||": np.logical_or,
+}
+
+_UNARY = {"-": np.negative, "+": np.positive, "!": np.logical_not}
+
+
+def _take(values, index):
+    """``values[index]`` as TTreeFormula does it: one entry per in-range index, the others dropped."""
+    if np.isscalar(index):
+        return values[ak.local_index(values) == int(index)]
+    index = ak.values_astype(index, np.int64)
+    if index.ndim == 1:
+        index = ak.unflatten(index, 1)
+    valid = (index >= 0) & (index < ak.num(values, axis=1))
+    return values[index[valid]]
+
+
+def evaluate(node, arrays):
+    """Evaluate a parsed expression on a chunk of branch arrays ({name: awkward array})."""
+    kind = node[0]
+    if kind == "num":
+        return node[1]
+    if kind == "name":
+        return arrays[node[1]]
+    if kind == "index":
+        return _take(evaluate(node[1], arrays), evaluate(node[2], arrays))
+    if kind == "call":
+        if node[1] not in _FUNCTIONS:
+            raise ValueError(f"Function {node[1]} is not supported by the uproot engine")
+        return _FUNCTIONS[node[1]](*(evaluate(arg, arrays) for arg in node[2]))
+    if kind == "unop":
+        return _UNARY[node[1]](evaluate(node[2], arrays))
+    return _BINARY[node[1]](evaluate(node[2], arrays), evaluate(node[3], arrays))
+
+
+def _flat_pairs(values, weights, nevents):
+    """Broadcast values against weights (Draw fills one entry per instance) and drop zero weights."""
+    if np.isscalar(values):
+        values = np.full(nevents, values, dtype=np.float64)
+    if np.isscalar(weights):
+        weights = np.full(nevents, weights, dtype=np.float64)
+    values, weights = ak.broadcast_arrays(values, weights)
+    values = ak.to_numpy(ak.flatten(values, axis=None)).astype(np.float64)
+    weights = ak.to_numpy(ak.flatten(weights, axis=None)).astype(np.float64)
+    keep = weights != 0
+    return values[keep], weights[keep]
+
+
+def histogram(values, weights, binning):
+    """(sumw, sumw2, entries) with ROOT bin numbering, bin 0 underflow and bin nbins+1 overflow."""
+    nbins, low, high = binning
+    edges = np.linspace(low, high, nbins + 1)
+    idx = np.searchsorted(edges, values, side="right")
+    sumw = np.bincount(idx, weights=weights, minlength=nbins + 2)
+    sumw2 = np.bincount(idx, weights=weights * weights, minlength=nbins + 2)
+    return sumw, sumw2, len(values)
+
+
+def _fill_chunk(tree, branches, entry_start, entry_stop, parsed, filled, binnings):
+    chunk = tree.arrays(filter_name=branches, entry_start=entry_start, entry_stop=entry_stop)
+    arrays = {name: chunk[name] for name in branches}
+    nevents = entry_stop - entry_start
+    values = {text: evaluate(node, arrays) for text, node in parsed.items()}
+    partial = {}
+    for key, (variable, selection) in filled.items():
+        x, w = _flat_pairs(values[variable], values[selection], nevents)
+        partial[key] = histogram(x, w, binnings[key[1]])
+    selections = {selection for _, selection in filled.values()}
+    return partial, _selected([values[selection] for selection in selections], nevents)
+
+
+def _selected(weights, nevents):
+    """Number of events with a non-zero weight in any selection."""
+    passed = np.zeros(nevents, dtype=bool)
+    for w in weights:
+        if np.isscalar(w):
+            passed |= w != 0
+            continue
+        nonzero = w != 0
+        if nonzero.ndim > 1:
+            nonzero = ak.any(nonzero, axis=1)
+        passed |= ak.to_numpy(nonzero)
+    return int(passed.sum())
+
+
+def fill_file(path, variables, selections, binnings, keys=None, threads=1, step_size="50 MB", sample=None,
+              expressions=None):
+    """Fill every (channel, variable) histogram of one file.
+
+    ``selections`` maps a channel to its full (weighted) selection, as for the draw engine, and
+    ``expressions`` the systematic variation keys to their (variable, selection).
+    Returns {key: (sumw, sumw2, entries)}, or None if the file cannot be read.
+    """
+    if keys is None:
+        keys = [(channel, variable) for channel in selections for variable in variables]
+    filled = {key: (expressions or {}).get(key) or (key[1], selections[key[0]]) for key in keys}
+    parsed = {text: parse(text) for pair in filled.values() for text in pair}
+    needed = set().union(*(names_in(node) for node in parsed.values()))
+
+    start = time.time()
+    ## Chunks wait on their own basket decompression, so they cannot share a pool with it
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(threads, 1))
+    decompression = concurrent.futures.ThreadPoolExecutor(max_workers=max(threads, 1))
+    try:
+        with uproot.open(path, decompression_executor=decompression, interpretation_executor=decompression) as root_file:
+            if "Events" not in root_file:
+                print(f"No Events tree in {path}")
+                return None
+            tree = root_file["Events"]
+            missing = needed - set(tree.keys())
+            if missing:
+                print(f"Branches {sorted(missing)} not found in {path}")
+                return None
+            branches = sorted(needed)
+            nentries = tree.num_entries
+            step = max(1, int(tree.num_entries_for(step_size, filter_name=branches))) if branches else max(nentries, 1)
+            ranges = [(a, min(a + step, nentries)) for a in range(0, nentries, step)]
+
+            bytes_read = sum(tree[name].compressed_bytes for name in branches)
+            opened = time.time()
+
+            selected = 0
+            totals = {key: (np.zeros(binnings[key[1]][0] + 2), np.zeros(binnings[key[1]][0] + 2), 0) for key in keys}
+            futures = [
+                executor.submit(_fill_chunk, tree, branches, a, b, parsed, filled, binnings)
+                for a, b in ranges
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                partial, passed = future.result()
+                selected += passed
+                for key, (sumw, sumw2, entries) in partial.items():
+                    total = totals[key]
+                    totals[key] = (total[0] + sumw, total[1] + sumw2, total[2] + entries)
+    except OSError as error:
+        print(f"Could not open {path}: {error}")
+        return None
+    finally:
+        executor.shutdown()
+        decompression.shutdown()
+
+    elapsed = time.time() - start
+    timing.record_file(path, sample, open_time=opened - start, fill_time=time.time() - opened,
+                       entries=nentries, selected=selected, bytes_read=bytes_read)
+    print(f"{path}: {nentries} events in {elapsed:.2f} s ({nentries / max(elapsed, 1e-9):.0f} events/s)")
+    return totals
+
+
+if __name__ == "__main__":
+    from variable_dictionaries import variableSettingDictionary
+
+    parser = argparse.ArgumentParser(description="Fill histograms with uproot and NumPy, without ROOT.")
+    parser.add_argument("--files", nargs="+", required=True, help="Input files with an Events tree.")
+    parser.add_argument("--variables", nargs="+", required=True, help="Variables to fill.")
+    parser.add_argument("--selection", nargs="+", default=["all=1"],
+                        help="NAME=EXPRESSION pairs, the expression includes the weight, e.g. tt=\"xsWeight * ((channel==0))\".")
+    parser.add_argument("--threads", type=int, default=1, help="Threads used for reading and filling the chunks.")
+    parser.add_argument("--step_size", default="50 MB", help="Chunk size passed to uproot.")
+    parser.add_argument("--output", default="hists.npz", help="Output .npz with sumw/sumw2/entries per histogram.")
+    args = parser.parse_args()
+
+    selections = dict(item.split("=", 1) for item in args.selection)
+    binnings = {}
+    for variable in args.variables:
+        nbins, low, high = map(float, variableSettingDictionary.get(variable, "21,0,1000").split(","))
+        binnings[variable] = (int(nbins), low, high)
+
+    results = {}
+    start = time.time()
+    for path in args.files:
+        filled = fill_file(path, args.variables, selections, binnings, threads=args.threads, step_size=args.step_size)
+        for key, (sumw, sumw2, entries) in (filled or {}).items():
+            if key in results:
+                total = results[key]
+                results[key] = (total[0] + sumw, total[1] + sumw2, total[2] + entries)
+            else:
+                results[key] = (sumw, sumw2, entries)
+    print(f"Execution time: {time.time() - start:.2f} seconds")
+
+    out = {}
+    for (channel, variable), (sumw, sumw2, entries) in results.items():
+        out[f"{channel}|{variable}|sumw"] = sumw
+        out[f"{channel}|{variable}|sumw2"] = sumw2
+        out[f"{channel}|{variable}|entries"] = np.array(entries)
+    np.savez(args.output, **out)